@@ -1,60 +1,75 @@
 import asyncio
+import functools
 import logging
+import logging.handlers
+import queue
+import sys
 import uvloop
 from aiogram import Bot, Dispatcher
 from aiogram.enums import ParseMode
 from aiogram.client.default import DefaultBotProperties
 from aiogram.client.session.aiohttp import AiohttpSession
 from aiogram.fsm.storage.memory import MemoryStorage
-from aiohttp import ClientTimeout
-from aiohttp_socks import ProxyConnector
 
 from config import Config
 from database.database import init_db
-from middlewares.rate_limit import RateLimitMiddleware
-from middlewares.user_check import UserCheckMiddleware
-from utils.backup import backup_manager
-from utils.periodic_updater import periodic_updater
-from utils.timer import auction_timer_manager
+from middlewares.combined import CombinedMiddleware
+from utils.redis_client import get_redis, close_redis
 
-try:
-    from utils.channel_updater import get_channel_updater
-    CHANNEL_UPDATER_AVAILABLE = True
-except ImportError:
-    CHANNEL_UPDATER_AVAILABLE = False
-    logging.warning("ChannelUpdater не найден. Обновление сообщений в канале недоступно.")
-
-asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+# Запись логов выполняется в отдельном потоке, чтобы не блокировать event loop
+log_queue = queue.SimpleQueue()
+log_formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+# Ротация: до 5 файлов по 10 МБ вместо бесконечно растущего bot.log
+file_handler = logging.handlers.RotatingFileHandler('bot.log', maxBytes=10 << 20, backupCount=5, encoding='utf-8')
+file_handler.setFormatter(log_formatter)
+stream_handler = logging.StreamHandler()
+stream_handler.setFormatter(log_formatter)
+log_listener = logging.handlers.QueueListener(
+    log_queue, file_handler, stream_handler, respect_handler_level=True
+)
 
 logging.basicConfig(
     level=logging.INFO,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    handlers=[
-        logging.FileHandler('bot.log'),
-        logging.StreamHandler()
-    ]
+    handlers=[logging.handlers.QueueHandler(log_queue)]
 )
 
 logger = logging.getLogger(__name__)
 
+# Время жизни состояния и данных FSM в Redis (секунды)
+FSM_TTL = 3600
+
+@functools.lru_cache(maxsize=None)
+def _channel_updater_factory():
+    """Ленивый импорт get_channel_updater (None, если модуль недоступен)"""
+    try:
+        from utils.channel_updater import get_channel_updater
+    except ImportError:
+        logger.warning("ChannelUpdater не найден. Обновление сообщений в канале недоступно.")
+        return None
+    return get_channel_updater
+
 async def create_backup_on_startup():
+    from utils.backup import backup_manager
     logger.info("Создание резервной копии базы данных...")
     await backup_manager.create_backup()
     logger.info("Резервная копия создана")
 
 async def schedule_backups():
+    from utils.backup import backup_manager
     await backup_manager.schedule_backups(interval_hours=24)
 
 async def check_expired_auctions_on_startup():
+    from utils.timer import auction_timer_manager
     logger.info("Проверка просроченных аукционов...")
     expired_count = await auction_timer_manager.check_and_complete_expired_auctions()
     if expired_count > 0:
-        logger.info(f"Завершено {expired_count} просроченных аукционов при запуске")
+        logger.info("Завершено %s просроченных аукционов при запуске", expired_count)
     else:
         logger.info("Просроченных аукционов не найдено")
 
 async def fix_all_channel_messages_on_startup(bot):
-    if not CHANNEL_UPDATER_AVAILABLE:
+    get_channel_updater = _channel_updater_factory()
+    if get_channel_updater is None:
         logger.warning("ChannelUpdater недоступен, пропускаю обновление сообщений в канале")
         return
     
@@ -67,21 +82,18 @@ async def fix_all_channel_messages_on_startup(bot):
         else:
             logger.error("❌ Не удалось создать ChannelUpdater")
     except Exception as e:
-        logger.error(f"❌ Ошибка при проверке сообщений в канале: {e}")
+        logger.error("❌ Ошибка при проверке сообщений в канале: %s", e)
 
 async def create_bot():
     """Создание бота с поддержкой прокси через aiohttp"""
     if Config.PROXY_URL:
-        logger.info(f"Используется прокси: {Config.PROXY_URL.split('@')[-1] if '@' in Config.PROXY_URL else Config.PROXY_URL}")
+        logger.info("Используется прокси: %s", Config.PROXY_URL.split('@')[-1] if '@' in Config.PROXY_URL else Config.PROXY_URL)
         try:
-            from aiohttp import ClientSession, ClientTimeout
-            from aiohttp_socks import ProxyConnector
-
-            # Создаём коннектор с явными параметрами
-            connector = ProxyConnector.from_url(Config.PROXY_URL)
-            # Увеличиваем таймауты
-            timeout = ClientTimeout(total=120, connect=60, sock_read=60, sock_connect=60)
-            session = ClientSession(connector=connector, timeout=timeout)
+            # Сессия aiogram (а не голая aiohttp.ClientSession, которую Bot
+            # вызвать не может): один пул соединений с keep-alive на все
+            # запросы бота, прокси подключается через aiohttp_socks.
+            # Увеличенный таймаут запроса для медленного прокси
+            session = AiohttpSession(proxy=Config.PROXY_URL, timeout=120)
 
             bot = Bot(
                 token=Config.BOT_TOKEN,
@@ -90,15 +102,15 @@ async def create_bot():
             )
             # Проверяем соединение
             me = await bot.get_me()
-            logger.info(f"✅ Бот настроен через прокси, @{me.username}")
+            logger.info("✅ Бот настроен через прокси, @%s", me.username)
             return bot
         except Exception as e:
-            logger.error(f"❌ Ошибка настройки прокси: {e}, пробую без прокси")
+            logger.error("❌ Ошибка настройки прокси: %s, пробую без прокси", e)
             # При ошибке закрываем сессию, если она была создана
             if 'session' in locals():
                 await session.close()
 
-    # Без прокси
+    # Без прокси: Bot сам создает AiohttpSession и один пул соединений с keep-alive на все запросы
     bot = Bot(
         token=Config.BOT_TOKEN,
         default=DefaultBotProperties(parse_mode=ParseMode.HTML)
@@ -107,6 +119,14 @@ async def create_bot():
     return bot
 
 async def main():
+    log_listener.start()
+    
+    # Тяжелые модули импортируются уже внутри работающего event loop
+    from utils.backup import backup_manager
+    from utils.periodic_updater import periodic_updater
+    from utils.timer import auction_timer_manager
+    from utils.notifications import flush_notifications
+    
     await init_db()
     logger.info("База данных инициализирована")
     
@@ -114,26 +134,36 @@ async def main():
     
     bot = await create_bot()
     
-    await check_expired_auctions_on_startup()
-    await fix_all_channel_messages_on_startup(bot)
-    
     periodic_updater.set_bot(bot)
     auction_timer_manager.set_bot(bot)
-    asyncio.create_task(auction_timer_manager.periodic_check())
+    auction_timer_manager.start()
     
-    if CHANNEL_UPDATER_AVAILABLE:
+    # Проверки при запуске независимы друг от друга и выполняются параллельно.
+    # Завершение просроченных аукционов идет через auction_timer_manager.end_auction,
+    # поэтому один аукцион не будет завершен дважды
+    await asyncio.gather(
+        check_expired_auctions_on_startup(),
+        fix_all_channel_messages_on_startup(bot),
+        auction_timer_manager.restore_timers_improved(),
+    )
+    logger.info("Планировщик таймеров запущен")
+    
+    get_channel_updater = _channel_updater_factory()
+    if get_channel_updater is not None:
         get_channel_updater(bot)
     
-    storage = MemoryStorage()
+    redis = get_redis()
+    if redis is not None:
+        from aiogram.fsm.storage.redis import RedisStorage
+        # Незавершенные сценарии (создание аукциона) не копятся в Redis вечно
+        storage = RedisStorage(redis=redis, state_ttl=FSM_TTL, data_ttl=FSM_TTL)
+        logger.info("FSM хранится в Redis")
+    else:
+        storage = MemoryStorage()
     dp = Dispatcher(storage=storage)
     
-    rate_limit_middleware = RateLimitMiddleware(rate_limit_period=1)
-    user_check_middleware = UserCheckMiddleware()
-    
-    dp.callback_query.middleware(rate_limit_middleware)
-    dp.message.middleware(rate_limit_middleware)
-    dp.callback_query.middleware(user_check_middleware)
-    dp.message.middleware(user_check_middleware)
+    # Один middleware на уровне update вместо четырех на message/callback_query
+    dp.update.middleware(CombinedMiddleware(rate_limit_period=1))
     
     from handlers.user import router as user_router
     from handlers.admin import router as admin_router
@@ -143,9 +173,6 @@ async def main():
     dp.include_router(admin_router)
     dp.include_router(auction_router)
     
-    await auction_timer_manager.restore_timers_improved()
-    logger.info("Планировщик таймеров запущен")
-    
     asyncio.create_task(schedule_backups())
     await periodic_updater.start()
     logger.info("Периодическое обновление таймеров запущено")
@@ -160,7 +187,16 @@ async def main():
         await backup_manager.create_backup()
         await periodic_updater.stop()
         await auction_timer_manager.stop_all_timers()
+        await flush_notifications()
         await bot.session.close()
+        await close_redis()
+        log_listener.stop()
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    if sys.version_info >= (3, 11):
+        # uvloop.install() устарел начиная с Python 3.12
+        with asyncio.Runner(loop_factory=uvloop.new_event_loop) as runner:
+            runner.run(main())
+    else:
+        uvloop.install()
+        asyncio.run(main())
@@ -1,46 +1,72 @@
 # config.py - с поддержкой SOCKS5 прокси
 import os
 import re
+from dataclasses import dataclass, field
+from datetime import timedelta
+from typing import FrozenSet, Optional, Union
 from dotenv import load_dotenv
 
 load_dotenv()
 
-class Config:
-    BOT_TOKEN = os.getenv("BOT_TOKEN", "")
-    
+_NUMERIC_ID_RE = re.compile(r"^-?\d+$")
+_CHANNEL_ID_RE = re.compile(r"-?\d+")
+
+def _parse_channel_id(value: str) -> Optional[Union[int, str]]:
+    """Разбор CHANNEL_ID: числовой ID, @username или строка с ID внутри"""
+    if not value:
+        return None
+    if _NUMERIC_ID_RE.match(value):
+        return int(value)
+    if value.startswith('@'):
+        return value
+    match = _CHANNEL_ID_RE.search(value)
+    if match:
+        return int(match.group())
+    return value
+
+def _parse_admin_ids(value: str) -> FrozenSet[int]:
+    """Разбор списка ID администраторов через запятую"""
+    return frozenset(int(id.strip()) for id in value.split(",") if id.strip())
+
+@dataclass(frozen=True, slots=True)
+class Settings:
+    """Настройки бота (читаются из окружения один раз при импорте)"""
+    BOT_TOKEN: str = field(default=os.getenv("BOT_TOKEN", ""), repr=False)
+
     # Настройка прокси
-    PROXY_URL = os.getenv("PROXY_URL", "")
-    
+    PROXY_URL: str = os.getenv("PROXY_URL", "")
+
     # Обработка CHANNEL_ID
-    CHANNEL_ID_STR = os.getenv("CHANNEL_ID", "").strip()
-    CHANNEL_ID = None
-    
-    if CHANNEL_ID_STR:
-        if CHANNEL_ID_STR.lstrip('-').replace('.', '').isdigit():
-            CHANNEL_ID = int(CHANNEL_ID_STR)
-        elif CHANNEL_ID_STR.startswith('@'):
-            CHANNEL_ID = CHANNEL_ID_STR
-        else:
-            match = re.search(r'(-?\d+)', CHANNEL_ID_STR)
-            if match:
-                CHANNEL_ID = int(match.group(1))
-            else:
-                CHANNEL_ID = CHANNEL_ID_STR
-    
-    admin_ids_str = os.getenv("ADMIN_IDS", "")
-    if admin_ids_str:
-        ADMIN_IDS = [int(id.strip()) for id in admin_ids_str.split(",") if id.strip()]
-    else:
-        ADMIN_IDS = []
-    
-    DATABASE_URL = os.getenv("DATABASE_URL", "sqlite+aiosqlite:///auctions.db")
-    
-    BID_TIMEOUT_MINUTES = int(os.getenv("BID_TIMEOUT_MINUTES", "180"))  # 3 часа
-    BID_STEP_PERCENT = int(os.getenv("BID_STEP_PERCENT", "10"))
-    
-    DATABASE_TIMEOUT = int(os.getenv("DATABASE_TIMEOUT", "60"))
-    BID_RETRY_ATTEMPTS = int(os.getenv("BID_RETRY_ATTEMPTS", "3"))
-    
-    if not BOT_TOKEN:
-        print("⚠️  ВНИМАНИЕ: BOT_TOKEN не установлен!")
-        print("Создайте файл .env с токеном вашего бота")
+    CHANNEL_ID_STR: str = os.getenv("CHANNEL_ID", "").strip()
+    CHANNEL_ID: Optional[Union[int, str]] = _parse_channel_id(CHANNEL_ID_STR)
+
+    # frozenset: проверка прав администратора за O(1)
+    ADMIN_IDS: FrozenSet[int] = _parse_admin_ids(os.getenv("ADMIN_IDS", ""))
+
+    DATABASE_URL: str = os.getenv("DATABASE_URL", "sqlite+aiosqlite:///auctions.db")
+
+    # Redis (необязательно): FSM и ограничение частоты, общие для всех процессов
+    REDIS_URL: str = os.getenv("REDIS_URL", "")
+
+    BID_TIMEOUT_MINUTES: int = int(os.getenv("BID_TIMEOUT_MINUTES", "180"))  # 3 часа
+    BID_STEP_PERCENT: int = int(os.getenv("BID_STEP_PERCENT", "10"))
+
+    DATABASE_TIMEOUT: int = int(os.getenv("DATABASE_TIMEOUT", "60"))
+    # Пул соединений PostgreSQL: ставки, рассылка и фоновые задачи идут параллельно
+    DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", "20"))
+    DB_MAX_OVERFLOW: int = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+    BID_RETRY_ATTEMPTS: int = int(os.getenv("BID_RETRY_ATTEMPTS", "3"))
+
+    # Производные значения считаются один раз, а не при каждой ставке
+    BID_TIMEOUT: timedelta = field(init=False)
+    BID_TIMEOUT_HOURS: int = field(init=False)
+
+    def __post_init__(self):
+        object.__setattr__(self, "BID_TIMEOUT", timedelta(minutes=self.BID_TIMEOUT_MINUTES))
+        object.__setattr__(self, "BID_TIMEOUT_HOURS", self.BID_TIMEOUT_MINUTES // 60)
+
+Config = Settings()
+
+if not Config.BOT_TOKEN:
+    print("⚠️  ВНИМАНИЕ: BOT_TOKEN не установлен!")
+    print("Создайте файл .env с токеном вашего бота")
@@ -1,6 +1,8 @@
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy import DateTime, Interval, event, func, inspect, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import DBAPIError, OperationalError
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from contextlib import asynccontextmanager
 from typing import AsyncGenerator
 from config import Config
@@ -10,41 +12,205 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+_IS_SQLITE = make_url(Config.DATABASE_URL).get_backend_name() == "sqlite"
+
+# Текущее время UTC на стороне СУБД (без tzinfo, как utils.clock.utcnow),
+# при необходимости сдвинутое на заданное число минут
+if _IS_SQLITE:
+    def db_utcnow(minutes: int = 0):
+        """Время СУБД в формате, в котором SQLite хранит DateTime"""
+        return func.strftime('%Y-%m-%d %H:%M:%f', 'now', f'{minutes} minutes', type_=DateTime)
+else:
+    def db_utcnow(minutes: int = 0):
+        """Время СУБД (UTC без часового пояса) со сдвигом"""
+        return func.timezone('UTC', func.now(), type_=DateTime) + func.make_interval(
+            0, 0, 0, 0, 0, minutes, type_=Interval
+        )
+
+if _IS_SQLITE:
+    # Файл SQLite не "отваливается" как сетевое соединение, поэтому
+    # pool_pre_ping (лишний SELECT при каждой выдаче) и pool_recycle не нужны.
+    # check_same_thread не передаем: aiosqlite сам держит соединение в своем потоке
+    # Для файловой SQLite диалект aiosqlite по умолчанию берет NullPool
+    # (новое соединение, поток и все PRAGMA на каждую сессию), поэтому
+    # пул соединений задаем явно
+    _ENGINE_OPTIONS = {
+        "connect_args": {"timeout": Config.DATABASE_TIMEOUT},
+        "poolclass": AsyncAdaptedQueuePool,
+    }
+else:
+    _ENGINE_OPTIONS = {
+        "pool_pre_ping": True,       # Проверяем соединение перед использованием
+        "pool_recycle": 3600,        # Пересоздаем соединение каждый час
+        # Размер пула по умолчанию (5 + 10) мал для параллельных ставок
+        # и рассылок; ожидание свободного соединения ограничено
+        "pool_size": Config.DB_POOL_SIZE,
+        "max_overflow": Config.DB_MAX_OVERFLOW,
+        "pool_timeout": Config.DATABASE_TIMEOUT,
+    }
+    if make_url(Config.DATABASE_URL).get_driver_name() == "asyncpg":
+        # Короткие запросы бота не выигрывают от JIT, а его компиляция
+        # дает непредсказуемые задержки
+        _ENGINE_OPTIONS["connect_args"] = {"server_settings": {"jit": "off"}}
+
 # Создаем движок для асинхронной работы с БД с оптимизациями для многопользовательской работы
 engine = create_async_engine(
     Config.DATABASE_URL,
     echo=False,  # Выключаем echo для производительности
-    connect_args={
-        "check_same_thread": False,  # Разрешаем доступ из разных потоков
-        "timeout": 60,               # Увеличиваем таймаут до 60 секунд
-    },
-    pool_pre_ping=True,              # Проверяем соединение перед использованием
-    pool_recycle=3600                # Пересоздаем соединение каждый час
+    future=True,
+    **_ENGINE_OPTIONS
+)
+
+# PRAGMA в SQLite действуют на уровне соединения, поэтому применяем их
+# к каждому новому соединению пула, а не только к первому в init_db
+_SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",      # Включаем WAL режим
+    "PRAGMA synchronous=NORMAL",    # Оптимизируем синхронизацию
+    "PRAGMA busy_timeout=5000",     # Таймаут при блокировке 5 секунд
+    "PRAGMA cache_size=-65536",     # Кэш страниц 64 МБ
+    "PRAGMA mmap_size=268435456",   # Читаем горячие страницы через mmap (256 МБ)
+    "PRAGMA temp_store=MEMORY",     # Временные таблицы и сортировки в памяти
+    "PRAGMA wal_autocheckpoint=1000",  # Чекпоинт WAL каждые 1000 страниц
+    "PRAGMA foreign_keys=ON",       # Включаем внешние ключи
 )
 
-# Создаем фабрику сессий
-AsyncSessionLocal = sessionmaker(
-    engine, 
-    class_=AsyncSession, 
+def _apply_pragmas(dbapi_connection, pragmas):
+    cursor = dbapi_connection.cursor()
+    try:
+        for pragma in pragmas:
+            cursor.execute(pragma)
+    finally:
+        cursor.close()
+
+if _IS_SQLITE:
+    # Отдельный пул соединений только для чтения: в режиме WAL читатели не
+    # блокируют писателя, поэтому списки аукционов, топ ставок и статистика
+    # не конкурируют за соединения с транзакциями ставок
+    reader_engine = create_async_engine(
+        Config.DATABASE_URL,
+        echo=False,
+        future=True,
+        connect_args={"timeout": Config.DATABASE_TIMEOUT},
+        poolclass=AsyncAdaptedQueuePool,
+        pool_size=8,
+        max_overflow=0
+    )
+
+    @event.listens_for(engine.sync_engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        _apply_pragmas(dbapi_connection, _SQLITE_PRAGMAS)
+
+    @event.listens_for(reader_engine.sync_engine, "connect")
+    def _set_sqlite_reader_pragmas(dbapi_connection, connection_record):
+        # query_only защищает от случайной записи через пул чтения
+        _apply_pragmas(dbapi_connection, _SQLITE_PRAGMAS + ("PRAGMA query_only=ON",))
+else:
+    reader_engine = engine
+
+# Создаем фабрики сессий
+AsyncSessionLocal = async_sessionmaker(
+    engine,
+    expire_on_commit=False,
+    autoflush=False
+)
+
+AsyncReadSessionLocal = async_sessionmaker(
+    reader_engine,
     expire_on_commit=False,
-    autocommit=False,
     autoflush=False
 )
 
+# Индексы, которые заменены составными и больше не нужны
+_OBSOLETE_INDEXES = ("ix_bids_amount", "ix_auctions_status")
+
+def _sync_indexes(connection):
+    """Создать индексы, добавленные в модели после создания таблиц"""
+    # create_all пропускает существующие таблицы вместе с их индексами
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(connection, checkfirst=True)
+    for index_name in _OBSOLETE_INDEXES:
+        connection.execute(text(f"DROP INDEX IF EXISTS {index_name}"))
+
+# SQLSTATE PostgreSQL для конфликтов, которые проходят при повторе транзакции:
+# serialization_failure и deadlock_detected
+_TRANSIENT_SQLSTATES = ("40001", "40P01")
+
+def is_transient_db_error(error: DBAPIError) -> bool:
+    """Ошибка из-за конкурентной транзакции, которую имеет смысл повторить"""
+    if _IS_SQLITE:
+        # SQLite: база занята другим писателем дольше busy_timeout
+        return isinstance(error, OperationalError) and (
+            "locked" in str(error.orig) or "busy" in str(error.orig)
+        )
+    sqlstate = getattr(error.orig, "sqlstate", None) or getattr(error.orig, "pgcode", None)
+    return sqlstate in _TRANSIENT_SQLSTATES
+
+# Колонки, добавленные в модели после создания таблиц: (таблица, колонка,
+# определение для ALTER TABLE, запрос заполнения существующих строк)
+_ADDED_COLUMNS = (
+    (
+        "auctions", "top_bidder_id", "INTEGER REFERENCES users(id)",
+        "UPDATE auctions SET top_bidder_id = (SELECT user_id FROM bids "
+        "WHERE bids.auction_id = auctions.id ORDER BY amount DESC LIMIT 1)"
+    ),
+)
+
+def _sync_columns(connection):
+    """Добавить колонки, которых нет в уже созданных таблицах"""
+    inspector = inspect(connection)
+    for table_name, column_name, definition, backfill in _ADDED_COLUMNS:
+        existing = {column["name"] for column in inspector.get_columns(table_name)}
+        if column_name in existing:
+            continue
+        connection.execute(text(f"ALTER TABLE {table_name} ADD COLUMN {column_name} {definition}"))
+        connection.execute(text(backfill))
+        logger.info("В таблицу %s добавлена колонка %s", table_name, column_name)
+
+# Таблицы, строки которых удаляются вместе с аукционом
+_AUCTION_CHILD_TABLES = ("notifications", "auction_subscriptions", "bids")
+
+def _sync_cascade_fks(connection):
+    """Пересоздать дочерние таблицы без ON DELETE CASCADE на auctions"""
+    # SQLite не умеет менять внешний ключ через ALTER TABLE, поэтому таблица
+    # копируется в новую по текущей модели
+    for table_name in _AUCTION_CHILD_TABLES:
+        fks = connection.execute(text(f"PRAGMA foreign_key_list({table_name})")).fetchall()
+        if all(fk[2] != 'auctions' or fk[6] == 'CASCADE' for fk in fks):
+            continue
+        
+        table = Base.metadata.tables[table_name]
+        old_name = f"_old_{table_name}"
+        columns = ", ".join(column.name for column in table.columns)
+        for index in table.indexes:
+            connection.execute(text(f"DROP INDEX IF EXISTS {index.name}"))
+        connection.execute(text(f"ALTER TABLE {table_name} RENAME TO {old_name}"))
+        table.create(connection)
+        # Строки без аукциона или пользователя не переносим: новый ключ их не пропустит
+        linked = "auction_id IN (SELECT id FROM auctions) AND user_id IN (SELECT id FROM users)"
+        orphans = connection.execute(text(
+            f"SELECT count(*) FROM {old_name} WHERE ({linked}) IS NOT 1"
+        )).scalar()
+        if orphans:
+            logger.warning(
+                "Таблица %s: удалено %s строк без связанного аукциона или пользователя",
+                table_name, orphans
+            )
+        connection.execute(text(
+            f"INSERT INTO {table_name} ({columns}) SELECT {columns} FROM {old_name} "
+            f"WHERE {linked}"
+        ))
+        connection.execute(text(f"DROP TABLE {old_name}"))
+        logger.info("Таблица %s пересоздана с ON DELETE CASCADE", table_name)
+
 async def init_db():
     """Инициализация базы данных"""
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
-    
-    # Настраиваем SQLite для многопользовательской работы
-    async with engine.connect() as conn:
-        # ИСПРАВЛЕНО: используем text() для SQL запросов
-        await conn.execute(text("PRAGMA journal_mode=WAL"))  # Включаем WAL режим
-        await conn.execute(text("PRAGMA synchronous=NORMAL"))  # Оптимизируем синхронизацию
-        await conn.execute(text("PRAGMA busy_timeout=5000"))  # Таймаут при блокировке 5 секунд
-        await conn.execute(text("PRAGMA cache_size=-2000"))  # Увеличиваем кэш
-        await conn.execute(text("PRAGMA foreign_keys=ON"))  # Включаем внешние ключи
-        await conn.commit()
+        await conn.run_sync(_sync_columns)
+        if _IS_SQLITE:
+            await conn.run_sync(_sync_cascade_fks)
+        await conn.run_sync(_sync_indexes)
     
     logger.info("База данных инициализирована с оптимизациями для многопользовательской работы")
 
@@ -57,7 +223,19 @@ async def get_db() -> AsyncGenerator[AsyncSession, None]:
         await session.commit()
     except Exception as e:
         await session.rollback()
-        logger.error(f"Ошибка в сессии БД: {e}")
+        logger.error("Ошибка в сессии БД: %s", e)
+        raise
+    finally:
+        await session.close()
+
+@asynccontextmanager
+async def get_db_read() -> AsyncGenerator[AsyncSession, None]:
+    """Получение сессии БД только для чтения (без коммита)"""
+    session = AsyncReadSessionLocal()
+    try:
+        yield session
+    except Exception as e:
+        logger.error("Ошибка в сессии чтения БД: %s", e)
         raise
     finally:
         await session.close()
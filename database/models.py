@@ -1,13 +1,30 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, Boolean, ForeignKey, Text, Index
+from sqlalchemy import Column, Integer, String, Float, DateTime, Boolean, ForeignKey, Text, Index, CheckConstraint, cast, func
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import relationship
-from datetime import datetime
-import json
+from sqlalchemy.orm import column_property, relationship
+import orjson
+
+from config import Config
 
 Base = declarative_base()
 
+_IS_SQLITE = make_url(Config.DATABASE_URL).get_backend_name() == "sqlite"
+
+# Первый элемент JSON-массива фотографий средствами СУБД: JSON1 в SQLite,
+# оператор ->> в PostgreSQL
+if _IS_SQLITE:
+    def _first_photo(photos):
+        return func.json_extract(photos, '$[0]')
+else:
+    def _first_photo(photos):
+        return cast(photos, JSONB)[0].astext
+
 class User(Base):
     __tablename__ = 'users'
+    # Серверные значения по умолчанию читаются сразу в INSERT ... RETURNING,
+    # а не ленивой подгрузкой, которая недоступна в асинхронной сессии
+    __mapper_args__ = {'eager_defaults': True}
     
     id = Column(Integer, primary_key=True)
     telegram_id = Column(Integer, unique=True, nullable=False)
@@ -16,12 +33,14 @@ class User(Base):
     last_name = Column(String(100))
     phone = Column(String(20))
     is_confirmed = Column(Boolean, default=False)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, server_default=func.current_timestamp(), nullable=False)
     
     # Связи
-    bids = relationship("Bid", back_populates="user", cascade="all, delete-orphan")
-    notifications = relationship("Notification", back_populates="user")
-    subscriptions = relationship("AuctionSubscription", back_populates="user")
+    # lazy='raise': в асинхронной сессии ленивая загрузка невозможна,
+    # поэтому коллекции загружаются только явно через selectinload()
+    bids = relationship("Bid", back_populates="user", cascade="all, delete-orphan", lazy="raise")
+    notifications = relationship("Notification", back_populates="user", lazy="raise")
+    subscriptions = relationship("AuctionSubscription", back_populates="user", lazy="raise")
     
     __table_args__ = (
         Index('ix_users_is_confirmed', 'is_confirmed'),
@@ -29,6 +48,7 @@ class User(Base):
 
 class Auction(Base):
     __tablename__ = 'auctions'
+    __mapper_args__ = {'eager_defaults': True}
     
     id = Column(Integer, primary_key=True)
     title = Column(String(255), nullable=False, index=True)
@@ -39,49 +59,72 @@ class Auction(Base):
     current_price = Column(Float, nullable=False)
     status = Column(String(20), default='active')
     winner_id = Column(Integer, ForeignKey('users.id'), nullable=True)
+    # Автор текущей лучшей ставки: проверка "уже лидирует" и уведомление
+    # о перебитии обходятся без поиска лучшей ставки в bids
+    top_bidder_id = Column(Integer, ForeignKey('users.id'), nullable=True)
     channel_message_id = Column(Integer)
-    last_bid_time = Column(DateTime, default=datetime.utcnow)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    last_bid_time = Column(DateTime, server_default=func.current_timestamp())
+    created_at = Column(DateTime, server_default=func.current_timestamp(), nullable=False)
     ends_at = Column(DateTime, nullable=True)
     ended_at = Column(DateTime, nullable=True)
     
+    # Первое фото достается прямо в запросе, без разбора JSON в Python.
+    # Отложенное: подгружается только через undefer()
+    first_photo = column_property(_first_photo(photos), deferred=True)
+    
     # Связи
-    winner = relationship("User", foreign_keys=[winner_id])
-    bids = relationship("Bid", back_populates="auction", order_by="Bid.amount.desc()", cascade="all, delete-orphan")
-    subscriptions = relationship("AuctionSubscription", back_populates="auction")
-    notifications = relationship("Notification", back_populates="auction")
+    # Победитель нужен при каждом выводе завершенного аукциона: грузим его
+    # одним запросом на всю выборку (у активных аукционов запроса нет)
+    winner = relationship("User", foreign_keys=[winner_id], lazy="selectin")
+    # Все ставки аукциона не нужны нигде - топ и количество берутся запросами
+    # Связанные записи удаляет сама БД (ON DELETE CASCADE)
+    bids = relationship("Bid", back_populates="auction", order_by="Bid.amount.desc()", cascade="all, delete-orphan", lazy="raise", passive_deletes=True)
+    subscriptions = relationship("AuctionSubscription", back_populates="auction", lazy="raise", passive_deletes=True)
+    notifications = relationship("Notification", back_populates="auction", lazy="raise", passive_deletes=True)
     
     __table_args__ = (
-        Index('ix_auctions_status', 'status'),
         Index('ix_auctions_ends_at', 'ends_at'),
         Index('ix_auctions_last_bid_time', 'last_bid_time'),
         Index('ix_auctions_created_at', 'created_at'),
         Index('ix_auctions_winner_id', 'winner_id'),  # ДОБАВЛЕНО
+        # Поиск истекших аукционов: диапазон по (status='active', ends_at < now)
+        Index('ix_auctions_status_ends_at', 'status', 'ends_at'),
+        Index('ix_auctions_status_last_bid_time', 'status', 'last_bid_time'),
+        # Списки активных аукционов (новые сверху) без отдельной сортировки
+        Index('ix_auctions_status_created_at', 'status', created_at.desc()),
     )
     
     @property
     def photo_list(self):
         """Получить список фото из JSON строки"""
-        if not self.photos:
-            return []
+        # Кэш привязан к исходной строке: после refresh/expire photos
+        # будет другим объектом, и список разберется заново
+        cached = self.__dict__.get('_photo_list_cache')
+        if cached is not None and cached[0] is self.photos:
+            return cached[1]
+        photos = self.photos
         try:
-            return json.loads(self.photos)
-        except:
-            return []
+            value = orjson.loads(photos) if photos else []
+        except orjson.JSONDecodeError:
+            value = []
+        self.__dict__['_photo_list_cache'] = (photos, value)
+        return value
     
     @photo_list.setter
     def photo_list(self, value):
         """Установить список фото как JSON строку"""
-        self.photos = json.dumps(value) if value else None
+        self.__dict__.pop('_photo_list_cache', None)
+        self.photos = orjson.dumps(value).decode() if value else None
 
 class Bid(Base):
     __tablename__ = 'bids'
+    __mapper_args__ = {'eager_defaults': True}
     
     id = Column(Integer, primary_key=True)
-    auction_id = Column(Integer, ForeignKey('auctions.id'), nullable=False)
+    auction_id = Column(Integer, ForeignKey('auctions.id', ondelete='CASCADE'), nullable=False)
     user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
     amount = Column(Float, nullable=False)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, server_default=func.current_timestamp(), nullable=False)
     
     # Связи
     auction = relationship("Auction", back_populates="bids")
@@ -89,17 +132,23 @@ class Bid(Base):
     
     __table_args__ = (
         Index('ix_bids_auction_user', 'auction_id', 'user_id'),
-        Index('ix_bids_amount', 'amount'),
+        # Лучшая ставка аукциона читается из индекса без сортировки
+        Index('ix_bids_auction_amount', 'auction_id', amount.desc()),
+        # История ставок аукциона и последние ставки пользователя (новые сверху)
+        Index('ix_bids_auction_created_at', 'auction_id', created_at.desc()),
+        Index('ix_bids_user_created_at', 'user_id', created_at.desc()),
         Index('ix_bids_created_at', 'created_at'),
+        CheckConstraint('amount > 0', name='ck_bid_positive'),
     )
 
 class AuctionSubscription(Base):
     __tablename__ = 'auction_subscriptions'
+    __mapper_args__ = {'eager_defaults': True}
     
     id = Column(Integer, primary_key=True)
-    auction_id = Column(Integer, ForeignKey('auctions.id'), nullable=False)
+    auction_id = Column(Integer, ForeignKey('auctions.id', ondelete='CASCADE'), nullable=False)
     user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, server_default=func.current_timestamp(), nullable=False)
     
     # Связи
     auction = relationship("Auction", back_populates="subscriptions")
@@ -111,13 +160,14 @@ class AuctionSubscription(Base):
 
 class Notification(Base):
     __tablename__ = 'notifications'
+    __mapper_args__ = {'eager_defaults': True}
     
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
-    auction_id = Column(Integer, ForeignKey('auctions.id'), nullable=False)
+    auction_id = Column(Integer, ForeignKey('auctions.id', ondelete='CASCADE'), nullable=False)
     message = Column(Text, nullable=False)
     is_read = Column(Boolean, default=False)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, server_default=func.current_timestamp(), nullable=False)
     
     # Связи
     user = relationship("User", back_populates="notifications")
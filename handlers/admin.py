@@ -4,29 +4,78 @@ from aiogram.filters import Command
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.fsm.context import FSMContext
 from sqlalchemy import select, func, desc
-from sqlalchemy.orm import selectinload
+from sqlalchemy.orm import contains_eager
 import json
 import datetime
 import logging
 import asyncio
 
-from sqlalchemy import delete
+from sqlalchemy import delete, insert, literal, text, update
 
 from config import Config
-from database.database import get_db
-from database.models import Auction, User, Bid, Notification
-from keyboards.inline import get_admin_main_keyboard, get_admin_auction_keyboard, get_admin_stats_keyboard, get_channel_auction_keyboard, get_admin_limits_keyboard
-from utils.formatters import format_auction_message, format_ended_auction_message, format_admin_stats, format_username
-from utils.notifications import send_winner_notification, send_subscription_notification
+from utils.clock import utcnow
+from database.database import get_db, get_db_read
+from database.models import Auction, User, Bid
+from keyboards.inline import AdminAction, get_admin_main_keyboard, get_admin_auction_keyboard, get_admin_active_list_keyboard, get_admin_stats_keyboard, get_channel_auction_keyboard, get_admin_limits_keyboard
+from utils.formatters import format_auction_message, format_ended_auction_message, format_admin_stats, format_username, escape_html
+from utils.message_kind import edit_channel_message, forget_channel_message
+from utils.notifications import send_winner_notification, send_subscription_notification, queue_notifications
 from utils.timer import auction_timer_manager
 from utils.validators import AuctionValidator
 from utils.periodic_updater import periodic_updater
+from utils.active_auctions import invalidate_active_auctions
 
 router = Router()
+# Все обработчики модуля только для администраторов: апдейты остальных
+# пользователей отсекаются фильтром роутера до вызова обработчика и запросов к БД
+router.message.filter(F.from_user.id.in_(Config.ADMIN_IDS))
+router.callback_query.filter(F.from_user.id.in_(Config.ADMIN_IDS))
 logger = logging.getLogger(__name__)
 
-def is_admin(user_id: int) -> bool:
-    return user_id in Config.ADMIN_IDS
+# Максимальное количество активных аукционов
+MAX_ACTIVE_AUCTIONS = 20
+# Аукционов в одном сообщении списка активных
+ACTIVE_LIST_CHUNK = 10
+# Ключ advisory-блокировки PostgreSQL, сериализующей создание аукционов
+CREATE_AUCTION_LOCK_KEY = 7310001
+
+def format_admin_time_left(auction: Auction, now) -> str:
+    """Оставшееся время аукциона для админских списков"""
+    if auction.ends_at:
+        total_seconds = (auction.ends_at - now).total_seconds()
+        if total_seconds > 0:
+            hours = int(total_seconds // 3600)
+            minutes = int((total_seconds % 3600) // 60)
+            return f"{hours}ч {minutes}м"
+    return "Завершен"
+
+async def active_auctions_at_limit(session) -> bool:
+    """Достигнут ли лимит активных аукционов (без подсчета всех строк)"""
+    # Достаточно узнать, существует ли MAX_ACTIVE_AUCTIONS-я активная строка
+    stmt = select(Auction.id).where(
+        Auction.status == 'active'
+    ).offset(MAX_ACTIVE_AUCTIONS - 1).limit(1)
+    return await session.scalar(stmt) is not None
+
+async def insert_auction_within_limit(session, **values):
+    """Создать аукцион, только если лимит активных не достигнут (None - лимит)"""
+    # Проверка лимита и вставка одним INSERT ... SELECT, RETURNING сразу
+    # заполняет id и серверные значения. В SQLite писатели сериализованы,
+    # и этого достаточно. В PostgreSQL (READ COMMITTED) два таких INSERT
+    # видят одинаковое число активных аукционов, поэтому создания
+    # сериализуются advisory-блокировкой до конца транзакции
+    if session.get_bind().dialect.name != "sqlite":
+        await session.execute(
+            text("SELECT pg_advisory_xact_lock(:key)"), {"key": CREATE_AUCTION_LOCK_KEY}
+        )
+    at_limit = select(Auction.id).where(
+        Auction.status == 'active'
+    ).offset(MAX_ACTIVE_AUCTIONS - 1).limit(1).exists()
+    source = select(
+        *(literal(value, Auction.__table__.c[name].type) for name, value in values.items())
+    ).where(~at_limit)
+    stmt = insert(Auction).from_select(list(values), source).returning(Auction)
+    return await session.scalar(stmt)
 
 # Состояния для FSM
 class CreateAuction(StatesGroup):
@@ -39,26 +88,18 @@ class CreateAuction(StatesGroup):
 @router.message(Command("admin"))
 async def cmd_admin(message: Message):
     """Панель администратора"""
-    if not is_admin(message.from_user.id):
-        await message.answer("⛔ У вас нет прав администратора!")
-        return
-    
     # Проверяем количество активных аукционов
-    async with get_db() as session:
-        stmt_active = select(func.count(Auction.id)).where(Auction.status == 'active')
-        result = await session.execute(stmt_active)
-        active_count = result.scalar()
-        
-        max_active = 20  # Максимальное количество активных аукционов
-        
-        if active_count >= max_active:
-            await message.answer(
-                f"⚠️ <b>Достигнут лимит активных аукционов!</b>\n\n"
-                f"Активных аукционов: {active_count}/{max_active}\n"
-                f"Завершите некоторые аукционы перед созданием новых.",
-                parse_mode="HTML"
-            )
-            return
+    async with get_db_read() as session:
+        at_limit = await active_auctions_at_limit(session)
+    
+    if at_limit:
+        await message.answer(
+            f"⚠️ <b>Достигнут лимит активных аукционов!</b>\n\n"
+            f"Максимум активных аукционов: {MAX_ACTIVE_AUCTIONS}\n"
+            f"Завершите некоторые аукционы перед созданием новых.",
+            parse_mode="HTML"
+        )
+        return
     
     await message.answer(
         "👑 Панель администратора\n\n"
@@ -69,24 +110,16 @@ async def cmd_admin(message: Message):
 @router.callback_query(F.data == "admin_create")
 async def admin_create_start(callback: CallbackQuery, state: FSMContext):
     """Начало создания аукциона"""
-    if not is_admin(callback.from_user.id):
-        await callback.answer("Нет прав!", show_alert=True)
-        return
-    
     # Проверяем количество активных аукционов
-    async with get_db() as session:
-        stmt_active = select(func.count(Auction.id)).where(Auction.status == 'active')
-        result = await session.execute(stmt_active)
-        active_count = result.scalar()
-        
-        max_active = 20
-        
-        if active_count >= max_active:
-            await callback.answer(
-                f"⚠️ Достигнут лимит активных аукционов ({active_count}/{max_active})",
-                show_alert=True
-            )
-            return
+    async with get_db_read() as session:
+        at_limit = await active_auctions_at_limit(session)
+    
+    if at_limit:
+        await callback.answer(
+            f"⚠️ Достигнут лимит активных аукционов ({MAX_ACTIVE_AUCTIONS})",
+            show_alert=True
+        )
+        return
     
     await callback.message.answer(
         "🛠 Создание нового аукциона\n\n"
@@ -204,7 +237,8 @@ async def process_step_price(message: Message, state: FSMContext):
         # Создаем аукцион в базе данных
         async with get_db() as session:
             async with session.begin():
-                auction = Auction(
+                auction = await insert_auction_within_limit(
+                    session,
                     title=data['title'],
                     description=data['description'],
                     photos=json.dumps([data['photo']] if data.get('photo') else []),
@@ -212,31 +246,30 @@ async def process_step_price(message: Message, state: FSMContext):
                     step_price=step,
                     current_price=start_price,
                     status='active',
-                    ends_at=datetime.datetime.utcnow() + datetime.timedelta(minutes=Config.BID_TIMEOUT_MINUTES)
+                    ends_at=utcnow() + Config.BID_TIMEOUT
                 )
-                
-                session.add(auction)
         
-        # Получаем ID созданного аукциона
-        async with get_db() as session:
-            stmt = select(Auction).where(
-                Auction.title == data['title']
-            ).order_by(desc(Auction.created_at)).limit(1)
-            result = await session.execute(stmt)
-            auction = result.scalar_one()
-            
-            logger.info(f"Аукцион создан с ID: {auction.id}")
-            
-            # Запускаем таймер для аукциона
-            try:
-                await auction_timer_manager.start_auction_timer(auction.id, auction.ends_at)
-                logger.info(f"Таймер для аукциона #{auction.id} запущен")
-            except Exception as e:
-                logger.error(f"Ошибка запуска таймера для аукциона #{auction.id}: {e}")
-            
-            # Для нового аукциона нет ставок
-            message_text = format_auction_message(auction, top_bids=[], bids_count=0)
-            next_bid_amount = auction.current_price + auction.step_price
+        if auction is None:
+            await message.answer(
+                f"❌ Достигнут лимит активных аукционов ({MAX_ACTIVE_AUCTIONS}). "
+                f"Аукцион не создан."
+            )
+            await state.clear()
+            return
+        
+        logger.info("Аукцион создан с ID: %s", auction.id)
+        invalidate_active_auctions()
+        
+        # Запускаем таймер для аукциона
+        try:
+            await auction_timer_manager.start_auction_timer(auction.id, auction.ends_at)
+            logger.info("Таймер для аукциона #%s запущен", auction.id)
+        except Exception as e:
+            logger.error("Ошибка запуска таймера для аукциона #%s: %s", auction.id, e)
+        
+        # Для нового аукциона нет ставок
+        message_text = format_auction_message(auction, top_bids=[], bids_count=0)
+        next_bid_amount = auction.current_price + auction.step_price
         
         try:
             # Отправляем сообщение в канал
@@ -258,13 +291,13 @@ async def process_step_price(message: Message, state: FSMContext):
             
             # Сохраняем ID сообщения в БД
             async with get_db() as session:
-                async with session.begin():
-                    stmt = select(Auction).where(Auction.id == auction.id)
-                    result = await session.execute(stmt)
-                    auction_to_update = result.scalar_one()
-                    auction_to_update.channel_message_id = channel_message.message_id
+                await session.execute(
+                    update(Auction).where(Auction.id == auction.id).values(
+                        channel_message_id=channel_message.message_id
+                    )
+                )
             
-            timeout_hours = Config.BID_TIMEOUT_MINUTES // 60
+            timeout_hours = Config.BID_TIMEOUT_HOURS
             await message.answer(
                 f"✅ <b>Аукцион создан и опубликован в канале!</b>\n\n"
                 f"🆔 ID: <code>{auction.id}</code>\n"
@@ -277,7 +310,7 @@ async def process_step_price(message: Message, state: FSMContext):
                 parse_mode="HTML"
             )
         except Exception as e:
-            logger.error(f"Ошибка публикации в канал: {e}")
+            logger.error("Ошибка публикации в канал: %s", e)
             # Используем переменные, которые точно определены
             title = data.get('title', 'Неизвестно')
             photo_status = '✅ Есть' if data.get('photo') else '❌ Нет'
@@ -298,98 +331,107 @@ async def process_step_price(message: Message, state: FSMContext):
         await state.clear()
         
     except ValueError as e:
-        logger.error(f"Ошибка преобразования числа: {e}")
+        logger.error("Ошибка преобразования числа: %s", e)
         await message.answer("❌ Неверный формат шага ставки. Введите число:")
     except Exception as e:
-        logger.error(f"Неизвестная ошибка: {e}", exc_info=True)
+        logger.error("Неизвестная ошибка: %s", e, exc_info=True)
         await message.answer(f"❌ Произошла ошибка при создании аукциона: {str(e)}")
 
 @router.callback_query(F.data == "admin_active")
 async def admin_active_auctions(callback: CallbackQuery):
-    if not is_admin(callback.from_user.id):
-        await callback.answer("Нет прав!", show_alert=True)
-        return
-    
-    async with get_db() as session:
-        stmt = select(Auction).where(
+    async with get_db_read() as session:
+        # Количество ставок считается коррелированным подзапросом в том же SELECT
+        bids_count_subq = select(func.count(Bid.id)).where(
+            Bid.auction_id == Auction.id
+        ).correlate(Auction).scalar_subquery()
+        
+        stmt = select(Auction, bids_count_subq).where(
             Auction.status == 'active'
         ).order_by(desc(Auction.created_at))
         
         result = await session.execute(stmt)
-        auctions = result.scalars().all()
+        rows = result.all()
         
-        if not auctions:
+        if not rows:
             await callback.message.answer("📭 Нет активных аукционов.")
             await callback.answer()
             return
         
-        # Вместо простого текста отправляем каждый аукцион с кнопками управления
-        for auction in auctions:
-            stmt_bids = select(func.count(Bid.id)).where(Bid.auction_id == auction.id)
-            result_bids = await session.execute(stmt_bids)
-            bids_count = result_bids.scalar()
-            
-            time_remaining = "Завершен"
-            if auction.ends_at:
-                time_left = auction.ends_at - datetime.datetime.utcnow()
-                if time_left.total_seconds() > 0:
-                    hours = int(time_left.total_seconds() // 3600)
-                    minutes = int((time_left.total_seconds() % 3600) // 60)
-                    time_remaining = f"{hours}ч {minutes}м"
-            
-            text = (
-                f"🆔 ID: <code>{auction.id}</code>\n"
-                f"📦 <b>{auction.title}</b>\n"
-                f"💰 Текущая цена: {auction.current_price} ₽\n"
-                f"👥 Ставок: {bids_count}\n"
-                f"⏳ Осталось: {time_remaining}\n\n"
-                f"<b>Выберите действие:</b>"
+        now = utcnow()
+        # Один список на пачку аукционов вместо отдельного сообщения на каждый;
+        # карточка с кнопками управления открывается по кнопке аукциона
+        for start in range(0, len(rows), ACTIVE_LIST_CHUNK):
+            chunk = rows[start:start + ACTIVE_LIST_CHUNK]
+            text = "\n\n".join(
+                f"🆔 <code>{auction.id}</code> <b>{escape_html(auction.title)}</b>\n"
+                f"💰 {auction.current_price} ₽ · 👥 {bids_count} · ⏳ {format_admin_time_left(auction, now)}"
+                for auction, bids_count in chunk
             )
-            
             await callback.message.answer(
                 text,
                 parse_mode="HTML",
-                reply_markup=get_admin_auction_keyboard(auction.id)
+                reply_markup=get_admin_active_list_keyboard(
+                    [(auction.id, auction.title) for auction, _ in chunk]
+                )
             )
         
         await callback.answer()
 
-@router.callback_query(F.data == "admin_stats_all")
-async def admin_stats_all(callback: CallbackQuery):
-    if not is_admin(callback.from_user.id):
-        await callback.answer("Нет прав!", show_alert=True)
-        return
+@router.callback_query(AdminAction.filter(F.action == "menu"))
+async def admin_auction_menu(callback: CallbackQuery, callback_data: AdminAction):
+    """Карточка аукциона с кнопками управления"""
+    auction_id = callback_data.auction_id
     
-    async with get_db() as session:
-        stmt_auctions = select(func.count(Auction.id))
-        result = await session.execute(stmt_auctions)
-        total_auctions = result.scalar()
-        
-        stmt_active = select(func.count(Auction.id)).where(Auction.status == 'active')
-        result = await session.execute(stmt_active)
-        active_auctions = result.scalar()
-        
-        stmt_ended = select(func.count(Auction.id)).where(Auction.status == 'ended')
-        result = await session.execute(stmt_ended)
-        ended_auctions = result.scalar()
-        
-        stmt_users = select(func.count(User.id))
-        result = await session.execute(stmt_users)
-        total_users = result.scalar()
-        
-        stmt_confirmed = select(func.count(User.id)).where(User.is_confirmed == True)
-        result = await session.execute(stmt_confirmed)
-        confirmed_users = result.scalar()
-        
-        stmt_bids = select(func.count(Bid.id))
-        result = await session.execute(stmt_bids)
-        total_bids = result.scalar()
+    async with get_db_read() as session:
+        bids_count_subq = select(func.count(Bid.id)).where(
+            Bid.auction_id == Auction.id
+        ).correlate(Auction).scalar_subquery()
         
-        stmt_total_money = select(func.sum(Auction.current_price)).where(Auction.status == 'ended')
-        result = await session.execute(stmt_total_money)
-        total_money = result.scalar() or 0
+        result = await session.execute(
+            select(Auction, bids_count_subq).where(Auction.id == auction_id)
+        )
+        row = result.one_or_none()
+    
+    if row is None:
+        await callback.answer("Аукцион не найден!", show_alert=True)
+        return
+    
+    auction, bids_count = row
+    text = (
+        f"🆔 ID: <code>{auction.id}</code>\n"
+        f"📦 <b>{escape_html(auction.title)}</b>\n"
+        f"💰 Текущая цена: {auction.current_price} ₽\n"
+        f"👥 Ставок: {bids_count}\n"
+        f"⏳ Осталось: {format_admin_time_left(auction, utcnow())}\n\n"
+        f"<b>Выберите действие:</b>"
+    )
+    
+    await callback.message.answer(
+        text,
+        parse_mode="HTML",
+        reply_markup=get_admin_auction_keyboard(auction.id)
+    )
+    await callback.answer()
+
+@router.callback_query(F.data == "admin_stats_all")
+async def admin_stats_all(callback: CallbackQuery):
+    async with get_db_read() as session:
+        # Вся статистика одним запросом: условная агрегация по аукционам
+        # и скалярные подзапросы для пользователей и ставок
+        stmt = select(
+            func.count(Auction.id),
+            func.count(Auction.id).filter(Auction.status == 'active'),
+            func.count(Auction.id).filter(Auction.status == 'ended'),
+            func.coalesce(func.sum(Auction.current_price).filter(Auction.status == 'ended'), 0),
+            select(func.count(User.id)).scalar_subquery(),
+            select(func.count(User.id)).where(User.is_confirmed == True).scalar_subquery(),
+            select(func.count(Bid.id)).scalar_subquery()
+        ).select_from(Auction)
+        result = await session.execute(stmt)
+        (total_auctions, active_auctions, ended_auctions, total_money,
+         total_users, confirmed_users, total_bids) = result.one()
         
-        timeout_hours = Config.BID_TIMEOUT_MINUTES // 60
+        timeout_hours = Config.BID_TIMEOUT_HOURS
         
         stats_text = f"""
 📊 <b>Общая статистика</b>
@@ -420,114 +462,86 @@ async def admin_stats_all(callback: CallbackQuery):
         )
         await callback.answer()
 
-@router.callback_query(F.data.startswith("admin_end:"))
-async def admin_end_auction(callback: CallbackQuery):
+async def _update_ended_channel_message(bot, auction: Auction, top_bids, bids_count: int):
+    """Обновить сообщение завершенного аукциона в канале"""
+    message_text = ""  # Инициализируем переменную
+    try:
+        # Формируем сообщение о завершенном аукционе
+        message_text = format_ended_auction_message(auction, top_bids, bids_count)
+        
+        # Обновляем сообщение в канале (без клавиатуры). Тип сообщения известен
+        # по прошлой правке или по фото аукциона, поэтому сразу вызывается нужный метод
+        await edit_channel_message(bot, auction, message_text)
+        
+        logger.info("Сообщение в канале для аукциона #%s обновлено (админское завершение)", auction.id)
+    except Exception as e:
+        logger.error("Ошибка при обновлении сообщения в канале: %s", e)
+        if message_text:
+            logger.debug("Текст сообщения: %s...", message_text[:200])
+
+async def _notify_winner(bot, auction: Auction, winner: User):
+    """Уведомить победителя и сохранить уведомление в БД"""
+    try:
+        await send_winner_notification(bot, auction, winner)
+        
+        queue_notifications([{
+            "user_id": winner.id,
+            "auction_id": auction.id,
+            "message": f"Вы выиграли аукцион '{auction.title}'! Сумма: {auction.current_price} ₽"
+        }])
+    except Exception as e:
+        logger.error("Ошибка при уведомлении победителя: %s", e)
+
+@router.callback_query(AdminAction.filter(F.action == "end"))
+async def admin_end_auction(callback: CallbackQuery, callback_data: AdminAction):
     """Завершить аукцион досрочно"""
-    if not is_admin(callback.from_user.id):
-        await callback.answer("Нет прав!", show_alert=True)
-        return
-    
-    auction_id = int(callback.data.split(":")[1])
+    auction_id = callback_data.auction_id
     
     async with get_db() as session:
         async with session.begin():
-            stmt = select(Auction).where(Auction.id == auction_id)
-            result = await session.execute(stmt)
-            auction = result.scalar_one_or_none()
-            
-            if not auction:
-                await callback.answer("Аукцион не найден!", show_alert=True)
-                return
-            
-            if auction.status != 'active':
-                await callback.answer("Аукцион уже завершён!", show_alert=True)
-                return
-            
-            auction.status = 'ended'
-            auction.ended_at = datetime.datetime.utcnow()
-            
-            stmt_bids = select(Bid).where(Bid.auction_id == auction_id).order_by(desc(Bid.amount)).limit(1)
-            result_bids = await session.execute(stmt_bids)
-            winner_bid = result_bids.scalar_one_or_none()
+            # Топ-3 ставки с пользователями и общее число ставок одним запросом:
+            # пользователи приходят через JOIN, без отдельного SELECT по users
+            stmt_top_bids = select(Bid, func.count().over()).join(Bid.user).where(
+                Bid.auction_id == auction_id
+            ).order_by(desc(Bid.amount)).limit(3).options(
+                contains_eager(Bid.user)
+            )
+            result_top = await session.execute(stmt_top_bids)
+            rows = result_top.all()
+            top_bids = [bid for bid, _ in rows]
+            bids_count = rows[0][1] if rows else 0
+            winner_bid = top_bids[0] if top_bids else None
             
+            values = {'status': 'ended', 'ended_at': utcnow()}
             if winner_bid:
-                auction.winner_id = winner_bid.user_id
-                auction.current_price = winner_bid.amount
-        
-        # Получаем данные для обновления сообщения
-        stmt_full = select(Auction).where(Auction.id == auction_id).options(
-            selectinload(Auction.winner)
-        )
-        result_full = await session.execute(stmt_full)
-        full_auction = result_full.scalar_one()
-        
-        # Получаем топ-3 ставки
-        stmt_top_bids = select(Bid).where(
-            Bid.auction_id == auction_id
-        ).order_by(desc(Bid.amount)).limit(3).options(
-            selectinload(Bid.user)
-        )
-        result_top = await session.execute(stmt_top_bids)
-        top_bids = result_top.scalars().all()
-        
-        # Получаем количество ставок
-        stmt_count = select(func.count(Bid.id)).where(Bid.auction_id == auction_id)
-        result_count = await session.execute(stmt_count)
-        bids_count = result_count.scalar()
-        
-        # Обновляем сообщение в канале
-        message_text = ""  # Инициализируем переменную
-        try:
-            # Формируем сообщение о завершенном аукционе
-            message_text = format_ended_auction_message(full_auction, top_bids, bids_count)
+                values['winner_id'] = winner_bid.user_id
+                values['current_price'] = winner_bid.amount
             
-            # Обновляем сообщение в канале (без клавиатуры)
-            try:
-                # Сначала пробуем обновить подпись (если было фото)
-                await callback.bot.edit_message_caption(
-                    chat_id=Config.CHANNEL_ID,
-                    message_id=auction.channel_message_id,
-                    caption=message_text,
-                    parse_mode='HTML'
-                )
-            except:
-                # Если не получилось (например, сообщение без фото), обновляем текст
-                await callback.bot.edit_message_text(
-                    chat_id=Config.CHANNEL_ID,
-                    message_id=auction.channel_message_id,
-                    text=message_text,
-                    parse_mode='HTML'
-                )
+            # Проверка статуса и завершение одним UPDATE ... RETURNING:
+            # аукцион, завершенный таймером в это же время, не будет завершен повторно
+            stmt = update(Auction).where(
+                Auction.id == auction_id,
+                Auction.status == 'active'
+            ).values(**values).returning(Auction)
+            auction = await session.scalar(stmt)
             
-            logger.info(f"Сообщение в канале для аукциона #{auction.id} обновлено (админское завершение)")
-        except Exception as e:
-            logger.error(f"Ошибка при обновлении сообщения в канале: {e}")
-            if message_text:
-                logger.debug(f"Текст сообщения: {message_text[:200]}...")
+            if not auction:
+                exists = await session.scalar(select(Auction.id).where(Auction.id == auction_id))
+                if exists is None:
+                    await callback.answer("Аукцион не найден!", show_alert=True)
+                else:
+                    await callback.answer("Аукцион уже завершён!", show_alert=True)
+                return
         
+        # Сообщение в канале и уведомление победителя отправляются параллельно
+        tasks = [_update_ended_channel_message(callback.bot, auction, top_bids, bids_count)]
         if winner_bid:
-            async with get_db() as inner_session:
-                stmt_winner = select(User).where(User.id == winner_bid.user_id)
-                result_winner = await inner_session.execute(stmt_winner)
-                winner = result_winner.scalar_one_or_none()
-                
-                if winner:
-                    try:
-                        await send_winner_notification(callback.bot, auction, winner)
-                        
-                        notification = Notification(
-                            user_id=winner.id,
-                            auction_id=auction_id,
-                            message=f"Вы выиграли аукцион '{auction.title}'! Сумма: {auction.current_price} ₽"
-                        )
-                        inner_session.add(notification)
-                        await inner_session.commit()
-                    except Exception as e:
-                        logger.error(f"Ошибка при уведомлении победителя: {e}")
-        
-        if auction_id in auction_timer_manager.active_timers:
-            auction_timer_manager.active_timers[auction_id].cancel()
+            tasks.append(_notify_winner(callback.bot, auction, winner_bid.user))
+        await asyncio.gather(*tasks)
+        
+        auction_timer_manager.cancel_auction_timer(auction_id)
         periodic_updater.clear_update_history(auction_id)
+        invalidate_active_auctions()
         
         await callback.message.answer(
             f"✅ Аукцион #{auction.id} завершён досрочно.\n"
@@ -535,56 +549,31 @@ async def admin_end_auction(callback: CallbackQuery):
         )
         await callback.answer("Аукцион завершён!")
 
-@router.callback_query(F.data.startswith("admin_delete:"))
-async def admin_delete_auction(callback: CallbackQuery):
+@router.callback_query(AdminAction.filter(F.action == "delete"))
+async def admin_delete_auction(callback: CallbackQuery, callback_data: AdminAction):
     """Удалить аукцион без победителя"""
-    if not is_admin(callback.from_user.id):
-        await callback.answer("Нет прав!", show_alert=True)
-        return
-    
-    auction_id = int(callback.data.split(":")[1])
+    auction_id = callback_data.auction_id
     
     async with get_db() as session:
         async with session.begin():
-            # Получаем аукцион
-            stmt = select(Auction).where(Auction.id == auction_id)
-            result = await session.execute(stmt)
-            auction = result.scalar_one_or_none()
+            # Уведомления, подписки и ставки удаляются каскадом (ON DELETE CASCADE),
+            # ID сообщения в канале возвращается тем же запросом
+            result = await session.execute(
+                delete(Auction).where(Auction.id == auction_id).returning(Auction.channel_message_id)
+            )
+            row = result.one_or_none()
             
-            if not auction:
+            if row is None:
                 await callback.answer("Аукцион не найден!", show_alert=True)
                 return
             
-            # Сохраняем ID сообщения в канале для удаления
-            channel_message_id = auction.channel_message_id
-            
-            # Удаляем все связанные записи в правильном порядке
-            # 1. Уведомления об этом аукционе
-            await session.execute(
-                delete(Notification).where(Notification.auction_id == auction_id)
-            )
-            
-            # 2. Подписки на этот аукцион
-            from database.models import AuctionSubscription
-            await session.execute(
-                delete(AuctionSubscription).where(AuctionSubscription.auction_id == auction_id)
-            )
-            
-            # 3. Ставки на этот аукцион
-            await session.execute(
-                delete(Bid).where(Bid.auction_id == auction_id)
-            )
-            
-            # 4. Сам аукцион
-            await session.execute(
-                delete(Auction).where(Auction.id == auction_id)
-            )
-            
+            channel_message_id = row.channel_message_id
+        
+        invalidate_active_auctions()
+        
         # Останавливаем таймер, если он активен
         from utils.timer import auction_timer_manager
-        if auction_id in auction_timer_manager.active_timers:
-            auction_timer_manager.active_timers[auction_id].cancel()
-            del auction_timer_manager.active_timers[auction_id]
+        auction_timer_manager.cancel_auction_timer(auction_id)
         
         # Очищаем историю обновлений
         from utils.periodic_updater import periodic_updater
@@ -596,9 +585,10 @@ async def admin_delete_auction(callback: CallbackQuery):
                 chat_id=Config.CHANNEL_ID,
                 message_id=channel_message_id
             )
-            logger.info(f"Сообщение в канале для аукциона #{auction_id} удалено")
+            logger.info("Сообщение в канале для аукциона #%s удалено", auction_id)
+            forget_channel_message(channel_message_id)
         except Exception as e:
-            logger.error(f"Ошибка при удалении сообщения в канале: {e}")
+            logger.error("Ошибка при удалении сообщения в канале: %s", e)
             # Продолжаем, даже если не удалось удалить сообщение
         
         await callback.message.answer(
@@ -607,39 +597,31 @@ async def admin_delete_auction(callback: CallbackQuery):
         )
         await callback.answer("Аукцион удалён!")
 
-@router.callback_query(F.data == "admin_limits")
-async def admin_limits(callback: CallbackQuery):
-    """Показать текущие лимиты и статистику"""
-    if not is_admin(callback.from_user.id):
-        await callback.answer("Нет прав!", show_alert=True)
-        return
+async def build_limits_text() -> str:
+    """Текст экрана лимитов: все счетчики одним запросом"""
+    day_ago = utcnow() - datetime.timedelta(hours=24)
+    # Среднее ставок на аукцион со ставками: всего ставок / число таких аукционов
+    avg_bids_subq = select(
+        func.count(Bid.id) * 1.0 / func.nullif(func.count(func.distinct(Bid.auction_id)), 0)
+    ).scalar_subquery()
+    stmt = select(
+        func.count(Auction.id).filter(Auction.status == 'active'),
+        func.count(Auction.id).filter(Auction.created_at >= day_ago),
+        avg_bids_subq
+    ).select_from(Auction)
+    
+    async with get_db_read() as session:
+        result = await session.execute(stmt)
+        active_count, today_count, avg_bids = result.one()
+    avg_bids = avg_bids or 0
     
-    async with get_db() as session:
-        # Активные аукционы
-        stmt_active = select(func.count(Auction.id)).where(Auction.status == 'active')
-        result = await session.execute(stmt_active)
-        active_count = result.scalar()
-        
-        # Всего аукционов за последние 24 часа
-        day_ago = datetime.datetime.utcnow() - datetime.timedelta(hours=24)
-        stmt_today = select(func.count(Auction.id)).where(Auction.created_at >= day_ago)
-        result = await session.execute(stmt_today)
-        today_count = result.scalar()
-        
-        # Среднее количество ставок на аукцион
-        from sqlalchemy import func
-        stmt_avg_bids = select(func.avg(func.count(Bid.id))).select_from(Bid).join(Auction).group_by(Bid.auction_id)
-        result = await session.execute(stmt_avg_bids)
-        avg_bids_result = result.scalar_one_or_none()
-        avg_bids = avg_bids_result or 0
-        
-        limits_text = f"""
+    return f"""
 📊 <b>Лимиты и статистика</b>
 
 🏷 <b>Аукционы:</b>
-• Активных: {active_count}/20
+• Активных: {active_count}/{MAX_ACTIVE_AUCTIONS}
 • Создано за 24ч: {today_count}
-• Среднее время аукциона: {Config.BID_TIMEOUT_MINUTES // 60} ч
+• Среднее время аукциона: {Config.BID_TIMEOUT_HOURS} ч
 
 👥 <b>Активность:</b>
 • Среднее ставок на аукцион: {avg_bids:.1f}
@@ -656,17 +638,17 @@ async def admin_limits(callback: CallbackQuery):
 • Таймер: {Config.BID_TIMEOUT_MINUTES} минут
 • Шаг ставки: {Config.BID_STEP_PERCENT}%
 """
-        
-        await callback.message.answer(limits_text, parse_mode="HTML", reply_markup=get_admin_limits_keyboard())
-        await callback.answer()
+
+@router.callback_query(F.data == "admin_limits")
+async def admin_limits(callback: CallbackQuery):
+    """Показать текущие лимиты и статистику"""
+    limits_text = await build_limits_text()
+    await callback.message.answer(limits_text, parse_mode="HTML", reply_markup=get_admin_limits_keyboard())
+    await callback.answer()
 
 @router.message(Command("fix_channel"))
 async def cmd_fix_channel(message: Message):
     """Исправить все сообщения в канале"""
-    if not is_admin(message.from_user.id):
-        await message.answer("⛔ У вас нет прав администратора!")
-        return
-    
     await message.answer("🔄 Начинаю исправление всех сообщений в канале...")
     
     try:
@@ -680,7 +662,7 @@ async def cmd_fix_channel(message: Message):
             await message.answer("❌ Не удалось инициализировать ChannelUpdater")
             
     except Exception as e:
-        logger.error(f"Ошибка при исправлении канала: {e}")
+        logger.error("Ошибка при исправлении канала: %s", e)
         await message.answer(f"❌ Ошибка: {str(e)}")
 
 # ============== ДОБАВЛЕННЫЕ ОБРАБОТЧИКИ ДЛЯ КНОПОК ==============
@@ -688,10 +670,6 @@ async def cmd_fix_channel(message: Message):
 @router.callback_query(F.data == "admin_back_menu")
 async def admin_back_menu(callback: CallbackQuery):
     """Возврат в главное меню админа"""
-    if not is_admin(callback.from_user.id):
-        await callback.answer("Нет прав!", show_alert=True)
-        return
-    
     await callback.message.edit_text(
         "👑 Панель администратора\n\n"
         "Выберите действия:",
@@ -702,10 +680,6 @@ async def admin_back_menu(callback: CallbackQuery):
 @router.callback_query(F.data == "admin_back")
 async def admin_back(callback: CallbackQuery):
     """Назад в панель админа"""
-    if not is_admin(callback.from_user.id):
-        await callback.answer("Нет прав!", show_alert=True)
-        return
-    
     await callback.message.answer(
         "👑 Панель администратора\n\n"
         "Выберите действия:",
@@ -716,63 +690,13 @@ async def admin_back(callback: CallbackQuery):
 @router.callback_query(F.data == "admin_limits_stats")
 async def admin_limits_stats(callback: CallbackQuery):
     """Статистика лимитов"""
-    if not is_admin(callback.from_user.id):
-        await callback.answer("Нет прав!", show_alert=True)
-        return
-    
-    async with get_db() as session:
-        # Активные аукционы
-        stmt_active = select(func.count(Auction.id)).where(Auction.status == 'active')
-        result = await session.execute(stmt_active)
-        active_count = result.scalar()
-        
-        # Всего аукционов за последние 24 часа
-        day_ago = datetime.datetime.utcnow() - datetime.timedelta(hours=24)
-        stmt_today = select(func.count(Auction.id)).where(Auction.created_at >= day_ago)
-        result = await session.execute(stmt_today)
-        today_count = result.scalar()
-        
-        # Среднее количество ставок на аукцион
-        from sqlalchemy import func
-        stmt_avg_bids = select(func.avg(func.count(Bid.id))).select_from(Bid).join(Auction).group_by(Bid.auction_id)
-        result = await session.execute(stmt_avg_bids)
-        avg_bids_result = result.scalar_one_or_none()
-        avg_bids = avg_bids_result or 0
-        
-        limits_text = f"""
-📊 <b>Лимиты и статистика</b>
-
-🏷 <b>Аукционы:</b>
-• Активных: {active_count}/20
-• Создано за 24ч: {today_count}
-• Среднее время аукциона: {Config.BID_TIMEOUT_MINUTES // 60} ч
-
-👥 <b>Активность:</b>
-• Среднее ставок на аукцион: {avg_bids:.1f}
-• Ограничение ставок: 1 в 3 секунды
-• Макс. фото: 1 на аукцион
-
-💰 <b>Финансовые лимиты:</b>
-• Мин. цена: 1 ₽
-• Макс. цена: 1 000 000 000 ₽
-• Мин. шаг: 1% от цены
-• Макс. шаг: 10% от цены
-
-🔧 <b>Системные настройки:</b>
-• Таймер: {Config.BID_TIMEOUT_MINUTES} минут
-• Шаг ставки: {Config.BID_STEP_PERCENT}%
-"""
-        
-        await callback.message.edit_text(limits_text, parse_mode="HTML", reply_markup=get_admin_limits_keyboard())
-        await callback.answer()
+    limits_text = await build_limits_text()
+    await callback.message.edit_text(limits_text, parse_mode="HTML", reply_markup=get_admin_limits_keyboard())
+    await callback.answer()
 
 @router.callback_query(F.data == "admin_limits_edit")
 async def admin_limits_edit(callback: CallbackQuery):
     """Изменение лимитов"""
-    if not is_admin(callback.from_user.id):
-        await callback.answer("Нет прав!", show_alert=True)
-        return
-    
     await callback.message.edit_text(
         "⚙️ <b>Изменение лимитов</b>\n\n"
         "Функция в разработке...\n\n"
@@ -787,10 +711,6 @@ async def admin_limits_edit(callback: CallbackQuery):
 @router.callback_query(F.data == "admin_actions_log")
 async def admin_actions_log(callback: CallbackQuery):
     """Логи действий"""
-    if not is_admin(callback.from_user.id):
-        await callback.answer("Нет прав!", show_alert=True)
-        return
-    
     await callback.message.edit_text(
         "📋 <b>Логи действий</b>\n\n"
         "Последние 10 действий:\n"
@@ -807,11 +727,7 @@ async def admin_actions_log(callback: CallbackQuery):
 @router.callback_query(F.data == "admin_users")
 async def admin_users(callback: CallbackQuery):
     """Управление пользователями"""
-    if not is_admin(callback.from_user.id):
-        await callback.answer("Нет прав!", show_alert=True)
-        return
-    
-    async with get_db() as session:
+    async with get_db_read() as session:
         stmt_total = select(func.count(User.id))
         result_total = await session.execute(stmt_total)
         total_users = result_total.scalar()
@@ -821,7 +737,7 @@ async def admin_users(callback: CallbackQuery):
         confirmed_users = result_confirmed.scalar()
         
         stmt_today = select(func.count(User.id)).where(
-            User.created_at >= datetime.datetime.utcnow() - datetime.timedelta(hours=24)
+            User.created_at >= utcnow() - datetime.timedelta(hours=24)
         )
         result_today = await session.execute(stmt_today)
         today_users = result_today.scalar()
@@ -840,11 +756,7 @@ async def admin_users(callback: CallbackQuery):
 @router.callback_query(F.data == "admin_finance")
 async def admin_finance(callback: CallbackQuery):
     """Финансы"""
-    if not is_admin(callback.from_user.id):
-        await callback.answer("Нет прав!", show_alert=True)
-        return
-    
-    async with get_db() as session:
+    async with get_db_read() as session:
         stmt_total = select(func.sum(Auction.current_price)).where(Auction.status == 'ended')
         result_total = await session.execute(stmt_total)
         total_money = result_total.scalar() or 0
@@ -871,10 +783,6 @@ async def admin_finance(callback: CallbackQuery):
 @router.callback_query(F.data == "admin_settings")
 async def admin_settings(callback: CallbackQuery):
     """Настройки"""
-    if not is_admin(callback.from_user.id):
-        await callback.answer("Нет прав!", show_alert=True)
-        return
-    
     await callback.message.edit_text(
         f"⚙️ <b>Настройки бота</b>\n\n"
         f"Текущие настройки:\n"
@@ -891,10 +799,6 @@ async def admin_settings(callback: CallbackQuery):
 @router.callback_query(F.data == "admin_charts")
 async def admin_charts(callback: CallbackQuery):
     """Графики статистики"""
-    if not is_admin(callback.from_user.id):
-        await callback.answer("Нет прав!", show_alert=True)
-        return
-    
     await callback.message.edit_text(
         "📈 <b>Графики статистики</b>\n\n"
         "Функция графиков в разработке...\n"
@@ -907,10 +811,6 @@ async def admin_charts(callback: CallbackQuery):
 @router.callback_query(F.data == "admin_export")
 async def admin_export(callback: CallbackQuery):
     """Экспорт данных"""
-    if not is_admin(callback.from_user.id):
-        await callback.answer("Нет прав!", show_alert=True)
-        return
-    
     await callback.message.edit_text(
         "📋 <b>Экспорт данных</b>\n\n"
         "Функция экспорта в разработке...\n"
@@ -920,30 +820,20 @@ async def admin_export(callback: CallbackQuery):
     )
     await callback.answer()
 
-@router.callback_query(F.data.startswith("admin_edit:"))
-async def admin_edit_auction(callback: CallbackQuery):
+@router.callback_query(AdminAction.filter(F.action == "edit"))
+async def admin_edit_auction(callback: CallbackQuery, callback_data: AdminAction):
     """Редактировать лот (заглушка)"""
-    if not is_admin(callback.from_user.id):
-        await callback.answer("Нет прав!", show_alert=True)
-        return
-    
-    auction_id = int(callback.data.split(":")[1])
+    auction_id = callback_data.auction_id
     await callback.message.answer(f"✏️ Редактирование аукциона #{auction_id} (функция в разработке)")
     await callback.answer()
 
-@router.callback_query(F.data.startswith("admin_stats:"))
-async def admin_stats_auction(callback: CallbackQuery):
+@router.callback_query(AdminAction.filter(F.action == "stats"))
+async def admin_stats_auction(callback: CallbackQuery, callback_data: AdminAction):
     """Статистика по аукциону"""
-    if not is_admin(callback.from_user.id):
-        await callback.answer("Нет прав!", show_alert=True)
-        return
-    
-    auction_id = int(callback.data.split(":")[1])
+    auction_id = callback_data.auction_id
     
-    async with get_db() as session:
-        stmt = select(Auction).where(Auction.id == auction_id)
-        result = await session.execute(stmt)
-        auction = result.scalar_one_or_none()
+    async with get_db_read() as session:
+        auction = await session.get(Auction, auction_id)
         
         if not auction:
             await callback.answer("Аукцион не найден!", show_alert=True)
@@ -974,13 +864,9 @@ async def admin_stats_auction(callback: CallbackQuery):
         await callback.message.answer(stats_text, parse_mode="HTML")
         await callback.answer()
 
-@router.callback_query(F.data.startswith("admin_announce:"))
-async def admin_announce_auction(callback: CallbackQuery):
+@router.callback_query(AdminAction.filter(F.action == "announce"))
+async def admin_announce_auction(callback: CallbackQuery, callback_data: AdminAction):
     """Анонсировать аукцион"""
-    if not is_admin(callback.from_user.id):
-        await callback.answer("Нет прав!", show_alert=True)
-        return
-    
-    auction_id = int(callback.data.split(":")[1])
+    auction_id = callback_data.auction_id
     await callback.message.answer(f"📢 Анонсирование аукциона #{auction_id} (функция в разработке)")
     await callback.answer()
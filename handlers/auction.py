@@ -1,124 +1,168 @@
-from aiogram import Router, F
+from aiogram import Router
 from aiogram.types import CallbackQuery
-from sqlalchemy import select, desc, func
-from sqlalchemy.orm import selectinload, joinedload
-import datetime
+from sqlalchemy import bindparam, select, desc, func, insert, update
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import aliased, contains_eager
+from sqlalchemy.orm.attributes import set_committed_value
 import logging
 import traceback
 import asyncio
-import json  # Импорт уже есть и он используется
+import random
 
-from database.database import get_db
-from database.models import Auction, Bid, User, AuctionSubscription, Notification
-from keyboards.inline import get_channel_auction_keyboard, get_bot_auction_keyboard, get_auction_history_keyboard
+from database.database import get_db, get_db_read, db_utcnow, is_transient_db_error
+from database.models import Auction, Bid, User, AuctionSubscription
+from keyboards.inline import get_bot_auction_keyboard, get_auction_history_keyboard, BidCallback, Top3Callback, HistoryCallback, SubscribeCallback, BackToAuctionCallback
 from utils.formatters import format_auction_message, format_ended_auction_message, format_bid_history, format_username, format_time_ago
-from utils.notifications import send_outbid_notification, send_subscription_notification
+from utils.notifications import send_outbid_notification, send_subscription_notification, queue_notifications
 from config import Config
 from utils.timer import auction_timer_manager
 from utils.periodic_updater import periodic_updater
+from utils.active_auctions import invalidate_active_auctions
+
+# INSERT с поддержкой ON CONFLICT для используемой СУБД
+if make_url(Config.DATABASE_URL).get_backend_name() == "sqlite":
+    from sqlalchemy.dialects.sqlite import insert as upsert
+else:
+    from sqlalchemy.dialects.postgresql import insert as upsert
 
 router = Router()
 logger = logging.getLogger(__name__)
 
+# Запросы транзакции ставки собираются один раз при импорте: значения
+# передаются параметрами при выполнении, а скомпилированный SQL каждый раз
+# берется из кэша движка без повторной сборки выражений
+
+# Аукцион, пользователь и текущий лидер (для уведомления о перебитии) одним
+# запросом; лидер берется по первичному ключу из auctions.top_bidder_id
+_previous_leader = aliased(User)
+_LOCK_AUCTION_FOR_BID = select(Auction, User, _previous_leader).select_from(Auction).outerjoin(
+    User, User.telegram_id == bindparam('telegram_id')
+).outerjoin(
+    _previous_leader, _previous_leader.id == Auction.top_bidder_id
+).where(
+    Auction.id == bindparam('auction_id'),
+    Auction.status == 'active'
+).with_for_update(of=Auction)
+
+# Условный UPDATE: все проверки ставки повторяются в WHERE, поэтому
+# параллельная ставка (другого пользователя или этого же с другого
+# устройства) не пройдет и строка не изменится. Время ставки и новый срок
+# считает СУБД; срок возвращается через RETURNING для таймера
+_RAISE_AUCTION_PRICE = update(Auction).where(
+    Auction.id == bindparam('auction_id'),
+    Auction.status == 'active',
+    Auction.current_price + Auction.step_price <= bindparam('amount'),
+    Auction.top_bidder_id.is_distinct_from(bindparam('user_id'))
+).values(
+    current_price=bindparam('amount'),
+    top_bidder_id=bindparam('user_id'),
+    last_bid_time=db_utcnow(),
+    ends_at=db_utcnow(Config.BID_TIMEOUT_MINUTES)
+).returning(Auction.last_bid_time, Auction.ends_at).execution_options(
+    synchronize_session=False
+)
+
+# Core INSERT: объект Bid дальше не нужен
+_INSERT_BID = insert(Bid).values(
+    auction_id=bindparam('auction_id'),
+    user_id=bindparam('user_id'),
+    amount=bindparam('amount')
+)
+
 async def process_bid_safe(auction_id: int, user_id: int, amount: float, bot):
     """Безопасная обработка ставки с защитой от гонок"""
-    max_retries = 3
-    retry_delay = 0.1
+    max_retries = Config.BID_RETRY_ATTEMPTS
+    retry_delay = 0.05
     
     for attempt in range(max_retries):
         try:
             async with get_db() as session:
                 async with session.begin():
-                    # Блокируем аукцион для обновления
-                    stmt = select(Auction).where(
-                        Auction.id == auction_id, 
-                        Auction.status == 'active'
-                    ).with_for_update()
-                    
-                    result = await session.execute(stmt)
-                    auction = result.scalar_one_or_none()
+                    result = await session.execute(
+                        _LOCK_AUCTION_FOR_BID, {"telegram_id": user_id, "auction_id": auction_id}
+                    )
+                    row = result.one_or_none()
                     
-                    if not auction:
+                    if not row:
                         return {"success": False, "message": "Аукцион не найден или завершен!"}
                     
-                    # Получаем пользователя
-                    stmt_user = select(User).where(User.telegram_id == user_id)
-                    result_user = await session.execute(stmt_user)
-                    user = result_user.scalar_one_or_none()
+                    auction, user, leader = row
                     
                     if not user or not user.is_confirmed:
                         return {"success": False, "message": "Вы не подтвердили правила! Напишите /start боту для подтверждения."}
                     
-                    # Проверяем минимальную ставку
+                    # Быстрый отказ по уже прочитанной цене; окончательная проверка
+                    # выполняется условным UPDATE ниже
                     min_next_bid = auction.current_price + auction.step_price
                     if amount < min_next_bid:
                         return {"success": False, "message": f"Минимальная ставка: {min_next_bid} ₽"}
                     
                     # ВОССТАНОВЛЕНА ПРОВЕРКА: пользователь не может ставить, если уже лидирует
-                    # Получаем текущую лучшую ставку
-                    stmt_top_bid = select(Bid).where(
-                        Bid.auction_id == auction_id
-                    ).order_by(desc(Bid.amount)).limit(1)
-                    
-                    result_top_bid = await session.execute(stmt_top_bid)
-                    top_bid = result_top_bid.scalar_one_or_none()
-                    
-                    # Если есть лучшая ставка и она от этого пользователя
-                    if top_bid and top_bid.user_id == user.id:
+                    if auction.top_bidder_id == user.id:
                         return {"success": False, "message": "Вы уже лидируете в этом аукционе! Дождитесь, пока кто-то перебьет вашу ставку."}
                     
-                    # Создаем ставку
-                    bid = Bid(
-                        auction_id=auction_id,
-                        user_id=user.id,
-                        amount=amount
-                    )
-                    session.add(bid)
+                    # Обновляем аукцион одним условным UPDATE
+                    bid_params = {"auction_id": auction_id, "user_id": user.id, "amount": amount}
+                    result_raise = await session.execute(_RAISE_AUCTION_PRICE, bid_params)
+                    raised = result_raise.one_or_none()
                     
-                    # Обновляем аукцион
-                    auction.current_price = amount
-                    auction.last_bid_time = datetime.datetime.utcnow()
-                    auction.ends_at = auction.last_bid_time + datetime.timedelta(minutes=Config.BID_TIMEOUT_MINUTES)
+                    if raised is None:
+                        # Выясняем, какая из проверок не прошла
+                        await session.refresh(auction)
+                        if auction.status != 'active':
+                            return {"success": False, "message": "Аукцион не найден или завершен!"}
+                        if auction.top_bidder_id == user.id:
+                            return {"success": False, "message": "Вы уже лидируете в этом аукционе! Дождитесь, пока кто-то перебьет вашу ставку."}
+                        min_next_bid = auction.current_price + auction.step_price
+                        return {"success": False, "message": f"Ставку уже перебили. Минимальная ставка: {min_next_bid} ₽"}
                     
-                    # Получаем предыдущую лучшую ставку (для уведомления)
-                    stmt_prev_top = select(Bid).where(
-                        Bid.auction_id == auction_id,
-                        Bid.user_id != user.id
-                    ).order_by(desc(Bid.amount)).limit(1)
+                    # Переносим новые значения в загруженный объект без повторного
+                    # UPDATE при коммите: они нужны уведомлениям и таймеру
+                    set_committed_value(auction, 'current_price', amount)
+                    set_committed_value(auction, 'top_bidder_id', user.id)
+                    set_committed_value(auction, 'last_bid_time', raised.last_bid_time)
+                    set_committed_value(auction, 'ends_at', raised.ends_at)
                     
-                    result_prev_top = await session.execute(stmt_prev_top)
-                    previous_top_bid = result_prev_top.scalar_one_or_none()
+                    # Создаем ставку
+                    await session.execute(_INSERT_BID, bid_params)
                     
-                    # Возвращаем данные для дальнейшей обработки
+                    # Возвращаем данные для дальнейшей обработки; лидер до этой
+                    # ставки - другой пользователь (свою ставку перебивать нельзя)
                     return {
                         "success": True,
                         "auction": auction,
-                        "bid": bid,
                         "user": user,
-                        "previous_top_bid": previous_top_bid
+                        "previous_leader": leader
                     }
                     
-        except Exception as e:
-            logger.error(f"Попытка {attempt + 1} неудачна: {e}")
+        except DBAPIError as e:
+            # Повторяем только конфликт блокировок; остальные ошибки повтором не исправить
+            if not is_transient_db_error(e):
+                logger.error("Ошибка БД при обработке ставки: %s", e)
+                return {"success": False, "message": "Ошибка при обработке ставки. Попробуйте еще раз."}
+            logger.warning("Попытка %s неудачна: %s", attempt + 1, e)
             if attempt < max_retries - 1:
-                await asyncio.sleep(retry_delay * (2 ** attempt))  # Экспоненциальная задержка
+                # Экспоненциальная задержка со случайным разбросом, чтобы
+                # столкнувшиеся ставки не повторялись одновременно
+                await asyncio.sleep(random.uniform(0, retry_delay * (2 ** attempt)))
                 continue
             else:
-                logger.error(f"Не удалось обработать ставку после {max_retries} попыток")
+                logger.error("Не удалось обработать ставку после %s попыток", max_retries)
                 return {"success": False, "message": "Ошибка при обработке ставки. Попробуйте еще раз."}
+        except Exception as e:
+            logger.error("Ошибка при обработке ставки: %s", e, exc_info=True)
+            return {"success": False, "message": "Ошибка при обработке ставки. Попробуйте еще раз."}
     
     return {"success": False, "message": "Ошибка при обработке ставки"}
 
-@router.callback_query(F.data.startswith("bid:"))
-async def process_bid(callback: CallbackQuery):
+@router.callback_query(BidCallback.filter())
+async def process_bid(callback: CallbackQuery, callback_data: BidCallback):
     """Обработка ставки пользователя"""
+    auction_id = callback_data.auction_id
+    amount = callback_data.amount
     try:
-        # Парсим данные
-        _, auction_id_str, amount_str = callback.data.split(":")
-        auction_id = int(auction_id_str)
-        amount = float(amount_str)
-        
-        logger.info(f"Новая ставка: аукцион={auction_id}, сумма={amount}, пользователь={callback.from_user.id}")
+        logger.info("Новая ставка: аукцион=%s, сумма=%s, пользователь=%s", auction_id, amount, callback.from_user.id)
         
         # Обрабатываем ставку
         result = await process_bid_safe(
@@ -132,91 +176,72 @@ async def process_bid(callback: CallbackQuery):
             await callback.answer(result["message"], show_alert=True)
             return
         
+        # Ставка уже зафиксирована в БД: отвечаем сразу, а таймер и рассылку
+        # делаем после ответа (aiogram обрабатывает каждое обновление
+        # отдельной задачей, так что остальные нажатия их не ждут)
+        try:
+            await callback.answer(f"✅ Ваша ставка {amount} ₽ принята!")
+        except Exception as e:
+            logger.warning("Не удалось ответить на ставку: %s", e)
+        
         # Успешная ставка - выполняем дополнительные действия
         auction = result["auction"]
         user = result["user"]
-        previous_top_bid = result["previous_top_bid"]
+        previous_leader = result["previous_leader"]
+        
+        # Цена и число ставок в списке /auctions изменились
+        invalidate_active_auctions()
+        
+        # Запись о ставке в истории уведомлений сохраняется общей пачкой,
+        # вне транзакции ставки
+        queue_notifications([{
+            "user_id": user.id,
+            "auction_id": auction_id,
+            "message": f"Вы сделали ставку {amount} ₽ в аукционе '{auction.title}'"
+        }])
         
         try:
-            # Получаем данные для обновления сообщения
-            async with get_db() as session:
-                # Получаем топ-3 ставки
-                stmt_top_bids = select(Bid).where(
-                    Bid.auction_id == auction_id
-                ).order_by(desc(Bid.amount)).limit(3).options(
-                    selectinload(Bid.user)
-                )
-                result_top = await session.execute(stmt_top_bids)
-                top_bids = result_top.scalars().all()
-                
-                # Получаем количество ставок
-                stmt_count = select(func.count(Bid.id)).where(Bid.auction_id == auction_id)
-                result_count = await session.execute(stmt_count)
-                bids_count = result_count.scalar()
-                
-                # Обновляем сообщение в канале
-                await update_channel_message(callback.bot, auction, top_bids, bids_count)
-                
-                # Отправляем уведомление предыдущему лидеру (если он не текущий пользователь)
-                if previous_top_bid and previous_top_bid.user_id != user.id:
-                    try:
-                        stmt_prev_user = select(User).where(User.id == previous_top_bid.user_id)
-                        result_prev_user = await session.execute(stmt_prev_user)
-                        prev_user = result_prev_user.scalar_one_or_none()
-                        
-                        if prev_user:
-                            await send_outbid_notification(callback.bot, prev_user, auction, amount)
-                    except Exception as e:
-                        logger.error(f"Ошибка при отправке уведомления о перебитии: {e}")
-                
-                # Уведомляем подписчиков (кроме сделавшего ставку)
-                try:
-                    await send_subscription_notification(callback.bot, auction, user, amount)
-                except Exception as e:
-                    logger.error(f"Ошибка при уведомлении подписчиков: {e}")
-                
-                # Создаем уведомление для пользователя
-                notification = Notification(
-                    user_id=user.id,
-                    auction_id=auction_id,
-                    message=f"Вы сделали ставку {amount} ₽ в аукционе '{auction.title}'"
-                )
-                session.add(notification)
-                await session.commit()
-                
-                # Запускаем/обновляем таймер
+            # Продлеваем таймер; полный запуск с проверкой в БД нужен,
+            # только если таймера для аукциона еще нет
+            if not auction_timer_manager.extend_auction_timer(auction_id, auction.ends_at):
                 await auction_timer_manager.start_auction_timer(auction_id, auction.ends_at)
-                
-                # Немедленно обновляем в канале
-                await periodic_updater.force_update_auction(auction_id)
-                
+            
+            # Сообщение в канале обновится в ближайшем окне; серия ставок
+            # подряд дает одну правку с последней ценой
+            periodic_updater.schedule_update(auction_id)
+            
+            # Уведомляем подписчиков (кроме сделавшего ставку) и предыдущего
+            # лидера, если это другой пользователь; он загружен в process_bid_safe
+            notifications = [send_subscription_notification(callback.bot, auction, user, amount)]
+            if previous_leader and previous_leader.id != user.id:
+                notifications.append(
+                    send_outbid_notification(callback.bot, previous_leader, auction, amount)
+                )
+            await asyncio.gather(*notifications)
+            
         except Exception as e:
-            logger.error(f"Ошибка после успешной ставки: {e}")
+            logger.error("Ошибка после успешной ставки: %s", e)
         
-        await callback.answer(f"✅ Ваша ставка {amount} ₽ принята!")
-        
-    except ValueError as e:
-        logger.error(f"Неверный формат данных: {e}")
-        await callback.answer("Ошибка формата данных", show_alert=True)
     except Exception as e:
-        logger.error(f"Неожиданная ошибка при обработке ставки: {e}")
+        logger.error("Неожиданная ошибка при обработке ставки: %s", e)
         logger.error(traceback.format_exc())
         await callback.answer("Ошибка при обработке ставки", show_alert=True)
 
-@router.callback_query(F.data.startswith("top3:"))
-async def show_top3_bids(callback: CallbackQuery):
+@router.callback_query(Top3Callback.filter())
+async def show_top3_bids(callback: CallbackQuery, callback_data: Top3Callback):
     """Показать топ-3 ставки"""
-    auction_id = int(callback.data.split(":")[1])
+    auction_id = callback_data.auction_id
     
-    async with get_db() as session:
-        stmt = select(Bid).where(
+    async with get_db_read() as session:
+        # Только нужные для текста поля, без ORM-объектов ставок и пользователей
+        stmt = select(
+            Bid.amount, Bid.created_at, User.username, User.first_name
+        ).join(Bid.user).where(
             Bid.auction_id == auction_id
-        ).order_by(desc(Bid.amount)).limit(3).options(
-            selectinload(Bid.user)
-        )
+        ).order_by(desc(Bid.amount)).limit(3)
         
         result = await session.execute(stmt)
-        top_bids = result.scalars().all()
+        top_bids = result.all()
         
         if not top_bids:
             await callback.answer("Нет ставок!", show_alert=True)
@@ -227,27 +252,28 @@ async def show_top3_bids(callback: CallbackQuery):
         for i, bid in enumerate(top_bids):
             if i < len(places):
                 emoji = places[i]
-                username = format_username(bid.user)
+                username = format_username(bid)
                 time_ago = format_time_ago(bid.created_at)
                 text += f"{emoji} {username}: {bid.amount} ₽ ({time_ago})\n"
         
         await callback.message.answer(text, parse_mode="HTML")
         await callback.answer()
 
-@router.callback_query(F.data.startswith("history:"))
-async def show_bid_history(callback: CallbackQuery):
+@router.callback_query(HistoryCallback.filter())
+async def show_bid_history(callback: CallbackQuery, callback_data: HistoryCallback):
     """Показать историю ставок"""
-    auction_id = int(callback.data.split(":")[1])
+    auction_id = callback_data.auction_id
     
-    async with get_db() as session:
-        stmt = select(Bid).where(
+    async with get_db_read() as session:
+        # Только нужные для текста поля, без ORM-объектов ставок и пользователей
+        stmt = select(
+            Bid.amount, Bid.created_at, User.username, User.first_name
+        ).join(Bid.user).where(
             Bid.auction_id == auction_id
-        ).order_by(desc(Bid.created_at)).limit(20).options(
-            selectinload(Bid.user)
-        )
+        ).order_by(desc(Bid.created_at)).limit(20)
         
         result = await session.execute(stmt)
-        bids = result.scalars().all()
+        bids = result.all()
         
         if not bids:
             await callback.answer("История ставок пуста!", show_alert=True)
@@ -262,65 +288,59 @@ async def show_bid_history(callback: CallbackQuery):
         )
         await callback.answer()
 
-@router.callback_query(F.data.startswith("subscribe:"))
-async def subscribe_to_auction(callback: CallbackQuery):
+@router.callback_query(SubscribeCallback.filter())
+async def subscribe_to_auction(callback: CallbackQuery, callback_data: SubscribeCallback, user: User):
     """Подписаться на уведомления об аукционе"""
-    auction_id = int(callback.data.split(":")[1])
+    auction_id = callback_data.auction_id
     
+    # Пользователя передает CombinedMiddleware из своего кэша, запрос к users не нужен
     async with get_db() as session:
-        stmt_user = select(User).where(User.telegram_id == callback.from_user.id)
-        result_user = await session.execute(stmt_user)
-        user = result_user.scalar_one_or_none()
-        
         if not user:
             await callback.answer("Сначала напишите /start!", show_alert=True)
             return
         
-        stmt_sub = select(AuctionSubscription).where(
-            AuctionSubscription.auction_id == auction_id,
-            AuctionSubscription.user_id == user.id
-        )
+        # Проверка и вставка одним запросом: повторное нажатие упирается
+        # в уникальный индекс (auction_id, user_id) и ничего не возвращает
+        stmt_sub = upsert(AuctionSubscription).values(
+            auction_id=auction_id,
+            user_id=user.id
+        ).on_conflict_do_nothing(
+            index_elements=['auction_id', 'user_id']
+        ).returning(AuctionSubscription.id)
         result_sub = await session.execute(stmt_sub)
-        existing_sub = result_sub.scalar_one_or_none()
+        subscription_id = result_sub.scalar_one_or_none()
         
-        if existing_sub:
+        if subscription_id is None:
             await callback.answer("Вы уже подписаны на этот аукцион!", show_alert=True)
             return
         
-        subscription = AuctionSubscription(
-            auction_id=auction_id,
-            user_id=user.id
-        )
-        session.add(subscription)
         await session.commit()
         
         await callback.answer("✅ Вы подписались на уведомления об этом аукционе!")
 
-@router.callback_query(F.data.startswith("back_to_auction:"))
-async def back_to_auction(callback: CallbackQuery):
+@router.callback_query(BackToAuctionCallback.filter())
+async def back_to_auction(callback: CallbackQuery, callback_data: BackToAuctionCallback):
     """Вернуться к аукциону"""
-    auction_id = int(callback.data.split(":")[1])
+    auction_id = callback_data.auction_id
     
-    async with get_db() as session:
-        stmt = select(Auction).where(Auction.id == auction_id)
-        result = await session.execute(stmt)
-        auction = result.scalar_one_or_none()
+    async with get_db_read() as session:
+        auction = await session.get(Auction, auction_id)
         
         if not auction:
             await callback.answer("Аукцион не найден!", show_alert=True)
             return
         
-        stmt_top_bids = select(Bid).where(
+        # Топ-3 ставки с пользователями и общее число ставок одним запросом;
+        # у пользователей читаются только поля, нужные для имени
+        stmt_top_bids = select(Bid, func.count().over()).join(Bid.user).where(
             Bid.auction_id == auction_id
         ).order_by(desc(Bid.amount)).limit(3).options(
-            selectinload(Bid.user)
+            contains_eager(Bid.user).load_only(User.username, User.first_name)
         )
         result_top = await session.execute(stmt_top_bids)
-        top_bids = result_top.scalars().all()
-        
-        stmt_count = select(func.count(Bid.id)).where(Bid.auction_id == auction_id)
-        result_count = await session.execute(stmt_count)
-        bids_count = result_count.scalar()
+        rows = result_top.all()
+        top_bids = [bid for bid, _ in rows]
+        bids_count = rows[0][1] if rows else 0
         
         if auction.status == 'ended':
             message_text = format_ended_auction_message(auction, top_bids, bids_count)
@@ -340,77 +360,3 @@ async def back_to_auction(callback: CallbackQuery):
                 parse_mode="HTML"
             )
         await callback.answer()
-
-async def update_channel_message(bot, auction: Auction, top_bids=None, bids_count=0):
-    """Обновление сообщения в канале (ТОЛЬКО редактирование)"""
-    
-    if auction.status == 'ended':
-        message_text = format_ended_auction_message(auction, top_bids, bids_count)
-    else:
-        message_text = format_auction_message(auction, top_bids, bids_count)
-    
-    if auction.status == 'active':
-        next_bid_amount = auction.current_price + auction.step_price
-        
-        try:
-            # Пытаемся определить, есть ли фото
-            has_photo = False
-            try:
-                if auction.photos:
-                    photos_list = json.loads(auction.photos)
-                    has_photo = bool(photos_list and photos_list[0])
-            except:
-                pass
-            
-            # Добавляем небольшую задержку
-            await asyncio.sleep(0.5)
-            
-            if has_photo:
-                await bot.edit_message_caption(
-                    chat_id=Config.CHANNEL_ID,
-                    message_id=auction.channel_message_id,
-                    caption=message_text,
-                    reply_markup=get_channel_auction_keyboard(auction.id, next_bid_amount),
-                    parse_mode='HTML'
-                )
-            else:
-                await bot.edit_message_text(
-                    chat_id=Config.CHANNEL_ID,
-                    message_id=auction.channel_message_id,
-                    text=message_text,
-                    reply_markup=get_channel_auction_keyboard(auction.id, next_bid_amount),
-                    parse_mode='HTML'
-                )
-        except Exception as e:
-            logger.error(f"Ошибка при обновлении сообщения в канале: {e}")
-            # Не делаем повторных попыток для ставок - это может вызывать спам
-    else:
-        try:
-            # Аналогично для завершенного аукциона
-            has_photo = False
-            try:
-                if auction.photos:
-                    photos_list = json.loads(auction.photos)
-                    has_photo = bool(photos_list and photos_list[0])
-            except:
-                pass
-            
-            # Добавляем задержку
-            await asyncio.sleep(0.5)
-            
-            if has_photo:
-                await bot.edit_message_caption(
-                    chat_id=Config.CHANNEL_ID,
-                    message_id=auction.channel_message_id,
-                    caption=message_text,
-                    parse_mode='HTML'
-                )
-            else:
-                await bot.edit_message_text(
-                    chat_id=Config.CHANNEL_ID,
-                    message_id=auction.channel_message_id,
-                    text=message_text,
-                    parse_mode='HTML'
-                )
-        except Exception as e:
-            logger.error(f"Ошибка при обновлении завершенного аукциона в канале: {e}")
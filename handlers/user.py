@@ -1,16 +1,19 @@
 from aiogram import Router, F
 from aiogram.types import Message, CallbackQuery
-from aiogram.filters import Command
+from aiogram.filters import Command, or_f
 from sqlalchemy import select, desc, func
-from sqlalchemy.orm import selectinload
+from sqlalchemy.orm import contains_eager, load_only, noload, selectinload
+import asyncio
 import logging
-import datetime
 
-from database.database import get_db
+from database.database import get_db, get_db_read
 from database.models import User, Bid, Auction, Notification
-from keyboards.inline import get_confirmation_keyboard, get_user_menu_keyboard, get_bot_auction_keyboard, get_cancel_bid_keyboard
+from keyboards.inline import get_confirmation_keyboard, get_user_menu_keyboard, get_bot_auction_keyboard, get_cancel_bid_keyboard, CancelBidCallback, AdminAction
 from utils.formatters import format_user_bids, format_notifications, escape_html
 from config import Config
+from middlewares.combined import get_cached_user, update_cached_user
+from utils.periodic_updater import periodic_updater
+from utils.active_auctions import get_active_auctions, invalidate_active_auctions
 
 router = Router()
 logger = logging.getLogger(__name__)
@@ -22,12 +25,19 @@ async def get_db_user(session, telegram_id: int):
         select(User).where(User.telegram_id == telegram_id)
     )
     return result.scalar_one_or_none()
+
+async def get_db_user_id(session, telegram_id: int):
+    """ID пользователя в БД по telegram_id: из кэша middleware, иначе запросом"""
+    user = get_cached_user(telegram_id)
+    if user is not None:
+        return user.id
+    return await session.scalar(select(User.id).where(User.telegram_id == telegram_id))
 # =============================================
 
 @router.message(Command("start"))
 async def cmd_start(message: Message):
     """Обработка команды /start"""
-    logger.info(f"Команда /start от {message.from_user.id}")
+    logger.debug("Команда /start от %s", message.from_user.id)
     
     async with get_db() as session:
         user = await get_db_user(session, message.from_user.id)
@@ -43,7 +53,7 @@ async def cmd_start(message: Message):
             )
             session.add(user)
             await session.commit()
-            logger.info(f"Создан новый пользователь {message.from_user.id}")
+            logger.info("Создан новый пользователь %s", message.from_user.id)
         
         if user.is_confirmed:
             await message.answer(
@@ -96,40 +106,53 @@ async def cmd_cancel_bid(message: Message):
     """Отмена последней ставки пользователя"""
     await cancel_bid_start(message)
 
+@router.message(Command("admin", "fix_channel"), ~F.from_user.id.in_(Config.ADMIN_IDS))
+async def cmd_admin_denied(message: Message):
+    """Ответ на команды администратора от обычного пользователя"""
+    await message.answer("⛔ У вас нет прав администратора!")
+
 # =================== ОБРАБОТЧИКИ КНОПОК ===================
 
+@router.callback_query(
+    or_f(AdminAction.filter(), F.data.startswith("admin_")),
+    ~F.from_user.id.in_(Config.ADMIN_IDS),
+)
+async def callback_admin_denied(callback: CallbackQuery):
+    """Ответ на кнопки администратора от обычного пользователя"""
+    await callback.answer("Нет прав!", show_alert=True)
+
 @router.callback_query(F.data == "user_my_bids")
 async def callback_user_my_bids(callback: CallbackQuery):
     """Мои ставки (обработчик кнопки)"""
-    logger.info(f"Нажата кнопка 'Мои ставки' от {callback.from_user.id}")
+    logger.debug("Нажата кнопка 'Мои ставки' от %s", callback.from_user.id)
     await show_user_bids(callback.message, callback.from_user.id)
     await callback.answer()
 
 @router.callback_query(F.data == "user_my_wins")
 async def callback_user_my_wins(callback: CallbackQuery):
     """Мои выигрыши (обработчик кнопки)"""
-    logger.info(f"Нажата кнопка 'Мои выигрыши' от {callback.from_user.id}")
+    logger.debug("Нажата кнопка 'Мои выигрыши' от %s", callback.from_user.id)
     await show_user_wins(callback.message, callback.from_user.id)
     await callback.answer()
 
 @router.callback_query(F.data == "user_notifications")
 async def callback_user_notifications(callback: CallbackQuery):
     """Уведомления (обработчик кнопки)"""
-    logger.info(f"Нажата кнопка 'Уведомления' от {callback.from_user.id}")
+    logger.debug("Нажата кнопка 'Уведомления' от %s", callback.from_user.id)
     await show_user_notifications(callback.message, callback.from_user.id)
     await callback.answer()
 
 @router.callback_query(F.data == "user_help")
 async def callback_user_help(callback: CallbackQuery):
     """Помощь (обработчик кнопки)"""
-    logger.info(f"Нажата кнопка 'Помощь' от {callback.from_user.id}")
+    logger.debug("Нажата кнопка 'Помощь' от %s", callback.from_user.id)
     await show_help(callback.message)
     await callback.answer()
 
 @router.callback_query(F.data == "confirm_rules")
 async def confirm_rules(callback: CallbackQuery):
     """Подтверждение правил пользователем"""
-    logger.info(f"Подтверждение правил от {callback.from_user.id}")
+    logger.debug("Подтверждение правил от %s", callback.from_user.id)
     
     async with get_db() as session:
         db_user = await get_db_user(session, callback.from_user.id)
@@ -140,6 +163,8 @@ async def confirm_rules(callback: CallbackQuery):
         
         db_user.is_confirmed = True
         await session.commit()
+        # Middleware отдает пользователя из кэша - обновляем и его
+        update_cached_user(db_user)
         
         await callback.message.edit_text(
             "🎉 Отлично! Теперь вы можете участвовать в аукционах!\n\n"
@@ -151,7 +176,7 @@ async def confirm_rules(callback: CallbackQuery):
 @router.callback_query(F.data == "cancel_rules")
 async def cancel_rules(callback: CallbackQuery):
     """Отказ от правил"""
-    logger.info(f"Отказ от правил от {callback.from_user.id}")
+    logger.debug("Отказ от правил от %s", callback.from_user.id)
     
     await callback.message.edit_text(
         "❌ Вы отказались от правил участия в аукционах.\n\n"
@@ -162,16 +187,16 @@ async def cancel_rules(callback: CallbackQuery):
 @router.callback_query(F.data == "cancel_bid_cancel")
 async def cancel_bid_cancel_handler(callback: CallbackQuery):
     """Отмена отмены ставки"""
-    logger.info(f"Отмена отмены ставки от {callback.from_user.id}")
+    logger.debug("Отмена отмены ставки от %s", callback.from_user.id)
     
     await callback.message.edit_text("✅ Отмена ставки отменена. Ваша ставка сохранена.")
     await callback.answer()
 
-@router.callback_query(F.data.startswith("cancel_bid_confirm:"))
-async def cancel_bid_confirm(callback: CallbackQuery):
+@router.callback_query(CancelBidCallback.filter())
+async def cancel_bid_confirm(callback: CallbackQuery, callback_data: CancelBidCallback):
     """Подтверждение отмены ставки"""
-    bid_id = int(callback.data.split(":")[1])
-    logger.info(f"Подтверждение отмены ставки #{bid_id} от {callback.from_user.id}")
+    bid_id = callback_data.bid_id
+    logger.info("Подтверждение отмены ставки #%s от %s", bid_id, callback.from_user.id)
     
     await process_cancel_bid(callback, bid_id)
     await callback.answer()
@@ -180,75 +205,81 @@ async def cancel_bid_confirm(callback: CallbackQuery):
 
 async def show_auctions(message: Message):
     """Показать активные аукционы (не требует регистрации)"""
-    async with get_db() as session:
-        stmt = select(Auction).where(
-            Auction.status == 'active'
-        ).order_by(desc(Auction.created_at))
-        
-        result = await session.execute(stmt)
-        auctions = result.scalars().all()
-        
-        if not auctions:
-            await message.answer("📭 Нет активных аукционов.")
-            return
-        
-        for auction in auctions:
-            stmt_bids = select(func.count(Bid.id)).where(Bid.auction_id == auction.id)
-            result_bids = await session.execute(stmt_bids)
-            bids_count = result_bids.scalar()
-            
-            title = escape_html(auction.title)
-            description = escape_html(auction.description[:100] + "...") if auction.description else ""
-            
-            text = f"🏷 <b>{title}</b>\n\n"
-            if description:
-                text += f"📝 Описание: {description}\n"
-            text += f"💰 Стартовая цена: {auction.start_price} ₽\n"
-            text += f"📈 Шаг ставки: {auction.step_price} ₽\n"
-            text += f"🏆 Текущая цена: {auction.current_price} ₽\n"
-            text += f"📊 Количество ставок: {bids_count}\n"
-            text += f"⏳ Создан: {auction.created_at.strftime('%d.%m.%Y %H:%M')}\n"
-            
-            next_bid_amount = auction.current_price + auction.step_price
-            
-            try:
-                if auction.photo_list and auction.photo_list[0]:
-                    await message.bot.send_photo(
-                        chat_id=message.chat.id,
-                        photo=auction.photo_list[0],
-                        caption=text,
-                        reply_markup=get_bot_auction_keyboard(auction.id, next_bid_amount),
-                        parse_mode='HTML'
-                    )
-                else:
-                    await message.answer(
-                        text,
-                        parse_mode="HTML",
-                        reply_markup=get_bot_auction_keyboard(auction.id, next_bid_amount)
-                    )
-            except Exception as e:
-                logger.error(f"Ошибка при отправке аукциона: {e}")
-                await message.answer(
-                    text,
-                    parse_mode="HTML",
-                    reply_markup=get_bot_auction_keyboard(auction.id, next_bid_amount)
-                )
+    # Список с количеством ставок одним запросом, несколько секунд из кэша
+    rows = await get_active_auctions()
+    if not rows:
+        await message.answer("📭 Нет активных аукционов.")
+        return
+    
+    # Карточки отправляются параллельно: время
+    # ответа - самый долгий запрос к Telegram, а не их сумма
+    results = await asyncio.gather(
+        *(_send_auction_card(message, auction, bids_count) for auction, bids_count in rows),
+        return_exceptions=True
+    )
+    for error in results:
+        if error is not None:
+            logger.error("Ошибка при отправке аукциона: %s", error)
+
+async def _send_auction_card(message: Message, auction: Auction, bids_count: int):
+    """Отправить карточку аукциона (с фото, если оно есть)"""
+    title = escape_html(auction.title)
+    description = escape_html(auction.description[:100] + "...") if auction.description else ""
+    
+    text = f"🏷 <b>{title}</b>\n\n"
+    if description:
+        text += f"📝 Описание: {description}\n"
+    text += f"💰 Стартовая цена: {auction.start_price} ₽\n"
+    text += f"📈 Шаг ставки: {auction.step_price} ₽\n"
+    text += f"🏆 Текущая цена: {auction.current_price} ₽\n"
+    text += f"📊 Количество ставок: {bids_count}\n"
+    text += f"⏳ Создан: {auction.created_at.strftime('%d.%m.%Y %H:%M')}\n"
+    
+    next_bid_amount = auction.current_price + auction.step_price
+    
+    try:
+        if auction.first_photo:
+            await message.bot.send_photo(
+                chat_id=message.chat.id,
+                photo=auction.first_photo,
+                caption=text,
+                reply_markup=get_bot_auction_keyboard(auction.id, next_bid_amount),
+                parse_mode='HTML'
+            )
+        else:
+            await message.answer(
+                text,
+                parse_mode="HTML",
+                reply_markup=get_bot_auction_keyboard(auction.id, next_bid_amount)
+            )
+    except Exception as e:
+        logger.error("Ошибка при отправке аукциона: %s", e)
+        await message.answer(
+            text,
+            parse_mode="HTML",
+            reply_markup=get_bot_auction_keyboard(auction.id, next_bid_amount)
+        )
 
 async def show_user_bids(message: Message, user_id: int = None):
     """Показать ставки пользователя"""
     if user_id is None:
         user_id = message.from_user.id
     
-    async with get_db() as session:
-        db_user = await get_db_user(session, user_id)
-        if not db_user:
+    async with get_db_read() as session:
+        db_user_id = await get_db_user_id(session, user_id)
+        if db_user_id is None:
             await message.answer("Пользователь не найден. Напишите /start для регистрации.")
             return
         
-        stmt = select(Bid).join(Auction).where(
-            Bid.user_id == db_user.id
+        # Аукционы подгружаются одним SELECT ... WHERE id IN (...) по внешнему
+        # ключу ставки (JOIN не нужен) и только с полями для списка
+        stmt = select(Bid).where(
+            Bid.user_id == db_user_id
         ).order_by(desc(Bid.created_at)).options(
-            selectinload(Bid.auction)
+            selectinload(Bid.auction).options(
+                load_only(Auction.title, Auction.status, Auction.current_price, Auction.step_price),
+                noload(Auction.winner)
+            )
         )
         
         result = await session.execute(stmt)
@@ -268,15 +299,15 @@ async def show_user_wins(message: Message, user_id: int = None):
     if user_id is None:
         user_id = message.from_user.id
     
-    async with get_db() as session:
-        db_user = await get_db_user(session, user_id)
-        if not db_user:
+    async with get_db_read() as session:
+        db_user_id = await get_db_user_id(session, user_id)
+        if db_user_id is None:
             await message.answer("Пользователь не найден. Напишите /start для регистрации.")
             return
         
         stmt = select(Auction).where(
             Auction.status == 'ended',
-            Auction.winner_id == db_user.id
+            Auction.winner_id == db_user_id
         ).order_by(desc(Auction.ended_at))
         
         result = await session.execute(stmt)
@@ -301,13 +332,13 @@ async def show_user_notifications(message: Message, user_id: int = None):
         user_id = message.from_user.id
     
     async with get_db() as session:
-        db_user = await get_db_user(session, user_id)
-        if not db_user:
+        db_user_id = await get_db_user_id(session, user_id)
+        if db_user_id is None:
             await message.answer("Пользователь не найден. Напишите /start для регистрации.")
             return
         
         stmt = select(Notification).where(
-            Notification.user_id == db_user.id
+            Notification.user_id == db_user_id
         ).order_by(desc(Notification.created_at)).limit(20)
         
         result = await session.execute(stmt)
@@ -359,17 +390,18 @@ async def show_help(message: Message):
 async def cancel_bid_start(message: Message):
     """Начало отмены ставки"""
     async with get_db() as session:
-        db_user = await get_db_user(session, message.from_user.id)
-        if not db_user:
+        db_user_id = await get_db_user_id(session, message.from_user.id)
+        if db_user_id is None:
             await message.answer("Пользователь не найден. Напишите /start для регистрации.")
             return
         
         # Находим последнюю ставку пользователя в активных аукционах
         stmt_last_bid = select(Bid).join(Auction).where(
-            Bid.user_id == db_user.id,
+            Bid.user_id == db_user_id,
             Auction.status == 'active'
         ).order_by(desc(Bid.created_at)).limit(1).options(
-            selectinload(Bid.auction)
+            # Аукцион уже в JOIN: берем из него только название
+            contains_eager(Bid.auction).options(load_only(Auction.title), noload(Auction.winner))
         )
         
         result_last_bid = await session.execute(stmt_last_bid)
@@ -411,26 +443,24 @@ async def cancel_bid_start(message: Message):
 async def process_cancel_bid(callback: CallbackQuery, bid_id: int):
     """Обработка отмены ставки"""
     async with get_db() as session:
-        db_user = await get_db_user(session, callback.from_user.id)
-        if not db_user:
-            await callback.message.answer("Пользователь не найден.")
-            await callback.answer()
-            return
-        
+        # Пользователь читается уже в транзакции: запрос до begin() сам
+        # открыл бы транзакцию, и begin() завершился бы ошибкой
         async with session.begin():
-            # Находим ставку
-            stmt_bid = select(Bid).where(Bid.id == bid_id).options(
-                selectinload(Bid.auction),
-                selectinload(Bid.user)
-            )
-            result_bid = await session.execute(stmt_bid)
-            bid = result_bid.scalar_one_or_none()
+            db_user_id = await get_db_user_id(session, callback.from_user.id)
+            if db_user_id is None:
+                await callback.message.answer("Пользователь не найден.")
+                await callback.answer()
+                return
+            
+            # Находим ставку вместе с аукционом (пользователь ставки не нужен:
+            # владелец сверяется по user_id)
+            bid = await session.get(Bid, bid_id, options=[selectinload(Bid.auction)])
             
             if not bid:
                 await callback.answer("Ставка не найдена!", show_alert=True)
                 return
             
-            if bid.user_id != db_user.id:
+            if bid.user_id != db_user_id:
                 await callback.answer("Это не ваша ставка!", show_alert=True)
                 return
             
@@ -438,10 +468,11 @@ async def process_cancel_bid(callback: CallbackQuery, bid_id: int):
                 await callback.answer("Аукцион уже завершен!", show_alert=True)
                 return
             
-            # Удаляем ставку
+            # Удаляем ставку (сразу в БД, чтобы поиск новой лучшей ставки ее не нашел)
             await session.delete(bid)
+            await session.flush()
             
-            # Обновляем текущую цену аукциона
+            # Обновляем текущую цену и лидера аукциона
             stmt_max_bid = select(Bid).where(
                 Bid.auction_id == bid.auction_id
             ).order_by(desc(Bid.amount)).limit(1)
@@ -450,36 +481,20 @@ async def process_cancel_bid(callback: CallbackQuery, bid_id: int):
             new_max_bid = result_max.scalar_one_or_none()
             
             if new_max_bid:
+                bid.auction.top_bidder_id = new_max_bid.user_id
                 bid.auction.current_price = new_max_bid.amount
                 bid.auction.last_bid_time = new_max_bid.created_at
-                bid.auction.ends_at = new_max_bid.created_at + datetime.timedelta(minutes=Config.BID_TIMEOUT_MINUTES)
+                bid.auction.ends_at = new_max_bid.created_at + Config.BID_TIMEOUT
             else:
+                bid.auction.top_bidder_id = None
                 bid.auction.current_price = bid.auction.start_price
                 bid.auction.last_bid_time = bid.auction.created_at
-                bid.auction.ends_at = bid.auction.created_at + datetime.timedelta(minutes=Config.BID_TIMEOUT_MINUTES)
+                bid.auction.ends_at = bid.auction.created_at + Config.BID_TIMEOUT
         
-        # Обновляем сообщение в канале
-        async with get_db() as session:
-            stmt_auction = select(Auction).where(Auction.id == bid.auction_id)
-            result_auction = await session.execute(stmt_auction)
-            auction = result_auction.scalar_one()
-            
-            stmt_top_bids = select(Bid).where(
-                Bid.auction_id == auction.id
-            ).order_by(desc(Bid.amount)).limit(3).options(
-                selectinload(Bid.user)
-            )
-            result_top = await session.execute(stmt_top_bids)
-            top_bids = result_top.scalars().all()
-            
-            stmt_count = select(func.count(Bid.id)).where(Bid.auction_id == auction.id)
-            result_count = await session.execute(stmt_count)
-            bids_count = result_count.scalar()
-            
-            from utils.formatters import format_auction_message
-            from handlers.auction import update_channel_message
-            
-            await update_channel_message(callback.bot, auction, top_bids, bids_count)
+        # Сообщение в канале обновится в ближайшем окне вместе с другими
+        # изменениями этого аукциона
+        periodic_updater.schedule_update(bid.auction_id)
+        invalidate_active_auctions()
         
         await callback.message.edit_text(
             "✅ <b>Ваша ставка успешно отменена!</b>\n\n"
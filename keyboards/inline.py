@@ -1,6 +1,52 @@
+import functools
+
+from aiogram.filters.callback_data import CallbackData
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 
+class AdminAction(CallbackData, prefix="adm"):
+    """Действие администратора над аукционом (menu, end, edit, stats, delete, announce)"""
+    action: str
+    auction_id: int
+
+# Формат совпадает с прежними строками вида "bid:<id>:<сумма>", поэтому кнопки
+# уже опубликованных сообщений продолжают работать
+class BidCallback(CallbackData, prefix="bid"):
+    """Ставка на аукцион"""
+    auction_id: int
+    amount: float
+
+class Top3Callback(CallbackData, prefix="top3"):
+    """Топ-3 ставки аукциона"""
+    auction_id: int
+
+class HistoryCallback(CallbackData, prefix="history"):
+    """История ставок аукциона"""
+    auction_id: int
+
+class SubscribeCallback(CallbackData, prefix="subscribe"):
+    """Подписка на уведомления об аукционе"""
+    auction_id: int
+
+class UnsubscribeCallback(CallbackData, prefix="unsubscribe"):
+    """Отписка от уведомлений об аукционе"""
+    auction_id: int
+
+class BackToAuctionCallback(CallbackData, prefix="back_to_auction"):
+    """Возврат к карточке аукциона"""
+    auction_id: int
+
+class CancelBidCallback(CallbackData, prefix="cancel_bid_confirm"):
+    """Подтверждение отмены ставки"""
+    bid_id: int
+
+# Объекты клавиатур aiogram неизменяемые (frozen), поэтому одну и ту же разметку
+# можно отдавать повторно, не собирая и не валидируя кнопки заново.
+# Разметка зависит только от аргументов, так что сбрасывать кэш не нужно.
+# Клавиатуры без аргументов собираются один раз (functools.cache)
+KEYBOARD_CACHE_SIZE = 1024
+
+@functools.cache
 def get_confirmation_keyboard():
     """Клавиатура для подтверждения правил"""
     builder = InlineKeyboardBuilder()
@@ -10,6 +56,7 @@ def get_confirmation_keyboard():
     )
     return builder.as_markup()
 
+@functools.cache
 def get_user_menu_keyboard():
     """Меню пользователя - ИСПРАВЛЕННАЯ ВЕРСИЯ"""
     builder = InlineKeyboardBuilder()
@@ -26,19 +73,20 @@ def get_user_menu_keyboard():
     )
     return builder.as_markup()
 
+@functools.lru_cache(maxsize=KEYBOARD_CACHE_SIZE)
 def get_channel_auction_keyboard(auction_id: int, next_bid_amount: float):
     """Клавиатура для аукциона в КАНАЛЕ (только ставка, подписка и связь)"""
     builder = InlineKeyboardBuilder()
     builder.row(
         InlineKeyboardButton(
             text=f"✅ Сделать ставку {next_bid_amount:.2f} ₽", 
-            callback_data=f"bid:{auction_id}:{next_bid_amount}"
+            callback_data=BidCallback(auction_id=auction_id, amount=next_bid_amount).pack()
         )
     )
     builder.row(
         InlineKeyboardButton(
             text="🔔 Подписаться на уведомления", 
-            callback_data=f"subscribe:{auction_id}"
+            callback_data=SubscribeCallback(auction_id=auction_id).pack()
         )
     )
     builder.row(
@@ -49,38 +97,40 @@ def get_channel_auction_keyboard(auction_id: int, next_bid_amount: float):
     )
     return builder.as_markup()
 
+@functools.lru_cache(maxsize=KEYBOARD_CACHE_SIZE)
 def get_bot_auction_keyboard(auction_id: int, next_bid_amount: float):
     """Клавиатура для аукциона в БОТЕ (полный функционал)"""
     builder = InlineKeyboardBuilder()
     builder.row(
         InlineKeyboardButton(
             text=f"✅ Сделать ставку {next_bid_amount:.2f} ₽", 
-            callback_data=f"bid:{auction_id}:{next_bid_amount}"
+            callback_data=BidCallback(auction_id=auction_id, amount=next_bid_amount).pack()
         )
     )
     builder.row(
         InlineKeyboardButton(
             text="📊 Топ-3 ставки", 
-            callback_data=f"top3:{auction_id}"
+            callback_data=Top3Callback(auction_id=auction_id).pack()
         ),
         InlineKeyboardButton(
             text="📋 История ставок", 
-            callback_data=f"history:{auction_id}"
+            callback_data=HistoryCallback(auction_id=auction_id).pack()
         )
     )
     builder.row(
         InlineKeyboardButton(
             text="🔔 Подписаться на уведомления", 
-            callback_data=f"subscribe:{auction_id}"
+            callback_data=SubscribeCallback(auction_id=auction_id).pack()
         )
     )
     return builder.as_markup()
 
+@functools.lru_cache(maxsize=KEYBOARD_CACHE_SIZE)
 def get_auction_history_keyboard(auction_id: int):
     """Клавиатура для истории ставок"""
     builder = InlineKeyboardBuilder()
     builder.row(
-        InlineKeyboardButton(text="🔙 Назад к аукциону", callback_data=f"back_to_auction:{auction_id}")
+        InlineKeyboardButton(text="🔙 Назад к аукциону", callback_data=BackToAuctionCallback(auction_id=auction_id).pack())
     )
     builder.row(
         InlineKeyboardButton(text="📞 Связаться", url="https://t.me/pd56oren")
@@ -91,24 +141,26 @@ def get_cancel_bid_keyboard(bid_id: int):
     """Клавиатура для отмены ставки"""
     builder = InlineKeyboardBuilder()
     builder.row(
-        InlineKeyboardButton(text="✅ Да, отменить ставку", callback_data=f"cancel_bid_confirm:{bid_id}")
+        InlineKeyboardButton(text="✅ Да, отменить ставку", callback_data=CancelBidCallback(bid_id=bid_id).pack())
     )
     builder.row(
         InlineKeyboardButton(text="❌ Нет, оставить", callback_data="cancel_bid_cancel")
     )
     return builder.as_markup()
 
+@functools.lru_cache(maxsize=KEYBOARD_CACHE_SIZE)
 def get_unsubscribe_keyboard(auction_id: int):
     """Клавиатура для отписки от аукциона"""
     builder = InlineKeyboardBuilder()
     builder.row(
-        InlineKeyboardButton(text="🔕 Отписаться от уведомлений", callback_data=f"unsubscribe:{auction_id}")
+        InlineKeyboardButton(text="🔕 Отписаться от уведомлений", callback_data=UnsubscribeCallback(auction_id=auction_id).pack())
     )
     builder.row(
-        InlineKeyboardButton(text="🔙 Назад", callback_data=f"back_to_auction:{auction_id}")
+        InlineKeyboardButton(text="🔙 Назад", callback_data=BackToAuctionCallback(auction_id=auction_id).pack())
     )
     return builder.as_markup()
 
+@functools.cache
 def get_admin_limits_keyboard():
     """Клавиатура для управления лимитами"""
     builder = InlineKeyboardBuilder()
@@ -126,6 +178,7 @@ def get_admin_limits_keyboard():
     )
     return builder.as_markup()
 
+@functools.cache
 def get_admin_main_keyboard():
     """Главное меню админа - ИСПРАВЛЕННАЯ ВЕРСИЯ"""
     builder = InlineKeyboardBuilder()
@@ -146,6 +199,7 @@ def get_admin_main_keyboard():
     )
     return builder.as_markup()
 
+@functools.cache
 def get_admin_stats_keyboard():
     """Клавиатура статистики"""
     builder = InlineKeyboardBuilder()
@@ -158,21 +212,34 @@ def get_admin_stats_keyboard():
     )
     return builder.as_markup()
 
+@functools.lru_cache(maxsize=KEYBOARD_CACHE_SIZE)
 def get_admin_auction_keyboard(auction_id: int):
     """Клавиатура для админа управления аукционом - ИСПРАВЛЕННАЯ ВЕРСИЯ"""
     builder = InlineKeyboardBuilder()
     builder.row(
-        InlineKeyboardButton(text="🛑 Завершить досрочно", callback_data=f"admin_end:{auction_id}"),
-        InlineKeyboardButton(text="✏️ Редактировать лот", callback_data=f"admin_edit:{auction_id}")
+        InlineKeyboardButton(text="🛑 Завершить досрочно", callback_data=AdminAction(action="end", auction_id=auction_id).pack()),
+        InlineKeyboardButton(text="✏️ Редактировать лот", callback_data=AdminAction(action="edit", auction_id=auction_id).pack())
     )
     builder.row(
-        InlineKeyboardButton(text="📊 Статистика", callback_data=f"admin_stats:{auction_id}"),
-        InlineKeyboardButton(text="🗑️ Удалить аукцион", callback_data=f"admin_delete:{auction_id}")
+        InlineKeyboardButton(text="📊 Статистика", callback_data=AdminAction(action="stats", auction_id=auction_id).pack()),
+        InlineKeyboardButton(text="🗑️ Удалить аукцион", callback_data=AdminAction(action="delete", auction_id=auction_id).pack())
     )
     builder.row(
-        InlineKeyboardButton(text="📢 Анонсировать", callback_data=f"admin_announce:{auction_id}")
+        InlineKeyboardButton(text="📢 Анонсировать", callback_data=AdminAction(action="announce", auction_id=auction_id).pack())
     )
     builder.row(
         InlineKeyboardButton(text="🔙 Назад в меню", callback_data="admin_back_menu")
     )
     return builder.as_markup()
+
+def get_admin_active_list_keyboard(auctions):
+    """Клавиатура списка активных аукционов: кнопка на каждый аукцион"""
+    builder = InlineKeyboardBuilder()
+    for auction_id, title in auctions:
+        builder.row(
+            InlineKeyboardButton(
+                text=f"#{auction_id} {title[:30]}",
+                callback_data=AdminAction(action="menu", auction_id=auction_id).pack()
+            )
+        )
+    return builder.as_markup()
@@ -1,4 +1,3 @@
-from .rate_limit import RateLimitMiddleware
-from .user_check import UserCheckMiddleware
+from .combined import CombinedMiddleware
 
-__all__ = ['RateLimitMiddleware', 'UserCheckMiddleware']
\ No newline at end of file
+__all__ = ['CombinedMiddleware']
\ No newline at end of file
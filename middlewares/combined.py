@@ -0,0 +1,136 @@
+from aiogram import BaseMiddleware
+from aiogram.types import Update
+from collections import OrderedDict
+from typing import Dict, Any, Callable, Awaitable, Optional
+from sqlalchemy import select
+import math
+import time
+
+from config import Config
+from database.database import get_db
+from database.models import User
+from utils.redis_client import get_redis
+
+# Пользователи, которые уже есть в БД (telegram_id -> User).
+# Записи пользователей не удаляются, поэтому повторная проверка не нужна
+_USER_CACHE: Dict[int, User] = {}
+_USER_CACHE_LIMIT = 10000
+
+# Фиксированное окно в Redis за один запрос: счетчик и TTL окна в мс
+_RATE_LIMIT_SCRIPT = """
+local count = redis.call('INCR', KEYS[1])
+if count == 1 then
+    redis.call('PEXPIRE', KEYS[1], ARGV[1])
+end
+return {count, redis.call('PTTL', KEYS[1])}
+"""
+
+def get_cached_user(telegram_id: int) -> Optional[User]:
+    """Пользователь из кэша middleware или None"""
+    return _USER_CACHE.get(telegram_id)
+
+def update_cached_user(user: User):
+    """Заменить закэшированного пользователя после изменения его записи в БД"""
+    if user.telegram_id in _USER_CACHE:
+        _USER_CACHE[user.telegram_id] = user
+
+class CombinedMiddleware(BaseMiddleware):
+    """Ограничение частоты действий и регистрация пользователя за один проход"""
+
+    def __init__(self, rate_limit_period: float = 2):
+        self.rate_limit_period = rate_limit_period  # секунды между действиями
+        # Порядок записей - по времени последнего действия: самые старые в начале
+        self.user_timestamps: "OrderedDict[int, float]" = OrderedDict()
+        self._redis = get_redis()
+        self._rate_limit_script = (
+            self._redis.register_script(_RATE_LIMIT_SCRIPT) if self._redis is not None else None
+        )
+
+    async def __call__(
+        self,
+        handler: Callable[[Update, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any]
+    ) -> Any:
+        # Ограничиваем только сообщения и нажатия кнопок
+        if event.message is None and event.callback_query is None:
+            return await handler(event, data)
+
+        from_user = data.get("event_from_user")
+        if from_user is None:
+            return await handler(event, data)
+
+        user_id = from_user.id
+
+        # Администраторов не ограничиваем
+        if user_id not in Config.ADMIN_IDS:
+            wait_seconds = await self._check_rate_limit(user_id)
+            if wait_seconds is not None:
+                if event.callback_query is not None:
+                    await event.callback_query.answer(
+                        f"⏳ Подождите {wait_seconds} секунд перед следующим действием",
+                        show_alert=True
+                    )
+                return
+
+        user = _USER_CACHE.get(user_id)
+        if user is None:
+            user = await self._get_or_create_user(from_user)
+            if len(_USER_CACHE) >= _USER_CACHE_LIMIT:
+                _USER_CACHE.clear()
+            _USER_CACHE[user_id] = user
+
+        data['user'] = user
+        return await handler(event, data)
+
+    async def _check_rate_limit(self, user_id: int):
+        """Вернуть число секунд ожидания или None, если действие разрешено"""
+        if self._rate_limit_script is not None:
+            # Лимит общий для всех процессов бота
+            count, ttl_ms = await self._rate_limit_script(
+                keys=[f"rate_limit:{user_id}"],
+                args=[int(self.rate_limit_period * 1000)]
+            )
+            if count > 1:
+                return max(1, math.ceil(ttl_ms / 1000))
+            return None
+
+        now = time.monotonic()
+        last_action = self.user_timestamps.get(user_id)
+
+        if last_action is not None:
+            time_diff = now - last_action
+            if time_diff < self.rate_limit_period:
+                return self.rate_limit_period - int(time_diff)
+
+        self.user_timestamps[user_id] = now
+        self.user_timestamps.move_to_end(user_id)
+
+        # Очистка старых записей: удаляем с начала, пока они устарели,
+        # без полного обхода словаря
+        while len(self.user_timestamps) > 1000:
+            uid, timestamp = next(iter(self.user_timestamps.items()))
+            if now - timestamp <= 300:
+                break
+            del self.user_timestamps[uid]
+        return None
+
+    async def _get_or_create_user(self, from_user) -> User:
+        """Найти пользователя в БД или зарегистрировать нового"""
+        async with get_db() as session:
+            stmt = select(User).where(User.telegram_id == from_user.id)
+            result = await session.execute(stmt)
+            user = result.scalar_one_or_none()
+
+            if not user:
+                user = User(
+                    telegram_id=from_user.id,
+                    username=from_user.username,
+                    first_name=from_user.first_name,
+                    last_name=from_user.last_name,
+                    is_confirmed=False
+                )
+                session.add(user)
+                await session.commit()
+
+        return user
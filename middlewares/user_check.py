@@ -1,34 +0,0 @@
-from aiogram import BaseMiddleware
-from aiogram.types import Message, CallbackQuery
-from typing import Dict, Any, Callable, Awaitable
-from database.database import get_db
-from database.models import User
-from sqlalchemy import select
-
-class UserCheckMiddleware(BaseMiddleware):
-    async def __call__(
-        self,
-        handler: Callable[[Message | CallbackQuery, Dict[str, Any]], Awaitable[Any]],
-        event: Message | CallbackQuery,
-        data: Dict[str, Any]
-    ) -> Any:
-        user_id = event.from_user.id
-        
-        async with get_db() as session:
-            stmt = select(User).where(User.telegram_id == user_id)
-            result = await session.execute(stmt)
-            user = result.scalar_one_or_none()
-            
-            if not user:
-                user = User(
-                    telegram_id=user_id,
-                    username=event.from_user.username,
-                    first_name=event.from_user.first_name,
-                    last_name=event.from_user.last_name,
-                    is_confirmed=False
-                )
-                session.add(user)
-                await session.commit()
-        
-        data['user'] = user
-        return await handler(event, data)
\ No newline at end of file
@@ -0,0 +1,66 @@
+import asyncio
+import time
+from typing import List, Optional, Tuple
+
+from sqlalchemy import desc, func, select
+from sqlalchemy.orm import undefer
+
+from database.database import get_db_read
+from database.models import Auction, Bid
+
+# Список активных аукционов для /auctions живет ACTIVE_AUCTIONS_TTL секунд:
+# при наплыве пользователей одинаковые запросы обслуживает один SELECT.
+# Ставки, отмена ставки, создание и завершение аукциона сбрасывают его сразу
+ACTIVE_AUCTIONS_TTL = 5
+
+_cached: Optional[Tuple[float, List[Tuple[Auction, int]]]] = None
+# Номер сброса: список, загруженный до сброса, в кэш не попадает
+_generation = 0
+_lock = asyncio.Lock()
+
+
+def invalidate_active_auctions():
+    """Сбросить кэш списка активных аукционов"""
+    global _cached, _generation
+    _cached = None
+    _generation += 1
+
+
+def _fresh_cached() -> Optional[List[Tuple[Auction, int]]]:
+    """Список из кэша, если срок его жизни не истек"""
+    cached = _cached
+    if cached is not None and cached[0] > time.monotonic():
+        return cached[1]
+    return None
+
+
+async def get_active_auctions() -> List[Tuple[Auction, int]]:
+    """Активные аукционы (новые сверху) с количеством ставок"""
+    global _cached
+    rows = _fresh_cached()
+    if rows is not None:
+        return rows
+
+    # Одновременные промахи ждут один запрос, а не выполняют свои
+    async with _lock:
+        rows = _fresh_cached()
+        if rows is not None:
+            return rows
+
+        generation = _generation
+        async with get_db_read() as session:
+            # Количество ставок считается коррелированным подзапросом в том же SELECT
+            bids_count_subq = select(func.count(Bid.id)).where(
+                Bid.auction_id == Auction.id
+            ).correlate(Auction).scalar_subquery()
+
+            stmt = select(Auction, bids_count_subq).options(undefer(Auction.first_photo)).where(
+                Auction.status == 'active'
+            ).order_by(desc(Auction.created_at))
+
+            result = await session.execute(stmt)
+            rows = [(auction, bids_count) for auction, bids_count in result.all()]
+
+        if generation == _generation:
+            _cached = (time.monotonic() + ACTIVE_AUCTIONS_TTL, rows)
+        return rows
@@ -1,8 +1,9 @@
 import asyncio
-import shutil
 import datetime
+import json
 import os
 import logging
+import sqlite3
 from pathlib import Path
 
 logger = logging.getLogger(__name__)
@@ -12,22 +13,65 @@ class DatabaseBackup:
         self.backup_dir = Path(backup_dir)
         self.keep_days = keep_days
         self.backup_dir.mkdir(exist_ok=True)
+        # Отпечаток файлов БД на момент последнего бэкапа
+        self.state_path = self.backup_dir / ".last_backup.json"
+    
+    @staticmethod
+    def _db_signature(db_path: str) -> list:
+        """Отпечаток БД: время изменения и размер основного файла и WAL"""
+        signature = []
+        for path in (db_path, f"{db_path}-wal"):
+            try:
+                stat = os.stat(path)
+                signature.append([stat.st_mtime_ns, stat.st_size])
+            except FileNotFoundError:
+                signature.append(None)
+        return signature
+    
+    def _load_last_signature(self):
+        try:
+            return json.loads(self.state_path.read_text())
+        except (FileNotFoundError, ValueError):
+            return None
+    
+    @staticmethod
+    def _copy_database(db_path: str, backup_path: Path):
+        """Согласованная копия через online backup API SQLite (не блокирует запись)"""
+        source = sqlite3.connect(db_path)
+        try:
+            target = sqlite3.connect(backup_path)
+            try:
+                source.backup(target)
+            finally:
+                target.close()
+        finally:
+            source.close()
     
     async def create_backup(self, db_path: str = "auctions.db"):
         """Создание резервной копии базы данных"""
         try:
             if not os.path.exists(db_path):
-                logger.warning(f"Файл базы данных {db_path} не найден")
+                logger.warning("Файл базы данных %s не найден", db_path)
+                return
+            
+            # БД не менялась с прошлого бэкапа - повторная копия не нужна.
+            # Отпечаток снимается до копии: запись, попавшая в файл во время
+            # копирования, изменит его, и следующий бэкап ее не пропустит
+            signature = self._db_signature(db_path)
+            if signature == self._load_last_signature():
+                logger.info("База данных не изменилась с последнего бэкапа, пропускаю")
                 return
             
             timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
             backup_name = f"auctions_{timestamp}.db"
             backup_path = self.backup_dir / backup_name
             
-            # Копируем файл базы данных
-            shutil.copy2(db_path, backup_path)
+            # Копирование выполняется в отдельном потоке, чтобы не блокировать event loop
+            await asyncio.to_thread(self._copy_database, db_path, backup_path)
+            
+            self.state_path.write_text(json.dumps(signature))
             
-            logger.info(f"Создана резервная копия: {backup_path}")
+            logger.info("Создана резервная копия: %s", backup_path)
             
             # Очищаем старые бэкапы
             await self._cleanup_old_backups()
@@ -35,7 +79,7 @@ class DatabaseBackup:
             return backup_path
             
         except Exception as e:
-            logger.error(f"Ошибка при создании бэкапа: {e}")
+            logger.error("Ошибка при создании бэкапа: %s", e)
     
     async def _cleanup_old_backups(self):
         """Удаление старых резервных копий"""
@@ -45,9 +89,9 @@ class DatabaseBackup:
                 file_time = datetime.datetime.fromtimestamp(backup_file.stat().st_mtime)
                 if (now - file_time).days > self.keep_days:
                     backup_file.unlink()
-                    logger.info(f"Удален старый бэкап: {backup_file.name}")
+                    logger.info("Удален старый бэкап: %s", backup_file.name)
         except Exception as e:
-            logger.error(f"Ошибка при очистке старых бэкапов: {e}")
+            logger.error("Ошибка при очистке старых бэкапов: %s", e)
     
     async def schedule_backups(self, interval_hours: int = 24):
         """Планирование регулярных бэкапов"""
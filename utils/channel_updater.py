@@ -4,20 +4,24 @@
 """
 import asyncio
 import logging
-from datetime import datetime
-import json
+from typing import List
 
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
 from sqlalchemy import select, desc, func
-from sqlalchemy.orm import selectinload
+from sqlalchemy.orm import contains_eager
 
-from database.database import get_db
+from database.database import get_db_read
 from database.models import Auction, Bid, User
-from config import Config
+from utils.clock import utcnow
 from utils.formatters import format_auction_message, format_ended_auction_message
+from utils.message_kind import edit_channel_message
 from keyboards.inline import get_channel_auction_keyboard
 
 logger = logging.getLogger(__name__)
 
+# Сколько правок сообщений канала отправляется одновременно
+CHANNEL_EDIT_CONCURRENCY = 25
+
 class ChannelUpdater:
     """Класс для обновления всех сообщений в канале"""
     
@@ -35,7 +39,7 @@ class ChannelUpdater:
         try:
             logger.info("🔄 Начинаю обновление ВСЕХ сообщений в канале...")
             
-            async with get_db() as session:
+            async with get_db_read() as session:
                 stmt = select(Auction).where(
                     Auction.channel_message_id.isnot(None)
                 ).order_by(Auction.created_at.desc())
@@ -47,144 +51,121 @@ class ChannelUpdater:
                     logger.warning("❌ Нет аукционов с сообщениями в канале")
                     return
                 
-                logger.info(f"📊 Найдено {len(auctions)} аукционов с сообщениями")
+                logger.info("📊 Найдено %s аукционов с сообщениями", len(auctions))
                 
-                updated_count = 0
-                error_count = 0
+                # Топ-3 ставки и число ставок сразу для всех аукционов одним
+                # запросом: ранг и счетчик считаются оконными функциями.
+                # У пользователей читаются только поля, нужные для имени
+                ranked = select(
+                    Bid.id,
+                    func.row_number().over(
+                        partition_by=Bid.auction_id, order_by=desc(Bid.amount)
+                    ).label('place'),
+                    func.count().over(partition_by=Bid.auction_id).label('bids_count')
+                ).where(
+                    Bid.auction_id.in_([auction.id for auction in auctions])
+                ).subquery()
                 
-                for i, auction in enumerate(auctions, 1):
-                    try:
-                        # Получаем топ-3 ставки с пользователями
-                        stmt_top_bids = select(Bid).where(
-                            Bid.auction_id == auction.id
-                        ).order_by(desc(Bid.amount)).limit(3).options(
-                            selectinload(Bid.user)
-                        )
-                        result_top = await session.execute(stmt_top_bids)
-                        top_bids = result_top.scalars().all()
-                        
-                        # Подготавливаем данные топ ставок
-                        prepared_top_bids = []
-                        for bid in top_bids:
-                            prepared_top_bids.append({
-                                'amount': bid.amount,
-                                'created_at': bid.created_at,
-                                'user': bid.user
-                            })
-                        
-                        # Получаем количество ставок
-                        stmt_count = select(func.count(Bid.id)).where(Bid.auction_id == auction.id)
-                        result_count = await session.execute(stmt_count)
-                        bids_count = result_count.scalar()
-                        
-                        # Обновляем сообщение
-                        await self._update_single_message(auction, prepared_top_bids, bids_count)
-                        
-                        updated_count += 1
-                        logger.info(f"✅ Обновлен аукцион #{auction.id} ({i}/{len(auctions)})")
-                        
-                        # Задержка между обновлениями
-                        if i < len(auctions):
-                            await asyncio.sleep(2)
-                            
-                    except Exception as e:
-                        error_count += 1
-                        logger.error(f"❌ Ошибка при обновлении аукциона #{auction.id}: {e}")
+                stmt_top_bids = select(Bid, ranked.c.bids_count).join(
+                    ranked, ranked.c.id == Bid.id
+                ).join(Bid.user).where(
+                    ranked.c.place <= 3
+                ).order_by(Bid.auction_id, ranked.c.place).options(
+                    contains_eager(Bid.user).load_only(User.username, User.first_name)
+                )
+                result_top = await session.execute(stmt_top_bids)
                 
-                logger.info(f"🎉 Обновление завершено: {updated_count} успешно, {error_count} ошибок")
+                top_bids_by_auction = {}
+                bids_count_by_auction = {}
+                for bid, bids_count in result_top:
+                    top_bids_by_auction.setdefault(bid.auction_id, []).append({
+                        'amount': bid.amount,
+                        'created_at': bid.created_at,
+                        'user': bid.user
+                    })
+                    bids_count_by_auction[bid.auction_id] = bids_count
+                
+                prepared = [
+                    (
+                        auction,
+                        top_bids_by_auction.get(auction.id, []),
+                        bids_count_by_auction.get(auction.id, 0)
+                    )
+                    for auction in auctions
+                ]
+                error_count = 0
+            
+            # Запросы к Telegram идут параллельно, с ограничением по семафору
+            semaphore = asyncio.Semaphore(CHANNEL_EDIT_CONCURRENCY)
+            
+            async def _limited(auction, top_bids, bids_count):
+                async with semaphore:
+                    return await self._update_single_message(auction, top_bids, bids_count)
+            
+            results = await asyncio.gather(
+                *(_limited(*item) for item in prepared),
+                return_exceptions=True
+            )
+            
+            updated_count = 0
+            for (auction, _, _), ok in zip(prepared, results):
+                if ok is True:
+                    updated_count += 1
+                    logger.info("✅ Обновлен аукцион #%s", auction.id)
+                else:
+                    error_count += 1
+                    if isinstance(ok, Exception):
+                        logger.error("❌ Ошибка при обновлении аукциона #%s: %s", auction.id, ok)
+            
+            logger.info("🎉 Обновление завершено: %s успешно, %s ошибок", updated_count, error_count)
                 
         except Exception as e:
-            logger.error(f"❌ Критическая ошибка при обновлении канала: {e}")
+            logger.error("❌ Критическая ошибка при обновлении канала: %s", e)
         finally:
             self.is_updating = False
     
     async def update_expired_messages(self):
-        """Обновить только просроченные сообщения"""
+        """Завершить просроченные аукционы и обновить их сообщения"""
         try:
             logger.info("🔍 Поиск просроченных аукционов...")
             
-            async with get_db() as session:
-                now = datetime.utcnow()
-                
-                stmt = select(Auction).where(
+            async with get_db_read() as session:
+                stmt = select(Auction.id).where(
                     Auction.status == 'active',
-                    Auction.ends_at <= now,
+                    Auction.ends_at <= utcnow(),
                     Auction.channel_message_id.isnot(None)
                 )
                 
                 result = await session.execute(stmt)
-                expired_auctions = result.scalars().all()
-                
-                if not expired_auctions:
-                    logger.info("✅ Просроченных аукционов не найдено")
-                    return 0
-                
-                logger.info(f"🔄 Найдено {len(expired_auctions)} просроченных аукционов")
-                
-                updated_count = 0
-                
-                for auction in expired_auctions:
-                    try:
-                        # Помечаем как завершенные
-                        auction.status = 'ended'
-                        auction.ended_at = now
-                        
-                        # Находим победителя
-                        stmt_winner = select(Bid).where(
-                            Bid.auction_id == auction.id
-                        ).order_by(desc(Bid.amount)).limit(1)
-                        result_winner = await session.execute(stmt_winner)
-                        winning_bid = result_winner.scalar_one_or_none()
-                        
-                        if winning_bid:
-                            auction.winner_id = winning_bid.user_id
-                            auction.current_price = winning_bid.amount
-                        
-                        # Получаем топ-3 ставки
-                        stmt_top_bids = select(Bid).where(
-                            Bid.auction_id == auction.id
-                        ).order_by(desc(Bid.amount)).limit(3).options(
-                            selectinload(Bid.user)
-                        )
-                        result_top = await session.execute(stmt_top_bids)
-                        top_bids = result_top.scalars().all()
-                        
-                        prepared_top_bids = []
-                        for bid in top_bids:
-                            prepared_top_bids.append({
-                                'amount': bid.amount,
-                                'created_at': bid.created_at,
-                                'user': bid.user
-                            })
-                        
-                        stmt_count = select(func.count(Bid.id)).where(Bid.auction_id == auction.id)
-                        result_count = await session.execute(stmt_count)
-                        bids_count = result_count.scalar()
-                        
-                        # Обновляем сообщение
-                        await self._update_single_message(auction, prepared_top_bids, bids_count)
-                        
-                        await session.commit()
-                        updated_count += 1
-                        
-                        logger.info(f"✅ Завершен и обновлен аукцион #{auction.id}")
-                        await asyncio.sleep(1)
-                        
-                    except Exception as e:
-                        logger.error(f"❌ Ошибка при обновлении аукциона #{auction.id}: {e}")
-                        await session.rollback()
-                
-                return updated_count
+                expired_ids = result.scalars().all()
+            
+            if not expired_ids:
+                logger.info("✅ Просроченных аукционов не найдено")
+                return 0
+            
+            logger.info("🔄 Найдено %s просроченных аукционов", len(expired_ids))
+            
+            # Завершение идет через менеджер таймеров: он не даст завершить
+            # аукцион дважды, если таймер или другая проверка уже это делает
+            from utils.timer import auction_timer_manager
+            
+            updated_count = 0
+            for auction_id in expired_ids:
+                if await auction_timer_manager.end_auction(auction_id):
+                    updated_count += 1
+                    logger.info("✅ Завершен и обновлен аукцион #%s", auction_id)
+            
+            return updated_count
                 
         except Exception as e:
-            logger.error(f"❌ Ошибка при обновлении просроченных сообщений: {e}")
+            logger.error("❌ Ошибка при обновлении просроченных сообщений: %s", e)
             return 0
     
-    async def _update_single_message(self, auction: Auction, top_bids=None, bids_count=0):
+    async def _update_single_message(self, auction: Auction, top_bids: List[dict], bids_count: int):
         """Обновить одно сообщение в канале"""
         try:
             if not auction.channel_message_id:
-                logger.warning(f"⚠️ У аукциона #{auction.id} нет ID сообщения")
+                logger.warning("⚠️ У аукциона #%s нет ID сообщения", auction.id)
                 return False
             
             # Определяем тип сообщения (активное/завершенное)
@@ -196,75 +177,37 @@ class ChannelUpdater:
                 next_bid_amount = auction.current_price + auction.step_price
                 keyboard = get_channel_auction_keyboard(auction.id, next_bid_amount)
             
-            # Определяем, есть ли фото
-            has_photo = False
-            try:
-                if auction.photos:
-                    photos_list = json.loads(auction.photos)
-                    if photos_list and photos_list[0]:
-                        has_photo = True
-            except Exception as e:
-                logger.error(f"❌ Ошибка при проверке фото: {e}")
-            
             # Пытаемся обновить сообщение
             max_retries = 3
             for attempt in range(max_retries):
                 try:
-                    if has_photo:
-                        if auction.status == 'ended' or keyboard is None:
-                            # Обновляем подпись к фото без клавиатуры
-                            await self.bot.edit_message_caption(
-                                chat_id=Config.CHANNEL_ID,
-                                message_id=auction.channel_message_id,
-                                caption=message_text,
-                                parse_mode='HTML'
-                            )
-                        else:
-                            # Обновляем подпись к фото с клавиатурой
-                            await self.bot.edit_message_caption(
-                                chat_id=Config.CHANNEL_ID,
-                                message_id=auction.channel_message_id,
-                                caption=message_text,
-                                reply_markup=keyboard,
-                                parse_mode='HTML'
-                            )
-                    else:
-                        if auction.status == 'ended' or keyboard is None:
-                            # Обновляем текст без клавиатуры
-                            await self.bot.edit_message_text(
-                                chat_id=Config.CHANNEL_ID,
-                                message_id=auction.channel_message_id,
-                                text=message_text,
-                                parse_mode='HTML'
-                            )
-                        else:
-                            # Обновляем текст с клавиатурой
-                            await self.bot.edit_message_text(
-                                chat_id=Config.CHANNEL_ID,
-                                message_id=auction.channel_message_id,
-                                text=message_text,
-                                reply_markup=keyboard,
-                                parse_mode='HTML'
-                            )
-                    
+                    await edit_channel_message(self.bot, auction, message_text, reply_markup=keyboard)
                     return True
                     
+                except TelegramRetryAfter as e:
+                    # Telegram просит подождать: ждем указанное время и повторяем
+                    logger.warning("⏳ Лимит Telegram, повтор через %s с (аукцион #%s)", e.retry_after, auction.id)
+                    await asyncio.sleep(e.retry_after)
+                except TelegramBadRequest as e:
+                    # Ошибка в самом запросе (сообщение удалено и т.п.): повтор не поможет
+                    logger.error("❌ Не удалось обновить сообщение #%s для аукциона #%s: %s", auction.channel_message_id, auction.id, e)
+                    return False
                 except Exception as e:
                     error_msg = str(e)
-                    logger.warning(f"❌ Попытка {attempt + 1}/{max_retries} не удалась: {error_msg}")
+                    logger.warning("❌ Попытка %s/%s не удалась: %s", attempt + 1, max_retries, error_msg)
                     
                     if attempt < max_retries - 1:
                         # Экспоненциальная задержка
                         delay = 2 ** (attempt + 1)
                         await asyncio.sleep(delay)
                     else:
-                        logger.error(f"❌ Не удалось обновить сообщение #{auction.channel_message_id} для аукциона #{auction.id}")
+                        logger.error("❌ Не удалось обновить сообщение #%s для аукциона #%s", auction.channel_message_id, auction.id)
                         return False
             
             return False
             
         except Exception as e:
-            logger.error(f"❌ Критическая ошибка при обновлении сообщения: {e}")
+            logger.error("❌ Критическая ошибка при обновлении сообщения: %s", e)
             return False
     
     async def check_and_fix_all_messages(self):
@@ -275,11 +218,11 @@ class ChannelUpdater:
             expired_count = await self.update_expired_messages()
             await self.update_all_channel_messages()
             
-            logger.info(f"✅ Проверка завершена. Исправлено {expired_count} просроченных аукционов.")
+            logger.info("✅ Проверка завершена. Исправлено %s просроченных аукционов.", expired_count)
             return True
             
         except Exception as e:
-            logger.error(f"❌ Ошибка при проверке сообщений: {e}")
+            logger.error("❌ Ошибка при проверке сообщений: %s", e)
             return False
 
 # Глобальный экземпляр
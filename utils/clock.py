@@ -0,0 +1,7 @@
+from datetime import datetime, timezone
+
+
+def utcnow() -> datetime:
+    """Текущее время UTC без tzinfo (в таком виде даты хранятся в БД)"""
+    # datetime.utcnow() устарел начиная с Python 3.12
+    return datetime.now(timezone.utc).replace(tzinfo=None)
@@ -1,12 +1,17 @@
-from datetime import datetime, timedelta
+import functools
 import json
 from database.models import Auction, Bid, Notification
 from config import Config
+from utils.clock import utcnow
 import logging
 import html
 
 logger = logging.getLogger(__name__)
 
+_PLACES = ("🥇", "🥈", "🥉")
+_SEPARATOR_20 = "─" * 20 + "\n"
+_SEPARATOR_30 = "─" * 30 + "\n"
+
 def escape_html(text: str) -> str:
     """Экранировать HTML-сущности"""
     if not text:
@@ -25,12 +30,17 @@ def format_username(user) -> str:
     else:
         return "Аноним"
 
-def format_time_ago(dt) -> str:
+def format_price(value: float) -> str:
+    """Сумма с пробелами между разрядами и запятой: 12 345,50"""
+    return f"{value:,.2f}".replace(",", " ").replace(".", ",")
+
+def format_time_ago(dt, now=None) -> str:
     """Форматирование времени в формате 'X минут назад'"""
     if not dt:
         return "давно"
     
-    now = datetime.utcnow()
+    if now is None:
+        now = utcnow()
     diff = now - dt
     
     if diff.days > 0:
@@ -44,6 +54,22 @@ def format_time_ago(dt) -> str:
     else:
         return "только что"
 
+def format_top_bids(top_bids) -> str:
+    """Строки топ-3 ставок (словари или объекты Bid) для сообщения в канале"""
+    if not top_bids:
+        return ""
+    now = utcnow()
+    lines = []
+    for emoji, bid_data in zip(_PLACES, top_bids):
+        if isinstance(bid_data, dict):
+            user, created_at, amount = bid_data.get('user'), bid_data.get('created_at'), bid_data.get('amount')
+        else:
+            user, created_at, amount = getattr(bid_data, 'user', None), bid_data.created_at, bid_data.amount
+        lines.append(
+            f"{emoji} {format_username(user)}: {format_price(amount)} ₽ ({format_time_ago(created_at, now)})\n"
+        )
+    return "".join(lines)
+
 def format_ended_auction_message(auction: Auction, top_bids=None, bids_count=0) -> str:
     """Форматирование сообщения о завершенном аукционе для канала"""
     
@@ -52,25 +78,14 @@ def format_ended_auction_message(auction: Auction, top_bids=None, bids_count=0)
     description = escape_html(auction.description) if auction.description else ""
     
     # Форматируем топ ставок
-    top_bids_text = ""
-    if top_bids:
-        places = ["🥇", "🥈", "🥉"]
-        for i, bid_data in enumerate(top_bids[:3]):
-            if i < len(places):
-                emoji = places[i]
-                user = bid_data.get('user') if isinstance(bid_data, dict) else bid_data.user if hasattr(bid_data, 'user') else None
-                username = format_username(user)
-                time_ago = format_time_ago(bid_data.get('created_at') if isinstance(bid_data, dict) else bid_data.created_at)
-                amount = bid_data.get('amount') if isinstance(bid_data, dict) else bid_data.amount
-                amount_text = f"{amount:,.2f}".replace(",", " ").replace(".", ",")
-                top_bids_text += f"{emoji} {username}: {amount_text} ₽ ({time_ago})\n"
+    top_bids_text = format_top_bids(top_bids)
     
     # Информация о победителе
     winner_text = ""
     if auction.winner:
         winner = auction.winner
         winner_name = format_username(winner)
-        current_price_text = f"{auction.current_price:,.2f}".replace(",", " ").replace(".", ",")
+        current_price_text = format_price(auction.current_price)
         winner_text = f"🏆 Победитель: {winner_name} - {current_price_text} ₽\n"
     else:
         winner_text = "🏆 Победитель: Не определен\n"
@@ -84,9 +99,9 @@ def format_ended_auction_message(auction: Auction, top_bids=None, bids_count=0)
             pass
     
     # Форматируем цены
-    start_price_text = f"{auction.start_price:,.2f}".replace(",", " ").replace(".", ",")
-    step_price_text = f"{auction.step_price:,.2f}".replace(",", " ").replace(".", ",")
-    current_price_text = f"{auction.current_price:,.2f}".replace(",", " ").replace(".", ",")
+    start_price_text = format_price(auction.start_price)
+    step_price_text = format_price(auction.step_price)
+    current_price_text = format_price(auction.current_price)
     
     message = f"""
 🔔 <b>АУКЦИОН ЗАВЕРШЕН!</b>
@@ -131,7 +146,7 @@ def format_ended_auction_message(auction: Auction, top_bids=None, bids_count=0)
 Спасибо всем за участие!
 """.strip()
     
-    logger.debug(f"Сформировано сообщение для завершенного аукциона #{auction.id}, длина: {len(message)} символов")
+    logger.debug("Сформировано сообщение для завершенного аукциона #%s, длина: %s символов", auction.id, len(message))
     return message
 
 def format_auction_message(auction: Auction, top_bids=None, bids_count=0) -> str:
@@ -145,33 +160,41 @@ def format_auction_message(auction: Auction, top_bids=None, bids_count=0) -> str
     time_remaining = format_time_remaining(auction.last_bid_time, auction.ends_at)
     
     # Форматируем топ ставок
-    top_bids_text = ""
-    if top_bids:
-        places = ["🥇", "🥈", "🥉"]
-        for i, bid_data in enumerate(top_bids[:3]):
-            if i < len(places):
-                emoji = places[i]
-                user = bid_data.get('user') if isinstance(bid_data, dict) else bid_data.user if hasattr(bid_data, 'user') else None
-                username = format_username(user)
-                time_ago = format_time_ago(bid_data.get('created_at') if isinstance(bid_data, dict) else bid_data.created_at)
-                amount = bid_data.get('amount') if isinstance(bid_data, dict) else bid_data.amount
-                amount_text = f"{amount:,.2f}".replace(",", " ").replace(".", ",")
-                top_bids_text += f"{emoji} {username}: {amount_text} ₽ ({time_ago})\n"
+    top_bids_text = format_top_bids(top_bids)
+    
+    current_price_text = format_price(auction.current_price)
+    
+    header = _auction_message_header(
+        auction.title, auction.description, auction.start_price, auction.step_price
+    )
+    
+    message = f"""
+{header}
+
+⏳ Таймер: {time_remaining}
+💰 Текущая цена: {current_price_text} ₽
+📊 Количество ставок: {bids_count}
+
+{top_bids_text}
+""".strip()
     
+    return message
+
+@functools.lru_cache(maxsize=1024)
+def _auction_message_header(title: str, description, start_price: float, step_price: float) -> str:
+    """Неизменная часть сообщения об аукционе (кэшируется по полям лота)"""
     # Экранируем текст
-    title = escape_html(auction.title)
-    description = escape_html(auction.description) if auction.description else ""
+    title = escape_html(title)
+    description = escape_html(description) if description else ""
     
     # Форматируем цены
-    start_price_text = f"{auction.start_price:,.2f}".replace(",", " ").replace(".", ",")
-    step_price_text = f"{auction.step_price:,.2f}".replace(",", " ").replace(".", ",")
-    current_price_text = f"{auction.current_price:,.2f}".replace(",", " ").replace(".", ",")
+    start_price_text = format_price(start_price)
+    step_price_text = format_price(step_price)
     
     # Конвертируем минуты в часы для отображения в сообщении
-    timeout_hours = Config.BID_TIMEOUT_MINUTES // 60
+    timeout_hours = Config.BID_TIMEOUT_HOURS
     
-    message = f"""
-📢 🎰 Внимание, аукцион от P.I.T Store Оренбург!
+    return f"""📢 🎰 Внимание, аукцион от P.I.T Store Оренбург!
 
 <b>{title}</b>
 
@@ -188,88 +211,74 @@ def format_auction_message(auction: Auction, top_bids=None, bids_count=0) -> str
 
 👉 ⚠️ Лот может быть снят с продажи на усмотрение администрации
 
-Не является публичной офертой.
-
-⏳ Таймер: {time_remaining}
-💰 Текущая цена: {current_price_text} ₽
-📊 Количество ставок: {bids_count}
-
-{top_bids_text}
-""".strip()
-    
-    return message
+Не является публичной офертой."""
 
 def format_user_bids(bids) -> str:
     """Форматирование списка ставок пользователя"""
     if not bids:
         return "📭 У вас пока нет ставок."
     
-    text = "📋 <b>Ваши ставки:</b>\n\n"
+    # Части собираются в список и склеиваются один раз
+    parts = ["📋 <b>Ваши ставки:</b>\n\n"]
     
     for bid in bids[:20]:
         auction = bid.auction
         status = "🟢" if auction.status == 'active' else "🔴" if auction.status == 'ended' else "⚫"
         
         # Экранируем название аукциона
-        auction_title = escape_html(auction.title)
-        amount_text = f"{bid.amount:,.2f}".replace(",", " ").replace(".", ",")
-        current_price_text = f"{auction.current_price:,.2f}".replace(",", " ").replace(".", ",")
-        next_bid_text = f"{auction.current_price + auction.step_price:,.2f}".replace(",", " ").replace(".", ",")
-        
-        text += f"{status} <b>{auction_title}</b>\n"
-        text += f"   💰 Ваша ставка: {amount_text} ₽\n"
-        text += f"   🏆 Текущая цена: {current_price_text} ₽\n"
+        parts.append(f"{status} <b>{escape_html(auction.title)}</b>\n")
+        parts.append(f"   💰 Ваша ставка: {format_price(bid.amount)} ₽\n")
+        parts.append(f"   🏆 Текущая цена: {format_price(auction.current_price)} ₽\n")
         
         if auction.status == 'active':
-            text += f"   ⬆️ Минимальная ставка: {next_bid_text} ₽\n"
+            parts.append(f"   ⬆️ Минимальная ставка: {format_price(auction.current_price + auction.step_price)} ₽\n")
         
-        text += f"   📅 Дата ставки: {bid.created_at.strftime('%d.%m.%Y %H:%M')}\n"
-        text += f"   🔗 ID аукциона: {auction.id}\n"
-        text += "─" * 30 + "\n\n"
+        parts.append(f"   📅 Дата ставки: {bid.created_at.strftime('%d.%m.%Y %H:%M')}\n")
+        parts.append(f"   🔗 ID аукциона: {auction.id}\n")
+        parts.append(_SEPARATOR_30 + "\n")
     
     if len(bids) > 20:
-        text += f"\n📄 Показано 20 из {len(bids)} ставок"
+        parts.append(f"\n📄 Показано 20 из {len(bids)} ставок")
     
-    return text
+    return "".join(parts)
 
 def format_bid_history(bids) -> str:
-    """Форматирование истории ставок"""
+    """Форматирование истории ставок (строки с amount, created_at, username, first_name)"""
     if not bids:
         return "📭 История ставок пуста."
     
-    text = "📋 <b>История ставок:</b>\n\n"
+    now = utcnow()
+    parts = ["📋 <b>История ставок:</b>\n\n"]
     
     for i, bid in enumerate(bids, 1):
-        username = format_username(bid.user)
-        amount_text = f"{bid.amount:,.2f}".replace(",", " ").replace(".", ",")
-        time_ago = format_time_ago(bid.created_at)
-        
-        text += f"{i}. {username}\n"
-        text += f"   💰 {amount_text} ₽\n"
-        text += f"   ⏰ {time_ago}\n"
-        text += "─" * 20 + "\n"
+        parts.append(
+            f"{i}. {format_username(bid)}\n"
+            f"   💰 {format_price(bid.amount)} ₽\n"
+            f"   ⏰ {format_time_ago(bid.created_at, now)}\n"
+        )
+        parts.append(_SEPARATOR_20)
     
-    return text
+    return "".join(parts)
 
 def format_notifications(notifications) -> str:
     """Форматирование уведомлений"""
     if not notifications:
         return "📭 У вас нет уведомлений."
     
-    text = "🔔 <b>Ваши уведомления:</b>\n\n"
+    now = utcnow()
+    parts = ["🔔 <b>Ваши уведомления:</b>\n\n"]
     
     for notification in notifications:
         emoji = "✅" if notification.is_read else "🆕"
-        time_ago = format_time_ago(notification.created_at)
         
         # Экранируем текст уведомления
-        message_text = escape_html(notification.message)
-        
-        text += f"{emoji} {message_text}\n"
-        text += f"   ⏰ {time_ago}\n"
-        text += "─" * 30 + "\n"
+        parts.append(
+            f"{emoji} {escape_html(notification.message)}\n"
+            f"   ⏰ {format_time_ago(notification.created_at, now)}\n"
+        )
+        parts.append(_SEPARATOR_30)
     
-    return text
+    return "".join(parts)
 
 def format_admin_stats(stats) -> str:
     """Форматирование статистики для админа"""
@@ -283,10 +292,10 @@ def format_admin_stats(stats) -> str:
 def format_time_remaining(last_bid_time, ends_at=None):
     """Форматирование оставшегося времени"""
     if ends_at:
-        total_seconds = (ends_at - datetime.utcnow()).total_seconds()
+        total_seconds = (ends_at - utcnow()).total_seconds()
     elif last_bid_time:
-        diff = datetime.utcnow() - last_bid_time
-        total_seconds = Config.BID_TIMEOUT_MINUTES * 60 - diff.total_seconds()
+        diff = utcnow() - last_bid_time
+        total_seconds = (Config.BID_TIMEOUT - diff).total_seconds()
     else:
         return "0 минут"
     
@@ -318,7 +327,7 @@ def get_channel_link(auction: 'Auction') -> str:
             username = str(Config.CHANNEL_ID).lstrip('@')
             return f"https://t.me/{username}/{auction.channel_message_id}"
     except Exception as e:
-        logger.error(f"Ошибка формирования ссылки: {e}")
+        logger.error("Ошибка формирования ссылки: %s", e)
         return "Ссылка недоступна"
 
 def format_channel_message_link(auction: 'Auction') -> str:
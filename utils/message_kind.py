@@ -0,0 +1,96 @@
+from typing import Dict, Optional
+
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import InlineKeyboardMarkup
+
+from config import Config
+from database.models import Auction
+
+# Известный тип сообщения в канале: channel_message_id -> True (фото с подписью)
+# или False (текст). Заполняется после успешной правки, чтобы не тратить
+# запрос к Telegram на заведомо неподходящий метод
+_KNOWN_KINDS: Dict[int, bool] = {}
+_KNOWN_KINDS_LIMIT = 10000
+
+# Хэш последнего отправленного содержимого: channel_message_id -> hash(текст, клавиатура).
+# Совпадающая правка не отправляется: Telegram все равно ответил бы
+# "message is not modified", но уже после полного запроса
+_LAST_SENT: Dict[int, int] = {}
+_LAST_SENT_LIMIT = 10000
+
+# Ответы Telegram на правку сообщения не тем методом (подпись у текста и наоборот)
+_WRONG_KIND_ERRORS = (
+    "there is no caption in the message to edit",
+    "there is no text in the message to edit",
+)
+
+
+def channel_message_has_photo(auction: Auction) -> bool:
+    """Сообщение аукциона в канале — фото с подписью (иначе текст)"""
+    known = _KNOWN_KINDS.get(auction.channel_message_id)
+    if known is not None:
+        return known
+    photos_list = auction.photo_list
+    return bool(photos_list and photos_list[0])
+
+
+def remember_channel_message_kind(message_id: int, has_photo: bool):
+    """Запомнить тип сообщения, для которого правка прошла успешно"""
+    if message_id not in _KNOWN_KINDS and len(_KNOWN_KINDS) >= _KNOWN_KINDS_LIMIT:
+        _KNOWN_KINDS.clear()
+    _KNOWN_KINDS[message_id] = has_photo
+
+
+def forget_channel_message(message_id: int):
+    """Забыть сведения об удаленном сообщении канала"""
+    _KNOWN_KINDS.pop(message_id, None)
+    _LAST_SENT.pop(message_id, None)
+
+
+async def _edit(bot, message_id: int, has_photo: bool, text: str,
+                reply_markup: Optional[InlineKeyboardMarkup]):
+    """Один вызов edit_message_caption или edit_message_text"""
+    try:
+        if has_photo:
+            await bot.edit_message_caption(
+                chat_id=Config.CHANNEL_ID,
+                message_id=message_id,
+                caption=text,
+                reply_markup=reply_markup,
+                parse_mode='HTML'
+            )
+        else:
+            await bot.edit_message_text(
+                chat_id=Config.CHANNEL_ID,
+                message_id=message_id,
+                text=text,
+                reply_markup=reply_markup,
+                parse_mode='HTML'
+            )
+    except TelegramBadRequest as e:
+        # Текст не изменился: метод подходит, правка не нужна
+        if "message is not modified" not in str(e):
+            raise
+
+
+async def edit_channel_message(bot, auction: Auction, text: str,
+                               reply_markup: Optional[InlineKeyboardMarkup] = None):
+    """Отредактировать сообщение аукциона в канале подходящим методом"""
+    message_id = auction.channel_message_id
+    content_hash = hash((text, reply_markup.model_dump_json() if reply_markup else None))
+    if _LAST_SENT.get(message_id) == content_hash:
+        return
+    has_photo = channel_message_has_photo(auction)
+    try:
+        await _edit(bot, message_id, has_photo, text, reply_markup)
+    except TelegramBadRequest as e:
+        # Другой метод пробуем только при ответе о неверном типе сообщения;
+        # остальные ошибки (и TelegramRetryAfter) обрабатывает вызывающий код
+        if not any(error in str(e) for error in _WRONG_KIND_ERRORS):
+            raise
+        has_photo = not has_photo
+        await _edit(bot, message_id, has_photo, text, reply_markup)
+    remember_channel_message_kind(message_id, has_photo)
+    if message_id not in _LAST_SENT and len(_LAST_SENT) >= _LAST_SENT_LIMIT:
+        _LAST_SENT.clear()
+    _LAST_SENT[message_id] = content_hash
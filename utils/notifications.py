@@ -1,22 +1,85 @@
 import asyncio
 from datetime import datetime
-from sqlalchemy import select
+from typing import List, Optional
+from sqlalchemy import select, insert
 import logging
 import html
 
-from database.database import get_db
+from aiogram.exceptions import TelegramRetryAfter
+
+from database.database import get_db, get_db_read
 from database.models import User, Auction, AuctionSubscription, Notification
 from config import Config
 from utils.formatters import get_channel_link, format_username
 
 logger = logging.getLogger(__name__)
 
+# Сколько уведомлений отправляется одновременно. Ограничение общее для
+# процесса: рассылки по нескольким ставкам подряд делят одни и те же слоты
+NOTIFICATION_CONCURRENCY = 20
+_send_semaphore = asyncio.Semaphore(NOTIFICATION_CONCURRENCY)
+
+# Записи уведомлений копятся и сохраняются одним INSERT: через
+# NOTIFICATION_FLUSH_INTERVAL после первой записи или сразу по набору пачки
+NOTIFICATION_FLUSH_INTERVAL = 0.2
+NOTIFICATION_BATCH_SIZE = 100
+_pending_notifications: List[dict] = []
+_flush_task: Optional[asyncio.Task] = None
+
 def escape_html(text: str) -> str:
     """Экранировать HTML-сущности"""
     if not text:
         return ""
     return html.escape(str(text))
 
+async def _send_message(bot, chat_id: int, message: str):
+    """Отправить уведомление в пределах общего ограничения параллельности"""
+    async with _send_semaphore:
+        try:
+            await bot.send_message(
+                chat_id=chat_id,
+                text=message,
+                parse_mode="HTML",
+                disable_web_page_preview=True
+            )
+        except TelegramRetryAfter as e:
+            # Telegram просит подождать: пауза держит слот, притормаживая
+            # и остальные отправки, затем один повтор
+            logger.warning("Лимит Telegram при рассылке, повтор через %s с", e.retry_after)
+            await asyncio.sleep(e.retry_after)
+            await bot.send_message(
+                chat_id=chat_id,
+                text=message,
+                parse_mode="HTML",
+                disable_web_page_preview=True
+            )
+
+def queue_notifications(rows: List[dict]):
+    """Поставить записи уведомлений (user_id, auction_id, message) в очередь на сохранение"""
+    global _flush_task
+    _pending_notifications.extend(rows)
+    if len(_pending_notifications) >= NOTIFICATION_BATCH_SIZE:
+        _flush_task = asyncio.create_task(flush_notifications())
+    elif _flush_task is None or _flush_task.done():
+        _flush_task = asyncio.create_task(_flush_notifications_later())
+
+async def _flush_notifications_later():
+    """Сохранить накопленные уведомления по истечении окна"""
+    await asyncio.sleep(NOTIFICATION_FLUSH_INTERVAL)
+    await flush_notifications()
+
+async def flush_notifications():
+    """Сохранить накопленные уведомления одним INSERT"""
+    global _pending_notifications
+    if not _pending_notifications:
+        return
+    batch, _pending_notifications = _pending_notifications, []
+    try:
+        async with get_db() as session:
+            await session.execute(insert(Notification), batch)
+    except Exception as e:
+        logger.error("Не удалось сохранить уведомления (%s шт.): %s", len(batch), e)
+
 async def send_outbid_notification(bot, user: User, auction: Auction, new_bid: float):
     """Уведомление пользователя, которого перебили"""
     try:
@@ -31,82 +94,73 @@ async def send_outbid_notification(bot, user: User, auction: Auction, new_bid: f
             f"🔗 {link}"
         )
         
-        await bot.send_message(
-            chat_id=user.telegram_id,
-            text=message,
-            parse_mode="HTML",
-            disable_web_page_preview=True
-        )
+        await _send_message(bot, user.telegram_id, message)
         
         # Сохраняем уведомление в БД
-        async with get_db() as session:
-            notification = Notification(
-                user_id=user.id,
-                auction_id=auction.id,
-                message=f"Вашу ставку в аукционе '{auction.title}' перебили. Новая ставка: {new_bid} ₽"
-            )
-            session.add(notification)
-            await session.commit()
+        queue_notifications([{
+            "user_id": user.id,
+            "auction_id": auction.id,
+            "message": f"Вашу ставку в аукционе '{auction.title}' перебили. Новая ставка: {new_bid} ₽"
+        }])
             
     except Exception as e:
-        logger.error(f"Ошибка при отправке уведомления о перебитии: {e}")
+        logger.error("Ошибка при отправке уведомления о перебитии: %s", e)
+
+async def _fetch_subscribers(auction_id: int, exclude_user_id: Optional[int] = None) -> List[User]:
+    """Пользователи, подписанные на аукцион, одним запросом"""
+    async with get_db_read() as session:
+        stmt = select(User).join(
+            AuctionSubscription, AuctionSubscription.user_id == User.id
+        ).where(AuctionSubscription.auction_id == auction_id)
+        if exclude_user_id is not None:
+            stmt = stmt.where(User.id != exclude_user_id)
+        result = await session.execute(stmt)
+        return result.scalars().all()
+
+async def _send_to_users(bot, users: List[User], message: str) -> List[User]:
+    """Разослать сообщение параллельно и вернуть тех, кому оно доставлено"""
+    async def _send(user: User) -> bool:
+        try:
+            await _send_message(bot, user.telegram_id, message)
+            return True
+        except Exception as e:
+            logger.error("Ошибка при отправке уведомления пользователю %s: %s", user.telegram_id, e)
+            return False
+    
+    results = await asyncio.gather(*(_send(user) for user in users))
+    return [user for user, delivered in zip(users, results) if delivered]
 
 async def send_subscription_notification(bot, auction: Auction, bid_user: User, amount: float):
     """Уведомление подписчиков аукциона о новой ставке"""
     try:
-        async with get_db() as session:
-            # Получаем всех подписчиков, кроме сделавшего ставку
-            stmt = select(AuctionSubscription).where(
-                AuctionSubscription.auction_id == auction.id,
-                AuctionSubscription.user_id != bid_user.id
-            )
-            
-            result = await session.execute(stmt)
-            subscriptions = result.scalars().all()
-            
-            link = get_channel_link(auction)
-            
-            for subscription in subscriptions:
-                try:
-                    # Получаем пользователя
-                    stmt_user = select(User).where(User.id == subscription.user_id)
-                    result_user = await session.execute(stmt_user)
-                    user = result_user.scalar_one_or_none()
-                    
-                    if not user:
-                        continue
-                    
-                    message = (
-                        f"🎯 <b>Новая ставка в аукционе!</b>\n\n"
-                        f"🏷 Лот: {escape_html(auction.title)}\n"
-                        f"💰 Новая ставка: {amount} ₽\n"
-                        f"👤 Ставку сделал: {format_username(bid_user)}\n"
-                        f"⬆️ Минимальная ставка: {amount + auction.step_price} ₽\n\n"
-                        f"🔗 {link}"
-                    )
-                    
-                    await bot.send_message(
-                        chat_id=user.telegram_id,
-                        text=message,
-                        parse_mode="HTML",
-                        disable_web_page_preview=True
-                    )
-                    
-                    # Сохраняем уведомление в БД
-                    notification = Notification(
-                        user_id=user.id,
-                        auction_id=auction.id,
-                        message=f"Новая ставка в аукционе '{auction.title}'. Сумма: {amount} ₽"
-                    )
-                    session.add(notification)
-                    
-                except Exception as e:
-                    logger.error(f"Ошибка при уведомлении подписчика {subscription.user_id}: {e}")
-            
-            await session.commit()
+        # Получаем всех подписчиков, кроме сделавшего ставку
+        users = await _fetch_subscribers(auction.id, exclude_user_id=bid_user.id)
+        if not users:
+            return
+        
+        link = get_channel_link(auction)
+        message = (
+            f"🎯 <b>Новая ставка в аукционе!</b>\n\n"
+            f"🏷 Лот: {escape_html(auction.title)}\n"
+            f"💰 Новая ставка: {amount} ₽\n"
+            f"👤 Ставку сделал: {format_username(bid_user)}\n"
+            f"⬆️ Минимальная ставка: {amount + auction.step_price} ₽\n\n"
+            f"🔗 {link}"
+        )
+        
+        delivered = await _send_to_users(bot, users, message)
+        if not delivered:
+            return
+        
+        # Сохраняем уведомления в БД
+        notification_text = f"Новая ставка в аукционе '{auction.title}'. Сумма: {amount} ₽"
+        queue_notifications([
+            {"user_id": user.id, "auction_id": auction.id, "message": notification_text}
+            for user in delivered
+        ])
             
     except Exception as e:
-        logger.error(f"Ошибка при уведомлении подписчиков: {e}")
+        logger.error("Ошибка при уведомлении подписчиков: %s", e)
 
 async def send_winner_notification(bot, auction: Auction, winner: User):
     """Уведомление победителя аукциона"""
@@ -133,67 +187,35 @@ async def send_winner_notification(bot, auction: Auction, winner: User):
             f"• Возврат/обмен согласно законодательству РФ\n"
         )
         
-        await bot.send_message(
-            chat_id=winner.telegram_id,
-            text=message,
-            parse_mode="HTML",
-            disable_web_page_preview=True
-        )
+        await _send_message(bot, winner.telegram_id, message)
         
         # Сохраняем уведомление в БД
-        async with get_db() as session:
-            notification = Notification(
-                user_id=winner.id,
-                auction_id=auction.id,
-                message=f"Вы выиграли аукцион '{auction.title}'! Сумма: {auction.current_price} ₽"
-            )
-            session.add(notification)
-            await session.commit()
+        queue_notifications([{
+            "user_id": winner.id,
+            "auction_id": auction.id,
+            "message": f"Вы выиграли аукцион '{auction.title}'! Сумма: {auction.current_price} ₽"
+        }])
             
     except Exception as e:
-        logger.error(f"Ошибка при уведомлении победителя: {e}")
+        logger.error("Ошибка при уведомлении победителя: %s", e)
 
 async def send_auction_ending_soon_notification(bot, auction: Auction, minutes_left: int):
     """Уведомление о скором завершении аукциона"""
     try:
-        async with get_db() as session:
-            # Получаем всех подписчиков
-            stmt = select(AuctionSubscription).where(
-                AuctionSubscription.auction_id == auction.id
-            )
-            
-            result = await session.execute(stmt)
-            subscriptions = result.scalars().all()
-            
-            link = get_channel_link(auction)
-            
-            for subscription in subscriptions:
-                try:
-                    # Получаем пользователя
-                    stmt_user = select(User).where(User.id == subscription.user_id)
-                    result_user = await session.execute(stmt_user)
-                    user = result_user.scalar_one_or_none()
-                    
-                    if not user:
-                        continue
-                    
-                    message = (
-                        f"⏰ <b>Аукцион скоро завершится!</b>\n\n"
-                        f"🏷 Лот: {escape_html(auction.title)}\n"
-                        f"💰 Текущая цена: {auction.current_price} ₽\n"
-                        f"⏳ Осталось: {minutes_left} минут\n\n"
-                        f"🔗 {link}"
-                    )
-                    
-                    await bot.send_message(
-                        chat_id=user.telegram_id,
-                        text=message,
-                        parse_mode="HTML",
-                        disable_web_page_preview=True
-                    )
-                    
-                except Exception as e:
-                    logger.error(f"Ошибка при отправке уведомления о завершении: {e}")
+        users = await _fetch_subscribers(auction.id)
+        if not users:
+            return
+        
+        link = get_channel_link(auction)
+        message = (
+            f"⏰ <b>Аукцион скоро завершится!</b>\n\n"
+            f"🏷 Лот: {escape_html(auction.title)}\n"
+            f"💰 Текущая цена: {auction.current_price} ₽\n"
+            f"⏳ Осталось: {minutes_left} минут\n\n"
+            f"🔗 {link}"
+        )
+        
+        await _send_to_users(bot, users, message)
                     
     except Exception as e:
-        logger.error(f"Ошибка при уведомлении о завершении аукциона: {e}")
\ No newline at end of file
+        logger.error("Ошибка при уведомлении о завершении аукциона: %s", e)
@@ -1,20 +1,25 @@
 import asyncio
 import logging
 from datetime import datetime, timedelta
-from typing import Dict
+from typing import Dict, Set
 import random
-import json
 
+from aiogram.exceptions import TelegramRetryAfter
 from sqlalchemy import select, func
+from sqlalchemy.orm import contains_eager
 
-from database.database import get_db
+from database.database import get_db, get_db_read
 from database.models import Auction, Bid, User
-from config import Config
+from utils.clock import utcnow
 from utils.formatters import format_auction_message
+from utils.message_kind import edit_channel_message
 from keyboards.inline import get_channel_auction_keyboard
 
 logger = logging.getLogger(__name__)
 
+# Окно, за которое запросы на обновление одного аукциона склеиваются в одну правку
+COALESCE_WINDOW = 0.5
+
 class PeriodicUpdater:
     """Менеджер для периодического обновления таймеров в канале"""
     
@@ -25,6 +30,11 @@ class PeriodicUpdater:
         self.bot = None
         self.last_update_time: Dict[int, datetime] = {}
         self._timer_check_interval = 300  # Проверка таймеров каждые 5 минут
+        # Аукционы, ожидающие обновления сообщения; повторные запросы
+        # в пределах окна схлопываются в одну правку с последним состоянием
+        self._pending: Set[int] = set()
+        self._pending_event = asyncio.Event()
+        self._flush_task = None
     
     def set_bot(self, bot):
         """Установить бота для обновления сообщений"""
@@ -37,17 +47,19 @@ class PeriodicUpdater:
         
         self.is_running = True
         self.task = asyncio.create_task(self._periodic_update_task())
-        logger.info(f"Запущено периодическое обновление таймеров (интервал: {self.update_interval} сек)")
+        self._flush_task = asyncio.create_task(self._flush_pending_task())
+        logger.info("Запущено периодическое обновление таймеров (интервал: %s сек)", self.update_interval)
     
     async def stop(self):
         """Остановка периодического обновления"""
         self.is_running = False
-        if self.task:
-            self.task.cancel()
-            try:
-                await self.task
-            except asyncio.CancelledError:
-                pass
+        for task in (self.task, self._flush_task):
+            if task:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
         logger.info("Периодическое обновление таймеров остановлено")
     
     async def _periodic_update_task(self):
@@ -65,7 +77,7 @@ class PeriodicUpdater:
                         await self._check_timers()
                         
                 except Exception as e:
-                    logger.error(f"Ошибка при периодическом обновлении: {e}")
+                    logger.error("Ошибка при периодическом обновлении: %s", e)
                 
                 # Ждем указанный интервал
                 await asyncio.sleep(self.update_interval)
@@ -73,9 +85,40 @@ class PeriodicUpdater:
         except asyncio.CancelledError:
             logger.info("Задача периодического обновления отменена")
         except Exception as e:
-            logger.error(f"Критическая ошибка в периодическом обновлении: {e}")
+            logger.error("Критическая ошибка в периодическом обновлении: %s", e)
             self.is_running = False
     
+    def schedule_update(self, auction_id: int):
+        """Поставить обновление сообщения аукциона в очередь (без ожидания)"""
+        self._pending.add(auction_id)
+        self._pending_event.set()
+    
+    async def _flush_pending_task(self):
+        """Фоновая задача: раз в окно отправляет по одной правке на аукцион"""
+        try:
+            while self.is_running:
+                await self._pending_event.wait()
+                # Копим запросы в течение окна, чтобы серия ставок дала одну правку
+                await asyncio.sleep(COALESCE_WINDOW)
+                self._pending_event.clear()
+                batch, self._pending = self._pending, set()
+                
+                for auction_id in batch:
+                    try:
+                        await self._update_auction_by_id(auction_id)
+                    except TelegramRetryAfter as e:
+                        logger.warning("Лимит Telegram, повтор обновления через %s сек", e.retry_after)
+                        await asyncio.sleep(e.retry_after)
+                        # Свежие запросы уже в self._pending, добавляем к ним несделанные
+                        self._pending.update(batch)
+                        self._pending_event.set()
+                        break
+                    except Exception as e:
+                        logger.error("Ошибка при обновлении аукциона #%s: %s", auction_id, e)
+                    batch = batch - {auction_id}
+        except asyncio.CancelledError:
+            logger.info("Задача отложенных обновлений отменена")
+    
     async def _check_timers(self):
         """Проверка таймеров на корректность"""
         try:
@@ -85,28 +128,28 @@ class PeriodicUpdater:
             
             # Проверяем таймеры в менеджере
             active_timer_count = len(auction_timer_manager.active_timers)
-            logger.debug(f"Активных таймеров в менеджере: {active_timer_count}")
+            logger.debug("Активных таймеров в менеджере: %s", active_timer_count)
             
             # Проверяем активные аукционы в БД
             async with get_db() as session:
                 stmt = select(Auction).where(
                     Auction.status == 'active',
                     Auction.ends_at.isnot(None),
-                    Auction.ends_at > datetime.utcnow()
+                    Auction.ends_at > utcnow()
                 )
                 result = await session.execute(stmt)
                 active_auctions = result.scalars().all()
                 
-                logger.debug(f"Активных аукционов в БД: {len(active_auctions)}")
+                logger.debug("Активных аукционов в БД: %s", len(active_auctions))
                 
                 # Проверяем, для всех ли активных аукционов запущены таймеры
                 for auction in active_auctions:
                     if auction.id not in auction_timer_manager.active_timers:
-                        logger.warning(f"⚠️ Для активного аукциона #{auction.id} нет таймера! Запускаю...")
+                        logger.warning("⚠️ Для активного аукциона #%s нет таймера! Запускаю...", auction.id)
                         await auction_timer_manager.start_auction_timer(auction.id, auction.ends_at)
                         
         except Exception as e:
-            logger.error(f"Ошибка при проверке таймеров: {e}")
+            logger.error("Ошибка при проверке таймеров: %s", e)
     
     async def _update_all_active_auctions(self):
         """Обновить все активные аукционы"""
@@ -114,7 +157,7 @@ class PeriodicUpdater:
             return
         
         try:
-            async with get_db() as session:
+            async with get_db_read() as session:
                 # Получаем все активные аукционы
                 stmt = select(Auction).where(
                     Auction.status == 'active',
@@ -127,7 +170,7 @@ class PeriodicUpdater:
                 if not auctions:
                     return
                 
-                logger.debug(f"Периодическое обновление: найдено {len(auctions)} активных аукционов")
+                logger.debug("Периодическое обновление: найдено %s активных аукционов", len(auctions))
                 
                 # Обновляем каждый аукцион (убираем проверку времени)
                 for i, auction in enumerate(auctions):
@@ -140,45 +183,35 @@ class PeriodicUpdater:
                             await asyncio.sleep(delay)
                             
                     except Exception as e:
-                        logger.error(f"Ошибка при обновлении аукциона #{auction.id}: {e}")
+                        logger.error("Ошибка при обновлении аукциона #%s: %s", auction.id, e)
                         
         except Exception as e:
-            logger.error(f"Ошибка при получении списка аукционов: {e}")
+            logger.error("Ошибка при получении списка аукционов: %s", e)
     
     async def _update_single_auction_safe(self, session, auction: Auction):
         """Безопасное обновление одного аукциона (использует переданную сессию)"""
         try:
-            # Перезагружаем аукцион в текущей сессии
-            stmt_reload = select(Auction).where(Auction.id == auction.id)
-            result_reload = await session.execute(stmt_reload)
-            current_auction = result_reload.scalar_one()
+            # Аукцион только что загружен в этой же сессии, перезагрузка не нужна
+            current_auction = auction
             
-            # Получаем топ-3 ставки с пользователями
-            stmt_top_bids = select(Bid).where(
+            # Топ-3 ставки с пользователями и общее число ставок одним запросом;
+            # у пользователей читаются только поля, нужные для имени
+            stmt_top_bids = select(Bid, func.count().over()).join(Bid.user).where(
                 Bid.auction_id == auction.id
-            ).order_by(Bid.amount.desc()).limit(3)
+            ).order_by(Bid.amount.desc()).limit(3).options(contains_eager(Bid.user).load_only(User.username, User.first_name))
             result_top = await session.execute(stmt_top_bids)
-            top_bids = result_top.scalars().all()
+            rows = result_top.all()
+            bids_count = rows[0][1] if rows else 0
             
             # Подготавливаем данные топ ставок
-            prepared_top_bids = []
-            for bid in top_bids:
-                # Загружаем пользователя для каждой ставки
-                stmt_user = select(User).where(User.id == bid.user_id)
-                result_user = await session.execute(stmt_user)
-                user = result_user.scalar_one_or_none()
-                
-                if user:
-                    prepared_top_bids.append({
-                        'amount': bid.amount,
-                        'created_at': bid.created_at,
-                        'user': user
-                    })
-            
-            # Получаем количество ставки
-            stmt_count = select(func.count(Bid.id)).where(Bid.auction_id == auction.id)
-            result_count = await session.execute(stmt_count)
-            bids_count = result_count.scalar()
+            prepared_top_bids = [
+                {
+                    'amount': bid.amount,
+                    'created_at': bid.created_at,
+                    'user': bid.user
+                }
+                for bid, _ in rows
+            ]
             
             # Формируем сообщение
             message_text = format_auction_message(current_auction, prepared_top_bids, bids_count)
@@ -187,82 +220,49 @@ class PeriodicUpdater:
             # Обновляем сообщение в канале
             await self._edit_channel_message_safe(current_auction, message_text, next_bid_amount)
             
-            logger.debug(f"Периодическое обновление: аукцион #{current_auction.id} обновлен")
+            logger.debug("Периодическое обновление: аукцион #%s обновлен", current_auction.id)
             
+        except TelegramRetryAfter:
+            raise
         except Exception as e:
-            logger.error(f"Ошибка при подготовке данных аукциона #{auction.id}: {e}")
+            logger.error("Ошибка при подготовке данных аукциона #%s: %s", auction.id, e)
             raise
     
     async def _edit_channel_message_safe(self, auction: Auction, message_text: str, next_bid_amount: float):
         """Безопасное обновление сообщения в канале"""
         try:
-            # Проверяем, есть ли фото у аукциона
-            has_photo = False
-            try:
-                if auction.photos:
-                    photos_list = json.loads(auction.photos)
-                    has_photo = bool(photos_list and photos_list[0])
-            except Exception as e:
-                logger.error(f"Ошибка при проверке фото аукциона #{auction.id}: {e}")
-            
-            # Пытаемся определить тип сообщения и отредактировать
-            max_retries = 2
-            for attempt in range(max_retries):
-                try:
-                    if has_photo:
-                        # Пробуем обновить подпись к фото
-                        await self.bot.edit_message_caption(
-                            chat_id=Config.CHANNEL_ID,
-                            message_id=auction.channel_message_id,
-                            caption=message_text,
-                            reply_markup=get_channel_auction_keyboard(auction.id, next_bid_amount),
-                            parse_mode='HTML'
-                        )
-                        break
-                    else:
-                        # Пробуем обновить текст сообщения
-                        await self.bot.edit_message_text(
-                            chat_id=Config.CHANNEL_ID,
-                            message_id=auction.channel_message_id,
-                            text=message_text,
-                            reply_markup=get_channel_auction_keyboard(auction.id, next_bid_amount),
-                            parse_mode='HTML'
-                        )
-                        break
-                        
-                except Exception as e:
-                    error_msg = str(e)
-                    
-                    # Если первая попытка не удалась, пробуем другой метод
-                    if attempt == 0:
-                        logger.debug(f"Попытка {attempt + 1} не удалась для аукциона #{auction.id}, пробую другой метод: {error_msg}")
-                        # Меняем метод редактирования
-                        has_photo = not has_photo
-                    else:
-                        logger.warning(f"Не удалось обновить сообщение для аукциона #{auction.id}: {error_msg}")
-                        break
-                
+            await edit_channel_message(
+                self.bot,
+                auction,
+                message_text,
+                reply_markup=get_channel_auction_keyboard(auction.id, next_bid_amount)
+            )
+        except TelegramRetryAfter:
+            raise
         except Exception as e:
-            logger.warning(f"Не удалось обновить сообщение для аукциона #{auction.id}: {e}")
+            logger.warning("Не удалось обновить сообщение для аукциона #%s: %s", auction.id, e)
+    
+    async def _update_auction_by_id(self, auction_id: int):
+        """Обновить сообщение аукциона по его текущему состоянию в БД"""
+        async with get_db_read() as session:
+            stmt = select(Auction).where(
+                Auction.id == auction_id,
+                Auction.status == 'active',
+                Auction.channel_message_id.isnot(None)
+            )
+            result = await session.execute(stmt)
+            auction = result.scalar_one_or_none()
+            
+            if auction:
+                await self._update_single_auction_safe(session, auction)
+                logger.debug("Обновлен аукцион #%s", auction_id)
     
     async def force_update_auction(self, auction_id: int):
         """Принудительно обновить конкретный аукцион"""
         try:
-            async with get_db() as session:
-                stmt = select(Auction).where(
-                    Auction.id == auction_id,
-                    Auction.status == 'active',
-                    Auction.channel_message_id.isnot(None)
-                )
-                result = await session.execute(stmt)
-                auction = result.scalar_one_or_none()
-                
-                if auction:
-                    await self._update_single_auction_safe(session, auction)
-                    logger.debug(f"Принудительно обновлен аукцион #{auction_id}")
-                    
+            await self._update_auction_by_id(auction_id)
         except Exception as e:
-            logger.error(f"Ошибка при принудительном обновлении аукциона #{auction_id}: {e}")
+            logger.error("Ошибка при принудительном обновлении аукциона #%s: %s", auction_id, e)
     
     def clear_update_history(self, auction_id: int = None):
         """Очистить историю обновлений"""
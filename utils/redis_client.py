@@ -0,0 +1,30 @@
+import logging
+from typing import TYPE_CHECKING, Optional
+
+from config import Config
+
+if TYPE_CHECKING:
+    from redis.asyncio import Redis
+
+logger = logging.getLogger(__name__)
+
+_redis = None
+
+def get_redis() -> Optional["Redis"]:
+    """Общий клиент Redis или None, если REDIS_URL не задан"""
+    global _redis
+    if not Config.REDIS_URL:
+        return None
+    if _redis is None:
+        # Пакет redis нужен только при заданном REDIS_URL
+        from redis.asyncio import Redis
+        _redis = Redis.from_url(Config.REDIS_URL)
+        logger.info("Подключение к Redis настроено")
+    return _redis
+
+async def close_redis():
+    """Закрыть соединения с Redis"""
+    global _redis
+    if _redis is not None:
+        await _redis.aclose()
+        _redis = None
@@ -1,25 +1,44 @@
 import asyncio
-from datetime import datetime, timedelta
-from typing import Dict
+import heapq
+from datetime import datetime
+from typing import Dict, List, Optional, Set, Tuple
 import logging
-from sqlalchemy import select, desc
-from sqlalchemy.orm import selectinload
-import json
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+from sqlalchemy import select, desc, func
+from sqlalchemy.orm import contains_eager
 
 from database.database import get_db
 from database.models import Auction, User, Bid
 from utils.formatters import format_ended_auction_message
+from utils.message_kind import edit_channel_message
 from utils.periodic_updater import periodic_updater
+from utils.active_auctions import invalidate_active_auctions
 from utils.notifications import send_winner_notification
 from config import Config
+from utils.clock import utcnow
 
 logger = logging.getLogger(__name__)
 
+# Интервал страховочной проверки просроченных аукционов в БД (секунды)
+EXPIRED_CHECK_INTERVAL = 30
+
 class AuctionTimerManager:
     """Менеджер таймеров для аукционов"""
     
     def __init__(self):
-        self.active_timers: Dict[int, asyncio.Task] = {}
+        # Все таймеры обслуживает одна задача-планировщик с min-кучей
+        # (ends_at, auction_id) вместо отдельной спящей задачи на аукцион.
+        # active_timers хранит актуальный срок. Продление срока меняет только
+        # словарь: планировщик, дойдя до старой записи, кладет в кучу новый срок.
+        # Записи отмененных таймеров и записи позже актуального срока пропускаются
+        self.active_timers: Dict[int, datetime] = {}
+        self._heap: List[Tuple[datetime, int]] = []
+        self._wakeup = asyncio.Event()
+        self._scheduler_task: Optional[asyncio.Task] = None
+        self._ending_tasks: Set[asyncio.Task] = set()
+        # Аукционы, которые завершаются прямо сейчас: таймер, страховочная
+        # проверка и проверки при запуске могут сработать одновременно
+        self._ending: Set[int] = set()
         self.lock = asyncio.Lock()
         self.bot = None
         self._stopping = False
@@ -28,17 +47,28 @@ class AuctionTimerManager:
         """Установить бота для таймеров"""
         self.bot = bot
     
+    def start(self):
+        """Запуск планировщика таймеров"""
+        self._stopping = False
+        if self._scheduler_task is None or self._scheduler_task.done():
+            self._scheduler_task = asyncio.create_task(self._run_scheduler())
+    
+    def cancel_auction_timer(self, auction_id: int):
+        """Отмена таймера аукциона (запись в куче станет неактуальной)"""
+        if self.active_timers.pop(auction_id, None) is not None:
+            logger.info("Таймер для аукциона #%s отменен", auction_id)
+    
+    def extend_auction_timer(self, auction_id: int, ends_at: datetime) -> bool:
+        """Продлить запущенный таймер после ставки (без запроса к БД и записи в кучу)"""
+        current = self.active_timers.get(auction_id)
+        if current is None or ends_at < current:
+            return False
+        self.active_timers[auction_id] = ends_at
+        return True
+    
     async def start_auction_timer(self, auction_id: int, ends_at: datetime):
         """Запуск таймера для аукциона"""
         async with self.lock:
-            # Отменяем старый таймер, если есть
-            if auction_id in self.active_timers:
-                try:
-                    self.active_timers[auction_id].cancel()
-                    await asyncio.sleep(0.1)
-                except:
-                    pass
-            
             # Проверяем, что аукцион еще активен
             async with get_db() as session:
                 stmt = select(Auction).where(
@@ -49,25 +79,27 @@ class AuctionTimerManager:
                 auction = result.scalar_one_or_none()
                 
                 if not auction:
-                    logger.warning(f"Аукцион #{auction_id} не найден или уже завершен")
+                    logger.warning("Аукцион #%s не найден или уже завершен", auction_id)
                     return
             
             # Рассчитываем время до завершения
-            now = datetime.utcnow()
+            now = utcnow()
             time_diff = (ends_at - now).total_seconds()
             
             if time_diff <= 0:
                 # Время уже истекло - завершаем немедленно
-                logger.info(f"Аукцион #{auction_id} уже просрочен, завершаю...")
-                await self._end_auction(auction_id)
+                logger.info("Аукцион #%s уже просрочен, завершаю...", auction_id)
+                await self.end_auction(auction_id)
                 return
             
-            # Создаем новую задачу
-            task = asyncio.create_task(
-                self._auction_timer_task(auction_id, ends_at)
-            )
-            self.active_timers[auction_id] = task
-            logger.info(f"Таймер запущен для аукциона #{auction_id}, завершится через {time_diff:.0f} секунд")
+            # Старый срок, если был, перекрывается новым. Более поздний срок
+            # планировщик подхватит сам, в кучу кладем только более ранний
+            current = self.active_timers.get(auction_id)
+            self.active_timers[auction_id] = ends_at
+            if current is None or ends_at < current:
+                heapq.heappush(self._heap, (ends_at, auction_id))
+                self._wakeup.set()
+            logger.info("Таймер запущен для аукциона #%s, завершится через %.0f секунд", auction_id, time_diff)
     
     async def restore_timers_improved(self):
         """Улучшенное восстановление таймеров после перезапуска бота"""
@@ -82,7 +114,7 @@ class AuctionTimerManager:
                 result = await session.execute(stmt)
                 auctions = result.scalars().all()
                 
-                logger.info(f"Найдено {len(auctions)} активных аукционов в базе")
+                logger.info("Найдено %s активных аукционов в базе", len(auctions))
                 
                 restored_count = 0
                 expired_count = 0
@@ -90,159 +122,114 @@ class AuctionTimerManager:
                 
                 for auction in auctions:
                     try:
-                        logger.info(f"Проверяю аукцион #{auction.id}: {auction.title}")
+                        logger.info("Проверяю аукцион #%s: %s", auction.id, auction.title)
                         
                         # Определяем время завершения
                         end_time = auction.ends_at
                         if not end_time:
                             # Если нет времени завершения, устанавливаем по умолчанию
-                            end_time = auction.created_at + timedelta(minutes=Config.BID_TIMEOUT_MINUTES)
+                            end_time = auction.created_at + Config.BID_TIMEOUT
                             auction.ends_at = end_time
                             await session.commit()
-                            logger.info(f"  Установлено время завершения по умолчанию: {end_time}")
+                            logger.info("  Установлено время завершения по умолчанию: %s", end_time)
                         
-                        now = datetime.utcnow()
+                        now = utcnow()
                         time_diff = (end_time - now).total_seconds()
                         
                         if time_diff > 0:
                             # Время еще не истекло - запускаем таймер
-                            logger.info(f"  Аукцион #{auction.id} активен, завершится через {time_diff:.0f} секунд")
+                            logger.info("  Аукцион #%s активен, завершится через %.0f секунд", auction.id, time_diff)
                             await self.start_auction_timer(auction.id, end_time)
                             restored_count += 1
                         else:
-                            # Время истекло - завершаем аукцион
-                            logger.warning(f"  Аукцион #{auction.id} просрочен, завершаю...")
+                            # Время истекло - завершаем аукцион тем же путем, что и таймер
+                            logger.warning("  Аукцион #%s просрочен, завершаю...", auction.id)
                             expired_count += 1
-                            
-                            # Пометим аукцион как завершенный
-                            auction.status = 'ended'
-                            auction.ended_at = now
-                            
-                            # Находим победителя
-                            stmt_winner = select(Bid).where(
-                                Bid.auction_id == auction.id
-                            ).order_by(desc(Bid.amount)).limit(1)
-                            result_winner = await session.execute(stmt_winner)
-                            winner_bid = result_winner.scalar_one_or_none()
-                            
-                            if winner_bid:
-                                auction.winner_id = winner_bid.user_id
-                                auction.current_price = winner_bid.amount
-                                logger.info(f"  Победитель: {winner_bid.user_id}, сумма: {winner_bid.amount}")
-                            
-                            await session.commit()
-                            
-                            # Обновляем сообщение в канале
-                            await self._update_expired_auction(auction)
+                            await self.end_auction(auction.id)
                             
                     except Exception as e:
-                        logger.error(f"Ошибка при обработке аукциона #{auction.id}: {e}")
+                        logger.error("Ошибка при обработке аукциона #%s: %s", auction.id, e)
                         error_count += 1
                 
-                logger.info(f"Восстановление завершено: {restored_count} таймеров запущено, {expired_count} аукционов завершено, {error_count} ошибок")
+                logger.info("Восстановление завершено: %s таймеров запущено, %s аукционов завершено, %s ошибок", restored_count, expired_count, error_count)
                 
         except Exception as e:
-            logger.error(f"Ошибка при восстановлении таймеров: {e}")
+            logger.error("Ошибка при восстановлении таймеров: %s", e)
     
-    async def _update_expired_auction(self, auction: Auction):
-        """Обновление сообщения для просроченного аукциона"""
-        try:
-            if not auction.channel_message_id:
-                logger.warning(f"Аукцион #{auction.id} не имеет сообщения в канале")
-                return
-            
-            # Получаем данные для сообщения
-            async with get_db() as session:
-                stmt_top_bids = select(Bid).where(
-                    Bid.auction_id == auction.id
-                ).order_by(desc(Bid.amount)).limit(3).options(
-                    selectinload(Bid.user)
-                )
-                result_top = await session.execute(stmt_top_bids)
-                top_bids = result_top.scalars().all()
-                
-                # Подготавливаем данные топ ставок
-                prepared_top_bids = []
-                for bid in top_bids:
-                    prepared_top_bids.append({
-                        'amount': bid.amount,
-                        'created_at': bid.created_at,
-                        'user': bid.user
-                    })
-                
-                stmt_count = select(Bid).where(Bid.auction_id == auction.id)
-                result_count = await session.execute(stmt_count)
-                bids_count = result_count.scalar()
-                
-                message_text = format_ended_auction_message(auction, prepared_top_bids, bids_count)
-            
-            # Обновляем сообщение ТОЛЬКО редактированием
-            if self.bot:
-                # Определяем тип сообщения (с фото или без)
-                has_photo = False
-                try:
-                    if auction.photos:
-                        photos_list = json.loads(auction.photos)
-                        if photos_list and photos_list[0]:
-                            has_photo = True
-                except Exception as e:
-                    logger.error(f"Ошибка при проверке фото: {e}")
-                
+    async def _run_scheduler(self):
+        """Задача-планировщик: спит до ближайшего срока и завершает аукционы"""
+        next_check = asyncio.get_running_loop().time() + EXPIRED_CHECK_INTERVAL
+        while not self._stopping:
+            try:
+                now = utcnow()
+                due = []
+                async with self.lock:
+                    while self._heap and self._heap[0][0] <= now:
+                        ends_at, auction_id = heapq.heappop(self._heap)
+                        current = self.active_timers.get(auction_id)
+                        if current == ends_at:
+                            del self.active_timers[auction_id]
+                            due.append(auction_id)
+                        elif current is not None and current > ends_at:
+                            # Срок продлен ставками: засыпаем до нового
+                            heapq.heappush(self._heap, (current, auction_id))
+                    wait_time = (self._heap[0][0] - now).total_seconds() if self._heap else None
+                    self._wakeup.clear()
+                
+                for auction_id in due:
+                    self._spawn(self._complete_auction(auction_id))
+                
+                # Страховочная проверка БД на случай пропущенных таймеров
+                loop_time = asyncio.get_running_loop().time()
+                if loop_time >= next_check:
+                    next_check = loop_time + EXPIRED_CHECK_INTERVAL
+                    self._spawn(self.check_and_complete_expired_auctions())
+                
+                check_in = next_check - loop_time
+                wait_time = check_in if wait_time is None else min(wait_time, check_in)
                 try:
-                    if has_photo:
-                        await self.bot.edit_message_caption(
-                            chat_id=Config.CHANNEL_ID,
-                            message_id=auction.channel_message_id,
-                            caption=message_text,
-                            parse_mode='HTML'
-                        )
-                    else:
-                        await self.bot.edit_message_text(
-                            chat_id=Config.CHANNEL_ID,
-                            message_id=auction.channel_message_id,
-                            text=message_text,
-                            parse_mode='HTML'
-                        )
-                    logger.info(f"Сообщение в канале для аукциона #{auction.id} обновлено")
-                except Exception as e:
-                    logger.error(f"Ошибка при обновлении сообщения в канале: {e}")
-                    
-        except Exception as e:
-            logger.error(f"Ошибка при обновлении просроченного аукциона #{auction.id}: {e}")
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=max(wait_time, 0))
+                except asyncio.TimeoutError:
+                    pass
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("Ошибка в планировщике таймеров: %s", e, exc_info=True)
+                await asyncio.sleep(1)
+    
+    def _spawn(self, coro):
+        """Запуск фоновой задачи с сохранением ссылки до ее завершения"""
+        task = asyncio.create_task(coro)
+        self._ending_tasks.add(task)
+        task.add_done_callback(self._ending_tasks.discard)
     
-    async def _auction_timer_task(self, auction_id: int, ends_at: datetime):
-        """Фоновая задача таймера"""
+    async def _complete_auction(self, auction_id: int):
+        """Завершение аукциона по сроку таймера"""
         try:
-            # Рассчитываем время ожидания
-            now = datetime.utcnow()
-            wait_time = (ends_at - now).total_seconds()
-            
-            if wait_time > 0:
-                logger.info(f"Таймер аукциона #{auction_id}: ждем {wait_time:.0f} секунд")
-                await asyncio.sleep(wait_time)
-            
-            # Завершаем аукцион
-            await self._end_auction(auction_id)
-                
-        except asyncio.CancelledError:
-            logger.info(f"Таймер для аукциона #{auction_id} отменен")
-            return
-        except Exception as e:
-            logger.error(f"Ошибка в таймере аукциона #{auction_id}: {e}", exc_info=True)
+            await self.end_auction(auction_id)
         finally:
-            async with self.lock:
-                if auction_id in self.active_timers:
-                    del self.active_timers[auction_id]
-                periodic_updater.clear_update_history(auction_id)
+            periodic_updater.clear_update_history(auction_id)
+            invalidate_active_auctions()
+    
+    async def end_auction(self, auction_id: int) -> bool:
+        """Завершить аукцион ровно один раз, даже при одновременных вызовах"""
+        if auction_id in self._ending:
+            logger.info("Аукцион #%s уже завершается", auction_id)
+            return False
+        self._ending.add(auction_id)
+        try:
+            return await self._end_auction(auction_id)
+        finally:
+            self._ending.discard(auction_id)
     
     async def _end_auction(self, auction_id: int):
         """Завершение аукциона (ИСПРАВЛЕНО: добавлена загрузка winner)"""
         try:
-            logger.info(f"Начинаю завершение аукциона #{auction_id}")
+            logger.info("Начинаю завершение аукциона #%s", auction_id)
             
             if not self.bot:
-                logger.error(f"Бот не установлен для завершения аукциона #{auction_id}")
-                return
+                logger.error("Бот не установлен для завершения аукциона #%s", auction_id)
+                return False
             
             # Используем одну сессию для всей операции
             async with get_db() as session:
@@ -250,41 +237,39 @@ class AuctionTimerManager:
                 stmt = select(Auction).where(
                     Auction.id == auction_id,
                     Auction.status == 'active'
-                ).options(selectinload(Auction.winner)).with_for_update()
+                ).with_for_update()
                 
                 result = await session.execute(stmt)
                 auction = result.scalar_one_or_none()
                 
                 if not auction:
-                    logger.info(f"Аукцион #{auction_id} уже завершен или не найден")
-                    return
+                    logger.info("Аукцион #%s уже завершен или не найден", auction_id)
+                    return False
                 
-                # Получаем победителя
-                stmt_winner = select(Bid).where(
+                # Топ-3 ставки с пользователями и общее число ставок одним
+                # запросом; победитель - первая из них
+                stmt_top_bids = select(Bid, func.count().over()).join(Bid.user).where(
                     Bid.auction_id == auction_id
-                ).order_by(desc(Bid.amount)).limit(1)
-                result_winner = await session.execute(stmt_winner)
-                winning_bid = result_winner.scalar_one_or_none()
+                ).order_by(desc(Bid.amount)).limit(3).options(
+                    contains_eager(Bid.user)
+                )
+                result_top = await session.execute(stmt_top_bids)
+                rows = result_top.all()
+                top_bids = [bid for bid, _ in rows]
+                bids_count = rows[0][1] if rows else 0
+                winning_bid = top_bids[0] if top_bids else None
                 
                 # Обновляем статус аукциона
                 auction.status = 'ended'
-                auction.ended_at = datetime.utcnow()
+                auction.ended_at = utcnow()
                 
                 if winning_bid:
-                    auction.winner_id = winning_bid.user_id
+                    # Через связь, чтобы auction.winner был заполнен для сообщения
+                    auction.winner = winning_bid.user
                     auction.current_price = winning_bid.amount
-                    logger.info(f"Аукцион #{auction_id} - победитель: {winning_bid.user_id}, сумма: {winning_bid.amount}")
+                    logger.info("Аукцион #%s - победитель: %s, сумма: %s", auction_id, winning_bid.user_id, winning_bid.amount)
                 else:
-                    logger.info(f"Аукцион #{auction_id} - победителя нет")
-                
-                # Получаем топ-3 ставки и количество ставок в той же сессии
-                stmt_top_bids = select(Bid).where(
-                    Bid.auction_id == auction_id
-                ).order_by(desc(Bid.amount)).limit(3).options(
-                    selectinload(Bid.user)
-                )
-                result_top = await session.execute(stmt_top_bids)
-                top_bids = result_top.scalars().all()
+                    logger.info("Аукцион #%s - победителя нет", auction_id)
                 
                 # Подготавливаем данные топ ставок
                 prepared_top_bids = []
@@ -295,11 +280,6 @@ class AuctionTimerManager:
                         'user': bid.user
                     })
                 
-                # Получаем количество ставок
-                stmt_count = select(Bid).where(Bid.auction_id == auction_id)
-                result_count = await session.execute(stmt_count)
-                bids_count = result_count.scalar()
-                
                 # Коммитим изменения (после коммита auction станет detached, но winner и другие поля уже загружены)
                 await session.commit()
                 
@@ -310,32 +290,34 @@ class AuctionTimerManager:
             if winning_bid and self.bot:
                 await self._notify_winner(auction_id, winning_bid.user_id)
             
-            logger.info(f"Аукцион #{auction_id} успешно завершен")
+            logger.info("Аукцион #%s успешно завершен", auction_id)
+            return True
             
         except Exception as e:
-            logger.error(f"Ошибка при завершении аукциона #{auction_id}: {e}", exc_info=True)
+            logger.error("Ошибка при завершении аукциона #%s: %s", auction_id, e, exc_info=True)
+            return False
     
-    async def _update_channel_message(self, auction: Auction, top_bids=None, bids_count=0):
-        """Обновление сообщения в канале после завершения аукциона"""
+    async def _update_channel_message(self, auction: Auction, top_bids: List[dict], bids_count: int):
+        """Обновление сообщения в канале после завершения аукциона (данные ставок готовит вызывающий)"""
         try:
-            logger.info(f"🔄 Начинаю обновление сообщения для аукциона #{auction.id}")
+            logger.info("🔄 Начинаю обновление сообщения для аукциона #%s", auction.id)
             
             if not auction.channel_message_id:
-                logger.error(f"❌ Нет channel_message_id для аукциона #{auction.id}")
+                logger.error("❌ Нет channel_message_id для аукциона #%s", auction.id)
                 return
             
             if not self.bot:
-                logger.error(f"❌ Бот не установлен для обновления сообщения #{auction.id}")
+                logger.error("❌ Бот не установлен для обновления сообщения #%s", auction.id)
                 return
             
-            logger.info(f"📝 Обновляю сообщение в канале: ID={Config.CHANNEL_ID}, message_id={auction.channel_message_id}")
+            logger.info("📝 Обновляю сообщение в канале: ID=%s, message_id=%s", Config.CHANNEL_ID, auction.channel_message_id)
             
             # Получаем данные для сообщения
             message_text = format_ended_auction_message(auction, top_bids, bids_count)
             
             # ОБРЕЗАЕМ сообщение если слишком длинное
             if len(message_text) > 1024:
-                logger.warning(f"⚠️ Сообщение слишком длинное ({len(message_text)} символов), обрезаю...")
+                logger.warning("⚠️ Сообщение слишком длинное (%s символов), обрезаю...", len(message_text))
                 import re
                 truncated = message_text[:1024]
                 open_tags = re.findall(r'<([^/][^>]*)>', truncated)
@@ -352,110 +334,57 @@ class AuctionTimerManager:
                 truncated += "..."
                 message_text = truncated
             
-            logger.info(f"✅ Сообщение подготовлено, длина: {len(message_text)} символов")
+            logger.info("✅ Сообщение подготовлено, длина: %s символов", len(message_text))
             
-            # Пытаемся определить тип сообщения (фото или текст)
-            try:
-                original_message = await self.bot.get_message(
-                    chat_id=Config.CHANNEL_ID,
-                    message_id=auction.channel_message_id
-                )
-                
-                has_photo = original_message.photo is not None
-                logger.info(f"📸 Тип сообщения: {'ФОТО' if has_photo else 'ТЕКСТ'}")
-                
-            except Exception as e:
-                logger.warning(f"⚠️ Не удалось получить сообщение: {e}, пробую угадать тип...")
-                has_photo = False
-                try:
-                    if auction.photos:
-                        photos_list = json.loads(auction.photos)
-                        has_photo = bool(photos_list and photos_list[0])
-                except:
-                    pass
-            
-            # Пытаемся обновить сообщение
+            # Пытаемся обновить сообщение (клавиатура снимается)
             max_retries = 3
             for attempt in range(max_retries):
                 try:
-                    logger.info(f"🔄 Попытка {attempt + 1} из {max_retries}")
-                    
-                    if has_photo:
-                        await self.bot.edit_message_caption(
-                            chat_id=Config.CHANNEL_ID,
-                            message_id=auction.channel_message_id,
-                            caption=message_text,
-                            parse_mode='HTML'
-                        )
-                        logger.info(f"✅ Обновлена подпись к фото для аукциона #{auction.id}")
-                    else:
-                        await self.bot.edit_message_text(
-                            chat_id=Config.CHANNEL_ID,
-                            message_id=auction.channel_message_id,
-                            text=message_text,
-                            parse_mode='HTML'
-                        )
-                        logger.info(f"✅ Обновлен текст для аукциона #{auction.id}")
-                    
+                    await edit_channel_message(self.bot, auction, message_text)
                     break
                     
+                except TelegramRetryAfter as e:
+                    # Telegram просит подождать: ждем указанное время и повторяем
+                    logger.warning("⏳ Лимит Telegram, повтор через %s с (аукцион #%s)", e.retry_after, auction.id)
+                    await asyncio.sleep(e.retry_after)
+                except TelegramBadRequest as e:
+                    # Ошибка в самом запросе (сообщение удалено и т.п.): повтор не поможет
+                    logger.error("❌ Не удалось обновить сообщение для аукциона #%s: %s", auction.id, e)
+                    return
                 except Exception as e:
-                    error_msg = str(e)
-                    logger.error(f"❌ Попытка {attempt + 1} не удалась: {error_msg}")
-                    
-                    if attempt == 0:
-                        logger.info(f"🔄 Меняю метод (было {'фото' if has_photo else 'текст'})")
-                        has_photo = not has_photo
-                    elif attempt == 1:
-                        logger.info("🔄 Пробую обновить без клавиатуры...")
-                        try:
-                            await self.bot.edit_message_text(
-                                chat_id=Config.CHANNEL_ID,
-                                message_id=auction.channel_message_id,
-                                text=message_text,
-                                parse_mode='HTML',
-                                reply_markup=None
-                            )
-                            logger.info(f"✅ Обновлено без клавиатуры")
-                            break
-                        except Exception as e2:
-                            logger.error(f"❌ Не удалось обновить без клавиатуры: {e2}")
+                    logger.error("❌ Попытка %s не удалась: %s", attempt + 1, e)
                     
                     if attempt < max_retries - 1:
                         wait_time = 2 ** (attempt + 1)
-                        logger.info(f"⏳ Жду {wait_time} секунд...")
+                        logger.info("⏳ Жду %s секунд...", wait_time)
                         await asyncio.sleep(wait_time)
             
-            logger.info(f"✅ Обновление завершено для аукциона #{auction.id}")
+            logger.info("✅ Обновление завершено для аукциона #%s", auction.id)
                 
         except Exception as e:
-            logger.error(f"❌ Критическая ошибка при обновлении сообщения: {e}")
+            logger.error("❌ Критическая ошибка при обновлении сообщения: %s", e)
     
     async def _notify_winner(self, auction_id: int, winner_user_id: int):
         """Уведомление победителя"""
         try:
             async with get_db() as session:
-                stmt = select(Auction).where(Auction.id == auction_id).options(selectinload(Auction.winner))
-                result = await session.execute(stmt)
-                auction = result.scalar_one_or_none()
+                auction = await session.get(Auction, auction_id)
                 
                 if not auction:
                     return
                 
-                stmt_user = select(User).where(User.id == winner_user_id)
-                result_user = await session.execute(stmt_user)
-                winner = result_user.scalar_one_or_none()
+                winner = await session.get(User, winner_user_id)
                 
                 if not winner:
-                    logger.error(f"Победитель с ID {winner_user_id} не найден для аукциона #{auction_id}")
+                    logger.error("Победитель с ID %s не найден для аукциона #%s", winner_user_id, auction_id)
                     return
                 
-                logger.info(f"Отправляю уведомление победителю {winner.telegram_id} для аукциона #{auction_id}")
+                logger.info("Отправляю уведомление победителю %s для аукциона #%s", winner.telegram_id, auction_id)
                 
                 await send_winner_notification(self.bot, auction, winner)
                     
         except Exception as e:
-            logger.error(f"Ошибка при уведомлении победителя: {e}", exc_info=True)
+            logger.error("Ошибка при уведомлении победителя: %s", e, exc_info=True)
     
     async def check_and_complete_expired_auctions(self):
         """Проверка и завершение просроченных аукционов"""
@@ -463,7 +392,7 @@ class AuctionTimerManager:
             logger.info("🔍 Проверка просроченных аукционов...")
             
             async with get_db() as session:
-                now = datetime.utcnow()
+                now = utcnow()
                 
                 stmt = select(Auction).where(
                     Auction.status == 'active',
@@ -473,43 +402,32 @@ class AuctionTimerManager:
                 result = await session.execute(stmt)
                 expired_auctions = result.scalars().all()
                 
-                logger.info(f"Найдено {len(expired_auctions)} просроченных аукционов")
+                logger.info("Найдено %s просроченных аукционов", len(expired_auctions))
                 
                 for auction in expired_auctions:
                     try:
-                        logger.info(f"🔄 Завершаю просроченный аукцион #{auction.id}...")
-                        await self._end_auction(auction.id)
-                        logger.info(f"✅ Аукцион #{auction.id} завершен")
+                        logger.info("🔄 Завершаю просроченный аукцион #%s...", auction.id)
+                        await self.end_auction(auction.id)
+                        logger.info("✅ Аукцион #%s завершен", auction.id)
                     except Exception as e:
-                        logger.error(f"❌ Ошибка при завершении аукциона #{auction.id}: {e}")
+                        logger.error("❌ Ошибка при завершении аукциона #%s: %s", auction.id, e)
                 
                 return len(expired_auctions)
                 
         except Exception as e:
-            logger.error(f"Ошибка при проверке просроченных аукционов: {e}")
+            logger.error("Ошибка при проверке просроченных аукционов: %s", e)
             return 0
     
     async def stop_all_timers(self):
         """Остановка всех таймеров"""
         self._stopping = True
+        if self._scheduler_task is not None:
+            self._scheduler_task.cancel()
+            self._scheduler_task = None
         async with self.lock:
-            for auction_id, task in list(self.active_timers.items()):
-                try:
-                    task.cancel()
-                except:
-                    pass
-            
             self.active_timers.clear()
+            self._heap.clear()
             periodic_updater.clear_update_history()
             logger.info("Все таймеры остановлены")
-    
-    async def periodic_check(self):
-        """Периодическая проверка просроченных аукционов (запускается как фоновая задача)"""
-        while not self._stopping:
-            try:
-                await self.check_and_complete_expired_auctions()
-            except Exception as e:
-                logger.error(f"Periodic completion check failed: {e}")
-            await asyncio.sleep(30)
 
 auction_timer_manager = AuctionTimerManager()